@@ -1,5 +1,5 @@
 import sys
-from resources import defaults, build, utilities, validation, sys_patch
+from resources import defaults, build, utilities
 from data import model_array
 
 # Generic building args
@@ -28,6 +28,8 @@ If you plan to create the USB for another machine, please select the "Change Mod
             print(f"- Install Disk set: {self.args.disk}")
             settings.disk = self.args.disk
         if self.args.validate:
+            from resources import validation
+
             validation.validate(settings)
         if self.args.verbose:
             print("- Set verbose configuration")
@@ -75,6 +77,15 @@ If you plan to create the USB for another machine, please select the "Change Mod
         if self.args.force_surplus:
             print("- Forcing SurPlus override configuration")
             settings.force_surplus = True
+        if self.args.build_cache:
+            print("- Set Build Cache configuration")
+            settings.build_cache = True
+        if self.args.profile_build:
+            print("- Set Build Profiling configuration")
+            settings.profile_build = True
+        if self.args.verify_cache:
+            print("- Set Cache Verification configuration")
+            settings.verify_cache = True
         if self.args.moderate_smbios:
             print("- Set Moderate SMBIOS Patching configuration")
             settings.serial_settings = "Moderate"
@@ -96,12 +107,28 @@ If you plan to create the USB for another machine, please select the "Change Mod
         # Avoid running the root patcher if we're just building
         if self.args.build:
             build.BuildOpenCore(settings.custom_model or settings.computer.real_model, settings).build_opencore()
+        elif self.args.plan:
+            build.BuildOpenCore(settings.custom_model or settings.computer.real_model, settings).save_plan(settings.build_plan_path)
         elif self.args.patch_sys_vol:
+            from resources import sys_patch
+
             if self.args.moj_cat_accel:
                 print("- Set Mojave/Catalina root patch configuration")
                 settings.moj_cat_accel = True
             print("- Set System Volume patching")
             sys_patch.PatchSysVolume(settings.custom_model or settings.computer.real_model, settings).start_patch()
         elif self.args.unpatch_sys_vol:
+            from resources import sys_patch
+
             print("- Set System Volume unpatching")
             sys_patch.PatchSysVolume(settings.custom_model or settings.computer.real_model, settings).start_unpatch()
+        elif self.args.simulate_patch:
+            from resources import sys_patch_simulator
+
+            print("- Set System Volume patch simulation")
+            sys_patch_simulator.simulate_patch(settings.custom_model or settings.computer.real_model, settings, self.args.simulate_patch, settings.patch_simulation_root)
+        elif self.args.create_patch_manifest:
+            from resources import ioreg_backend, sys_patch_simulator
+
+            print("- Set root volume manifest creation")
+            sys_patch_simulator.save_manifest(self.args.create_patch_manifest, "/", ioreg_backend.get_backend().kernel_release())
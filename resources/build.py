@@ -4,17 +4,19 @@ from __future__ import print_function
 
 import binascii
 import copy
+import os
 import pickle
 import plistlib
 import shutil
 import subprocess
+import time
 import uuid
-import zipfile
 import ast
 from pathlib import Path
 from datetime import date
+from concurrent.futures import ThreadPoolExecutor
 
-from resources import constants, utilities, device_probe, generate_smbios
+from resources import constants, utilities, device_probe, generate_smbios, build_cache, config_index, build_profiler
 from data import smbios_data, bluetooth_data, cpu_data, os_data, model_array
 
 
@@ -24,16 +26,39 @@ def rmtree_handler(func, path, exc_info):
     raise  # pylint: disable=misplaced-bare-raise
 
 
+# Pickled plists by path, with the size and modification time they were parsed at
+parsed_plists = {}
+
+
+def load_cached_plist(path):
+    # Payload plists are parsed once per process, later loads are served from a pickled copy
+    # Modified plists replace their entry, the cache never grows past one entry per path
+    stat = Path(path).stat()
+    cached = parsed_plists.get(str(path))
+    if cached is None or cached[:2] != (stat.st_size, stat.st_mtime_ns):
+        cached = (stat.st_size, stat.st_mtime_ns, pickle.dumps(plistlib.load(Path(path).open("rb"))))
+        parsed_plists[str(path)] = cached
+    return pickle.loads(cached[2])
+
+
 class BuildOpenCore:
     def __init__(self, model, versions):
         self.model = model
         self.config = None
+        self.config_index = None
+        self.staged_archives = {}
         self.constants: constants.Constants = versions
         self.computer = self.constants.computer
         self.gfx0_path = None
+        self.profiler = build_profiler.BuildProfiler(self.model, self.constants)
+        # Plan mode records file operations instead of performing them
+        self.plan_mode = False
+        self.planned_files = {}
+        self.planned_plists = {}
+        self.planned_moves = []
 
     def disk_type(self):
-        drive_host_info = plistlib.loads(subprocess.run(f"diskutil info -plist {self.constants.disk}".split(), stdout=subprocess.PIPE).stdout.decode().strip().encode())
+        drive_host_info = plistlib.loads(self.run_command(f"diskutil info -plist {self.constants.disk}".split(), stdout=subprocess.PIPE).stdout.decode().strip().encode())
         sd_type = drive_host_info["MediaName"]
         try:
             ssd_type = drive_host_info["SolidState"]
@@ -43,54 +68,60 @@ class BuildOpenCore:
         # Note most USB-based SD Card readers generally report as "Storage Device", and no reliable way to detect further
         if sd_type in ["SD Card Reader", "SD/MMC"]:
             print("- Adding SD Card icon")
-            shutil.copy(self.constants.icon_path_sd, self.constants.opencore_release_folder)
+            self.copy_file(self.constants.icon_path_sd, self.constants.opencore_release_folder)
         elif ssd_type is True:
             print("- Adding SSD icon")
-            shutil.copy(self.constants.icon_path_ssd, self.constants.opencore_release_folder)
+            self.copy_file(self.constants.icon_path_ssd, self.constants.opencore_release_folder)
         elif drive_host_info["BusProtocol"] == "USB":
             print("- Adding External USB Drive icon")
-            shutil.copy(self.constants.icon_path_external, self.constants.opencore_release_folder)
+            self.copy_file(self.constants.icon_path_external, self.constants.opencore_release_folder)
         else:
             print("- Adding Internal Drive icon")
-            shutil.copy(self.constants.icon_path_internal, self.constants.opencore_release_folder)
+            self.copy_file(self.constants.icon_path_internal, self.constants.opencore_release_folder)
     
     def chainload_diags(self):
-        Path(self.constants.opencore_release_folder / Path("System/Library/CoreServices/.diagnostics/Drivers/HardwareDrivers")).mkdir(parents=True, exist_ok=True)
+        if self.plan_mode is False:
+            Path(self.constants.opencore_release_folder / Path("System/Library/CoreServices/.diagnostics/Drivers/HardwareDrivers")).mkdir(parents=True, exist_ok=True)
         if self.constants.boot_efi is True:
             path_oc_loader = self.constants.opencore_release_folder / Path("EFI/BOOT/BOOTx64.efi")
         else:
             path_oc_loader = self.constants.opencore_release_folder / Path("System/Library/CoreServices/boot.efi")
-        shutil.move(path_oc_loader, self.constants.opencore_release_folder / Path("System/Library/CoreServices/.diagnostics/Drivers/HardwareDrivers/Product.efi"))
-        shutil.copy(self.constants.diags_launcher_path, self.constants.opencore_release_folder)
-        shutil.move(self.constants.opencore_release_folder / Path("diags.efi"), self.constants.opencore_release_folder / Path("boot.efi"))
+        self.move_file(path_oc_loader, self.constants.opencore_release_folder / Path("System/Library/CoreServices/.diagnostics/Drivers/HardwareDrivers/Product.efi"))
+        self.copy_file(self.constants.diags_launcher_path, self.constants.opencore_release_folder)
+        self.move_file(self.constants.opencore_release_folder / Path("diags.efi"), self.constants.opencore_release_folder / Path("boot.efi"))
 
     def build_efi(self):
-        utilities.cls()
+        if self.plan_mode is False:
+            # Plans are printed into the caller's terminal, ie. pre-flight checks and fleet diffs
+            utilities.cls()
         if not self.constants.custom_model:
             print(f"Building Configuration on model: {self.model}")
         else:
             print(f"Building Configuration for external model: {self.model}")
-        if not Path(self.constants.build_path).exists():
-            Path(self.constants.build_path).mkdir()
-            print("Created build folder")
-        else:
-            print("Build folder already present, skipping")
+        if self.plan_mode is False:
+            if not Path(self.constants.build_path).exists():
+                Path(self.constants.build_path).mkdir()
+                print("Created build folder")
+            else:
+                print("Build folder already present, skipping")
 
-        if Path(self.constants.opencore_zip_copied).exists():
-            print("Deleting old copy of OpenCore zip")
-            Path(self.constants.opencore_zip_copied).unlink()
-        if Path(self.constants.opencore_release_folder).exists():
-            print("Deleting old copy of OpenCore folder")
-            shutil.rmtree(self.constants.opencore_release_folder, onerror=rmtree_handler, ignore_errors=True)
+            if Path(self.constants.opencore_zip_copied).exists():
+                print("Deleting old copy of OpenCore zip")
+                Path(self.constants.opencore_zip_copied).unlink()
+            if Path(self.constants.opencore_release_folder).exists():
+                print("Deleting old copy of OpenCore folder")
+                shutil.rmtree(self.constants.opencore_release_folder, onerror=rmtree_handler, ignore_errors=True)
 
         print(f"\n- Adding OpenCore v{self.constants.opencore_version} {self.constants.opencore_build}")
-        shutil.copy(self.constants.opencore_zip_source, self.constants.build_path)
-        zipfile.ZipFile(self.constants.opencore_zip_copied).extractall(self.constants.build_path)
+        if self.plan_mode is False:
+            build_cache.BaseTreeCache(self.constants).clone_into(self.constants.build_path)
 
         print("- Adding config.plist for OpenCore")
         # Setup config.plist for editing
-        shutil.copy(self.constants.plist_template, self.constants.oc_folder)
-        self.config = plistlib.load(Path(self.constants.plist_path).open("rb"))
+        self.copy_file(self.constants.plist_template, self.constants.oc_folder)
+        # Copied config.plist is identical to the template, avoid parsing it again
+        self.config = load_cached_plist(self.constants.plist_template)
+        self.config_index = config_index.ConfigIndex(self.config)
 
         # Set revision in config
         self.config["#Revision"]["Build-Version"] = f"{self.constants.patcher_version} - {date.today()}"
@@ -148,22 +179,22 @@ class BuildOpenCore:
             if self.constants.serial_settings == "None":
                 # Credit to Parrotgeek1 for boot.efi and hv_vmm_present patch sets
                 # print("- Enabling Board ID exemption patch")
-                # self.get_item_by_kv(self.config["Booter"]["Patch"], "Comment", "Skip Board ID check")["Enabled"] = True
+                # self.config_index.get("Booter", "Patch", "Comment", "Skip Board ID check")["Enabled"] = True
                 
                 print("- Enabling VMM exemption patch")
-                self.get_item_by_kv(self.config["Kernel"]["Patch"], "Comment", "Reroute kern.hv_vmm_present patch (1)")["Enabled"] = True
-                self.get_item_by_kv(self.config["Kernel"]["Patch"], "Comment", "Reroute kern.hv_vmm_present patch (2)")["Enabled"] = True
+                self.config_index.get("Kernel", "Patch", "Comment", "Reroute kern.hv_vmm_present patch (1)")["Enabled"] = True
+                self.config_index.get("Kernel", "Patch", "Comment", "Reroute kern.hv_vmm_present patch (2)")["Enabled"] = True
 
                 # Patch HW_BID to OC_BID
                 # Set OC_BID to MacPro6,1 Board ID (Mac-F60DEB81FF30ACF6)
                 # Goal is to only allow OS booting through OCLP, otherwise failing
                 print("- Enabling HW_BID reroute")
-                self.get_item_by_kv(self.config["Booter"]["Patch"], "Comment", "Reroute HW_BID to OC_BID")["Enabled"] = True
+                self.config_index.get("Booter", "Patch", "Comment", "Reroute HW_BID to OC_BID")["Enabled"] = True
                 self.config["NVRAM"]["Add"]["4D1EDE05-38C7-4A6A-9CC6-4BCCA8B38C14"]["OC_BID"] = "Mac-F60DEB81FF30ACF6"
                 self.config["NVRAM"]["Delete"]["4D1EDE05-38C7-4A6A-9CC6-4BCCA8B38C14"] += ["OC_BID"]
             else:
                 print("- Enabling SMC exemption patch")
-                self.get_item_by_kv(self.config["Kernel"]["Patch"], "Identifier", "com.apple.driver.AppleSMC")["Enabled"] = True
+                self.config_index.get("Kernel", "Patch", "Identifier", "com.apple.driver.AppleSMC")["Enabled"] = True
 
         if self.get_kext_by_bundle_path("Lilu.kext")["Enabled"] is True:
             # Required for Lilu in 11.0+
@@ -195,14 +226,14 @@ class BuildOpenCore:
             # Ref: https://github.com/reenigneorcim/SurPlus
             # Enable for all systems missing RDRAND support
             print("- Adding SurPlus Patch for Race Condition")
-            self.get_item_by_kv(self.config["Kernel"]["Patch"], "Comment", "SurPlus v1 - PART 1 of 2 - Patch read_erandom (inlined in _early_random)")["Enabled"] = True
-            self.get_item_by_kv(self.config["Kernel"]["Patch"], "Comment", "SurPlus v1 - PART 2 of 2 - Patch register_and_init_prng")["Enabled"] = True
+            self.config_index.get("Kernel", "Patch", "Comment", "SurPlus v1 - PART 1 of 2 - Patch read_erandom (inlined in _early_random)")["Enabled"] = True
+            self.config_index.get("Kernel", "Patch", "Comment", "SurPlus v1 - PART 2 of 2 - Patch register_and_init_prng")["Enabled"] = True
             if self.constants.force_surplus is True:
                 # Syncretic forces SurPlus to only run on Beta 7 and older by default for saftey reasons
                 # If users desires, allow forcing in newer OSes
                 print("- Allowing SurPlus on all newer OSes")
-                self.get_item_by_kv(self.config["Kernel"]["Patch"], "Comment", "SurPlus v1 - PART 1 of 2 - Patch read_erandom (inlined in _early_random)")["MaxKernel"] = ""
-                self.get_item_by_kv(self.config["Kernel"]["Patch"], "Comment", "SurPlus v1 - PART 2 of 2 - Patch register_and_init_prng")["MaxKernel"] = ""
+                self.config_index.get("Kernel", "Patch", "Comment", "SurPlus v1 - PART 1 of 2 - Patch read_erandom (inlined in _early_random)")["MaxKernel"] = ""
+                self.config_index.get("Kernel", "Patch", "Comment", "SurPlus v1 - PART 2 of 2 - Patch register_and_init_prng")["MaxKernel"] = ""
 
         if not self.constants.custom_model and (self.constants.allow_oc_everywhere is True or self.model in model_array.MacPro):
             # Use Innie's same logic:
@@ -348,15 +379,15 @@ class BuildOpenCore:
         # CPUFriend
         if self.model not in ["iMac7,1", "Xserve2,1", "Dortania1,1"] and self.constants.allow_oc_everywhere is False and self.constants.serial_settings != "None":
             pp_map_path = Path(self.constants.platform_plugin_plist_path) / Path(f"{self.model}/Info.plist")
-            Path(self.constants.pp_kext_folder).mkdir()
-            Path(self.constants.pp_contents_folder).mkdir()
-            shutil.copy(pp_map_path, self.constants.pp_contents_folder)
+            self.make_directory(self.constants.pp_kext_folder)
+            self.make_directory(self.constants.pp_contents_folder)
+            self.copy_file(pp_map_path, self.constants.pp_contents_folder)
             self.get_kext_by_bundle_path("CPUFriendDataProvider.kext")["Enabled"] = True
 
         # HID patches
         if smbios_data.smbios_dictionary[self.model]["CPU Generation"] <= cpu_data.cpu_data.penryn.value:
             print("- Adding IOHIDFamily patch")
-            self.get_item_by_kv(self.config["Kernel"]["Patch"], "Identifier", "com.apple.iokit.IOHIDFamily")["Enabled"] = True
+            self.config_index.get("Kernel", "Patch", "Identifier", "com.apple.iokit.IOHIDFamily")["Enabled"] = True
         
         # Legacy iSight patches
         try:
@@ -369,16 +400,16 @@ class BuildOpenCore:
         if smbios_data.smbios_dictionary[self.model]["CPU Generation"] == cpu_data.cpu_data.nehalem.value and not (self.model.startswith("MacPro") or self.model.startswith("Xserve")):
             # Applicable for consumer Nehalem
             print("- Adding SSDT-CPBG.aml")
-            self.get_item_by_kv(self.config["ACPI"]["Add"], "Path", "SSDT-CPBG.aml")["Enabled"] = True
-            shutil.copy(self.constants.pci_ssdt_path, self.constants.acpi_path)
+            self.config_index.get("ACPI", "Add", "Path", "SSDT-CPBG.aml")["Enabled"] = True
+            self.copy_file(self.constants.pci_ssdt_path, self.constants.acpi_path)
 
         if cpu_data.cpu_data.sandy_bridge <= smbios_data.smbios_dictionary[self.model]["CPU Generation"] <= cpu_data.cpu_data.ivy_bridge.value:
             # Based on: https://egpu.io/forums/pc-setup/fix-dsdt-override-to-correct-error-12/
             # Applicable for Sandy and Ivy Bridge Macs
             print("- Enabling Windows 10 UEFI Audio support")
-            self.get_item_by_kv(self.config["ACPI"]["Add"], "Path", "SSDT-PCI.aml")["Enabled"] = True
-            self.get_item_by_kv(self.config["ACPI"]["Patch"], "Comment", "BUF0 to BUF1")["Enabled"] = True
-            shutil.copy(self.constants.windows_ssdt_path, self.constants.acpi_path)
+            self.config_index.get("ACPI", "Add", "Path", "SSDT-PCI.aml")["Enabled"] = True
+            self.config_index.get("ACPI", "Patch", "Comment", "BUF0 to BUF1")["Enabled"] = True
+            self.copy_file(self.constants.windows_ssdt_path, self.constants.acpi_path)
 
         # USB Map
         usb_map_path = Path(self.constants.plist_folder_path) / Path("AppleUSBMaps/Info.plist")
@@ -389,9 +420,9 @@ class BuildOpenCore:
             and (self.model in model_array.Missing_USB_Map or self.constants.serial_settings in ["Moderate", "Advanced"])
         ):
             print("- Adding USB-Map.kext")
-            Path(self.constants.map_kext_folder).mkdir()
-            Path(self.constants.map_contents_folder).mkdir()
-            shutil.copy(usb_map_path, self.constants.map_contents_folder)
+            self.make_directory(self.constants.map_kext_folder)
+            self.make_directory(self.constants.map_contents_folder)
+            self.copy_file(usb_map_path, self.constants.map_contents_folder)
             self.get_kext_by_bundle_path("USB-Map.kext")["Enabled"] = True
 
         if self.constants.allow_oc_everywhere is False:
@@ -400,25 +431,25 @@ class BuildOpenCore:
                     print("- Adding AppleMuxControl Override")
                     amc_map_path = Path(self.constants.plist_folder_path) / Path("AppleMuxControl/Info.plist")
                     self.config["DeviceProperties"]["Add"]["PciRoot(0x0)/Pci(0x1,0x0)/Pci(0x0,0x0)"] = {"agdpmod": "vit9696"}
-                    Path(self.constants.amc_kext_folder).mkdir()
-                    Path(self.constants.amc_contents_folder).mkdir()
-                    shutil.copy(amc_map_path, self.constants.amc_contents_folder)
+                    self.make_directory(self.constants.amc_kext_folder)
+                    self.make_directory(self.constants.amc_contents_folder)
+                    self.copy_file(amc_map_path, self.constants.amc_contents_folder)
                     self.get_kext_by_bundle_path("AMC-Override.kext")["Enabled"] = True
 
                 if self.model not in model_array.NoAGPMSupport:
                     print("- Adding AppleGraphicsPowerManagement Override")
                     agpm_map_path = Path(self.constants.plist_folder_path) / Path("AppleGraphicsPowerManagement/Info.plist")
-                    Path(self.constants.agpm_kext_folder).mkdir()
-                    Path(self.constants.agpm_contents_folder).mkdir()
-                    shutil.copy(agpm_map_path, self.constants.agpm_contents_folder)
+                    self.make_directory(self.constants.agpm_kext_folder)
+                    self.make_directory(self.constants.agpm_contents_folder)
+                    self.copy_file(agpm_map_path, self.constants.agpm_contents_folder)
                     self.get_kext_by_bundle_path("AGPM-Override.kext")["Enabled"] = True
 
                 if self.model in model_array.AGDPSupport:
                     print("- Adding AppleGraphicsDevicePolicy Override")
                     agdp_map_path = Path(self.constants.plist_folder_path) / Path("AppleGraphicsDevicePolicy/Info.plist")
-                    Path(self.constants.agdp_kext_folder).mkdir()
-                    Path(self.constants.agdp_contents_folder).mkdir()
-                    shutil.copy(agdp_map_path, self.constants.agdp_contents_folder)
+                    self.make_directory(self.constants.agdp_kext_folder)
+                    self.make_directory(self.constants.agdp_contents_folder)
+                    self.copy_file(agdp_map_path, self.constants.agdp_contents_folder)
                     self.get_kext_by_bundle_path("AGDP-Override.kext")["Enabled"] = True
         
         if self.constants.serial_settings != "None":
@@ -541,7 +572,7 @@ class BuildOpenCore:
                     "IOName": "#display",
                     "class-code": binascii.unhexlify("FFFFFFFF"),
                 }
-            shutil.copy(self.constants.backlight_injector_path, self.constants.kexts_path)
+            self.stage_archive(self.constants.backlight_injector_path, self.constants.kexts_path, ".kext")
             self.get_kext_by_bundle_path("BacklightInjector.kext")["Enabled"] = True
             self.config["UEFI"]["Quirks"]["ForgeUefiSupport"] = True
             self.config["UEFI"]["Quirks"]["ReloadOptionRoms"] = True
@@ -677,9 +708,9 @@ class BuildOpenCore:
         if self.constants.software_demux is True and self.model in ["MacBookPro8,2", "MacBookPro8,3"]:
             print("- Enabling software demux")
             # Add ACPI patches
-            self.get_item_by_kv(self.config["ACPI"]["Add"], "Path", "SSDT-DGPU.aml")["Enabled"] = True
-            self.get_item_by_kv(self.config["ACPI"]["Patch"], "Comment", "_INI to XINI")["Enabled"] = True
-            shutil.copy(self.constants.demux_ssdt_path, self.constants.acpi_path)
+            self.config_index.get("ACPI", "Add", "Path", "SSDT-DGPU.aml")["Enabled"] = True
+            self.config_index.get("ACPI", "Patch", "Comment", "_INI to XINI")["Enabled"] = True
+            self.copy_file(self.constants.demux_ssdt_path, self.constants.acpi_path)
             # Disable dGPU
             # IOACPIPlane:/_SB/PCI0@0/P0P2@10000/GFX0@0
             self.config["DeviceProperties"]["Add"]["PciRoot(0x0)/Pci(0x1,0x0)/Pci(0x0,0x0)"] = {"class-code": binascii.unhexlify("FFFFFFFF"), "device-id": binascii.unhexlify("FFFF0000"), "IOName": "Dortania Disabled Card", "name": "Dortania Disabled Card"}
@@ -712,13 +743,14 @@ class BuildOpenCore:
 
         if self.constants.nvme_boot is True:
             print("- Enabling NVMe boot support")
-            shutil.copy(self.constants.nvme_driver_path, self.constants.drivers_path)
+            self.copy_file(self.constants.nvme_driver_path, self.constants.drivers_path)
             self.get_efi_binary_by_path("NvmExpressDxe.efi", "UEFI", "Drivers")["Enabled"] = True
 
         # Add OpenCanopy
         print("- Adding OpenCanopy GUI")
-        shutil.rmtree(self.constants.resources_path, onerror=rmtree_handler)
-        shutil.copy(self.constants.gui_path, self.constants.oc_folder)
+        if self.plan_mode is False:
+            shutil.rmtree(self.constants.resources_path, onerror=rmtree_handler)
+        self.stage_archive(self.constants.gui_path, self.constants.oc_folder)
         self.get_efi_binary_by_path("OpenCanopy.efi", "UEFI", "Drivers")["Enabled"] = True
         self.get_efi_binary_by_path("OpenRuntime.efi", "UEFI", "Drivers")["Enabled"] = True
         self.get_efi_binary_by_path("OpenLinuxBoot.efi", "UEFI", "Drivers")["Enabled"] = True
@@ -726,7 +758,7 @@ class BuildOpenCore:
         if smbios_data.smbios_dictionary[self.model]["CPU Generation"] < cpu_data.cpu_data.sandy_bridge.value:
             # Sandy Bridge and newer Macs natively support ExFat
             print("- Adding ExFatDxeLegacy.efi")
-            shutil.copy(self.constants.exfat_legacy_driver_path, self.constants.drivers_path)
+            self.copy_file(self.constants.exfat_legacy_driver_path, self.constants.drivers_path)
             self.get_efi_binary_by_path("ExFatDxeLegacy.efi", "UEFI", "Drivers")["Enabled"] = True
 
         # Add UGA to GOP layer
@@ -823,7 +855,7 @@ class BuildOpenCore:
         #     self.config["NVRAM"]["Add"]["7C436110-AB2A-4BBB-A880-FE41995C9F82"]["boot-args"] += " amfi_get_out_of_my_way=1"
         if self.constants.disable_cs_lv is True:
             print("- Disabling Library Validation")
-            self.get_item_by_kv(self.config["Kernel"]["Patch"], "Comment", "Disable Library Validation Enforcement")["Enabled"] = True
+            self.config_index.get("Kernel", "Patch", "Comment", "Disable Library Validation Enforcement")["Enabled"] = True
             self.config["NVRAM"]["Add"]["4D1FDA02-38C7-4A6A-9CC6-4BCCA8B30102"]["OCLP-Settings"] += " -allow_amfi"
             # CSLVFixup simply patches out __RESTRICT and __restrict out of the Music.app Binary
             # Ref: https://pewpewthespells.com/blog/blocking_code_injection_on_ios_and_os_x.html
@@ -833,13 +865,13 @@ class BuildOpenCore:
             self.config["Misc"]["Security"]["SecureBootModel"] = "Disabled"
             if self.constants.force_vmm is True:
                 print("- Forcing VMM patchset to support OTA updates")
-                self.get_item_by_kv(self.config["Kernel"]["Patch"], "Comment", "Reroute kern.hv_vmm_present patch (1)")["Enabled"] = True
-                self.get_item_by_kv(self.config["Kernel"]["Patch"], "Comment", "Reroute kern.hv_vmm_present patch (2)")["Enabled"] = True
+                self.config_index.get("Kernel", "Patch", "Comment", "Reroute kern.hv_vmm_present patch (1)")["Enabled"] = True
+                self.config_index.get("Kernel", "Patch", "Comment", "Reroute kern.hv_vmm_present patch (2)")["Enabled"] = True
         if self.constants.serial_settings in ["Moderate", "Advanced"]:
             print("- Enabling USB Rename Patches")
-            self.get_item_by_kv(self.config["ACPI"]["Patch"], "Comment", "XHC1 to SHC1")["Enabled"] = True
-            self.get_item_by_kv(self.config["ACPI"]["Patch"], "Comment", "EHC1 to EH01")["Enabled"] = True
-            self.get_item_by_kv(self.config["ACPI"]["Patch"], "Comment", "EHC2 to EH02")["Enabled"] = True
+            self.config_index.get("ACPI", "Patch", "Comment", "XHC1 to SHC1")["Enabled"] = True
+            self.config_index.get("ACPI", "Patch", "Comment", "EHC1 to EH01")["Enabled"] = True
+            self.config_index.get("ACPI", "Patch", "Comment", "EHC2 to EH02")["Enabled"] = True
         if self.constants.custom_cpu_model == 0 or self.constants.custom_cpu_model == 1:
             self.config["NVRAM"]["Add"]["4D1FDA02-38C7-4A6A-9CC6-4BCCA8B30102"]["revcpu"] = self.constants.custom_cpu_model
             if self.constants.custom_cpu_model_value != "":
@@ -852,8 +884,10 @@ class BuildOpenCore:
         if self.model == self.constants.override_smbios:
             print("- Adding -no_compat_check")
             self.config["NVRAM"]["Add"]["7C436110-AB2A-4BBB-A880-FE41995C9F82"]["boot-args"] += " -no_compat_check"
-        if self.constants.disk != "":
-            self.disk_type()
+        if self.constants.disk != "" and self.plan_mode is False:
+            # Volume icon is only known once diskutil inspects the target disk
+            with self.profiler.phase("disk_type"):
+                self.disk_type()
         if self.constants.validate is False:
             print("- Adding bootmgfw.efi BlessOverride")
             self.config["Misc"]["BlessOverride"] += ["\\EFI\\Microsoft\\Boot\\bootmgfw.efi"]
@@ -880,7 +914,7 @@ class BuildOpenCore:
             # This is however hidden behind kern.development, thus we patch _apfs_filevault_allowed to always return true
             # Note this function was added in 11.3 (20E232, 20.4), older builds do not support this (ie. 11.2.3)
             print("- Allowing FileVault on Root Patched systems")
-            self.get_item_by_kv(self.config["Kernel"]["Patch"], "Identifier", "com.apple.filesystems.apfs")["Enabled"] = True
+            self.config_index.get("Kernel", "Patch", "Identifier", "com.apple.filesystems.apfs")["Enabled"] = True
             # Lets us check in sys_patch.py if config supports FileVault
             self.config["NVRAM"]["Add"]["4D1FDA02-38C7-4A6A-9CC6-4BCCA8B30102"]["OCLP-Settings"] += " -allow_fv"
         if self.constants.disable_msr_power_ctl is True and self.model.startswith("MacBook"):
@@ -894,7 +928,7 @@ class BuildOpenCore:
         if self.constants.nvram_write is False:
             print("- Disabling Hardware NVRAM Write")
             self.config["NVRAM"]["WriteFlash"] = False
-        if self.get_item_by_kv(self.config["Kernel"]["Patch"], "Comment", "Reroute kern.hv_vmm_present patch (1)")["Enabled"] is True:
+        if self.config_index.get("Kernel", "Patch", "Comment", "Reroute kern.hv_vmm_present patch (1)")["Enabled"] is True:
             # Add Content Caching patch
             print("- Fixing Content Caching support")
             if self.get_kext_by_bundle_path("RestrictEvents.kext")["Enabled"] is False:
@@ -979,8 +1013,13 @@ class BuildOpenCore:
         def advanced_serial_patch(self):
             if self.constants.custom_cpu_model == 0 or self.constants.custom_cpu_model == 1:
                 self.config["PlatformInfo"]["Generic"]["ProcessorType"] = 1537
-            macserial_output = subprocess.run([self.constants.macserial_path] + f"-g -m {self.spoofed_model} -n 1".split(), stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-            macserial_output = macserial_output.stdout.decode().strip().split(" | ")
+            if self.plan_mode is True:
+                # Serials are unique per build, plans only need placeholders
+                macserial_output = ["PLACEHOLDER-SERIAL", "PLACEHOLDER-MLB"]
+            else:
+                with self.profiler.phase("macserial"):
+                    macserial_output = self.run_command([self.constants.macserial_path] + f"-g -m {self.spoofed_model} -n 1".split(), stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+                macserial_output = macserial_output.stdout.decode().strip().split(" | ")
             self.config["NVRAM"]["Add"]["7C436110-AB2A-4BBB-A880-FE41995C9F82"]["run-efi-updater"] = "No"
             self.config["PlatformInfo"]["Automatic"] = True
             self.config["PlatformInfo"]["UpdateDataHub"] = True
@@ -1024,7 +1063,7 @@ class BuildOpenCore:
             and (self.model in model_array.Missing_USB_Map or self.constants.serial_settings in ["Moderate", "Advanced"])
         ):
             new_map_ls = Path(self.constants.map_contents_folder) / Path("Info.plist")
-            map_config = plistlib.load(Path(new_map_ls).open("rb"))
+            map_config = self.load_plist(new_map_ls)
             # Strip unused USB maps
             for entry in list(map_config["IOKitPersonalities_x86_64"]):
                 if not entry.startswith(self.model):
@@ -1041,29 +1080,29 @@ class BuildOpenCore:
                                 map_config["IOKitPersonalities_x86_64"][entry]["IONameMatch"] = "XHC1"
                     except KeyError:
                         continue
-            plistlib.dump(map_config, Path(new_map_ls).open("wb"), sort_keys=True)
+            self.dump_plist(map_config, Path(new_map_ls))
         if self.constants.allow_oc_everywhere is False and self.model not in ["iMac7,1", "Xserve2,1", "Dortania1,1"] and self.constants.disallow_cpufriend is False and self.constants.serial_settings != "None":
             # Adjust CPU Friend Data to correct SMBIOS
             new_cpu_ls = Path(self.constants.pp_contents_folder) / Path("Info.plist")
-            cpu_config = plistlib.load(Path(new_cpu_ls).open("rb"))
+            cpu_config = self.load_plist(new_cpu_ls)
             string_stuff = str(cpu_config["IOKitPersonalities"]["CPUFriendDataProvider"]["cf-frequency-data"])
             string_stuff = string_stuff.replace(self.model, self.spoofed_model)
             string_stuff = ast.literal_eval(string_stuff)
             cpu_config["IOKitPersonalities"]["CPUFriendDataProvider"]["cf-frequency-data"] = string_stuff
-            plistlib.dump(cpu_config, Path(new_cpu_ls).open("wb"), sort_keys=True)
+            self.dump_plist(cpu_config, Path(new_cpu_ls))
 
         if self.constants.allow_oc_everywhere is False and self.constants.serial_settings != "None":
             if self.model == "MacBookPro9,1":
                 new_amc_ls = Path(self.constants.amc_contents_folder) / Path("Info.plist")
-                amc_config = plistlib.load(Path(new_amc_ls).open("rb"))
+                amc_config = self.load_plist(new_amc_ls)
                 amc_config["IOKitPersonalities"]["AppleMuxControl"]["ConfigMap"][self.spoofed_board] = amc_config["IOKitPersonalities"]["AppleMuxControl"]["ConfigMap"].pop(self.model)
                 for entry in list(amc_config["IOKitPersonalities"]["AppleMuxControl"]["ConfigMap"]):
                     if not entry.startswith(self.spoofed_board):
                         amc_config["IOKitPersonalities"]["AppleMuxControl"]["ConfigMap"].pop(entry)
-                plistlib.dump(amc_config, Path(new_amc_ls).open("wb"), sort_keys=True)
+                self.dump_plist(amc_config, Path(new_amc_ls))
             if self.model not in model_array.NoAGPMSupport:
                 new_agpm_ls = Path(self.constants.agpm_contents_folder) / Path("Info.plist")
-                agpm_config = plistlib.load(Path(new_agpm_ls).open("rb"))
+                agpm_config = self.load_plist(new_agpm_ls)
                 agpm_config["IOKitPersonalities"]["AGPM"]["Machines"][self.spoofed_board] = agpm_config["IOKitPersonalities"]["AGPM"]["Machines"].pop(self.model)
                 if self.model == "MacBookPro6,2":
                     # Force G State to not exceed moderate state
@@ -1077,36 +1116,27 @@ class BuildOpenCore:
                     if not entry.startswith(self.spoofed_board):
                         agpm_config["IOKitPersonalities"]["AGPM"]["Machines"].pop(entry)
 
-                plistlib.dump(agpm_config, Path(new_agpm_ls).open("wb"), sort_keys=True)
+                self.dump_plist(agpm_config, Path(new_agpm_ls))
             if self.model in model_array.AGDPSupport:
                 new_agdp_ls = Path(self.constants.agdp_contents_folder) / Path("Info.plist")
-                agdp_config = plistlib.load(Path(new_agdp_ls).open("rb"))
+                agdp_config = self.load_plist(new_agdp_ls)
                 agdp_config["IOKitPersonalities"]["AppleGraphicsDevicePolicy"]["ConfigMap"][self.spoofed_board] = agdp_config["IOKitPersonalities"]["AppleGraphicsDevicePolicy"]["ConfigMap"].pop(
                     self.model
                 )
                 for entry in list(agdp_config["IOKitPersonalities"]["AppleGraphicsDevicePolicy"]["ConfigMap"]):
                     if not entry.startswith(self.spoofed_board):
                         agdp_config["IOKitPersonalities"]["AppleGraphicsDevicePolicy"]["ConfigMap"].pop(entry)
-                plistlib.dump(agdp_config, Path(new_agdp_ls).open("wb"), sort_keys=True)
-
-    @staticmethod
-    def get_item_by_kv(iterable, key, value):
-        item = None
-        for i in iterable:
-            if i[key] == value:
-                item = i
-                break
-        return item
+                self.dump_plist(agdp_config, Path(new_agdp_ls))
 
     def get_kext_by_bundle_path(self, bundle_path):
-        kext = self.get_item_by_kv(self.config["Kernel"]["Add"], "BundlePath", bundle_path)
+        kext = self.config_index.get("Kernel", "Add", "BundlePath", bundle_path)
         if not kext:
             print(f"- Could not find kext {bundle_path}!")
             raise IndexError
         return kext
 
     def get_efi_binary_by_path(self, bundle_path, entry_location, efi_type):
-        efi_binary = self.get_item_by_kv(self.config[entry_location][efi_type], "Path", bundle_path)
+        efi_binary = self.config_index.get(entry_location, efi_type, "Path", bundle_path)
         if not efi_binary:
             print(f"- Could not find {efi_type}: {bundle_path}!")
             raise IndexError
@@ -1120,71 +1150,169 @@ class BuildOpenCore:
             return
 
         print(f"- Adding {kext_name} {kext_version}")
-        shutil.copy(kext_path, self.constants.kexts_path)
+        self.stage_archive(kext_path, self.constants.kexts_path, ".kext")
         kext["Enabled"] = True
 
+    def stage_archive(self, archive_path, destination, top_level_suffix=None):
+        # Archives are extracted straight from payloads during cleanup
+        self.staged_archives[Path(archive_path)] = (destination, top_level_suffix)
+
     def cleanup(self):
         print("- Cleaning up files")
         # Remove unused entries
-        # TODO: Consolidate into a single for loop
-        for entry in list(self.config["ACPI"]["Add"]):
-            if not entry["Enabled"]:
-                self.config["ACPI"]["Add"].remove(entry)
-        for entry in list(self.config["ACPI"]["Patch"]):
-            if not entry["Enabled"]:
-                self.config["ACPI"]["Patch"].remove(entry)
-        for entry in list(self.config["Booter"]["Patch"]):
-            if not entry["Enabled"]:
-                self.config["Booter"]["Patch"].remove(entry)
-        for entry in list(self.config["Kernel"]["Add"]):
-            if not entry["Enabled"]:
-                self.config["Kernel"]["Add"].remove(entry)
-        for entry in list(self.config["Kernel"]["Patch"]):
-            if not entry["Enabled"]:
-                self.config["Kernel"]["Patch"].remove(entry)
-        for entry in list(self.config["Misc"]["Tools"]):
-            if not entry["Enabled"]:
-                self.config["Misc"]["Tools"].remove(entry)
-        for entry in list(self.config["UEFI"]["Drivers"]):
-            if not entry["Enabled"]:
-                self.config["UEFI"]["Drivers"].remove(entry)
-
-        plistlib.dump(self.config, Path(self.constants.plist_path).open("wb"), sort_keys=True)
-        for kext in self.constants.kexts_path.rglob("*.zip"):
-            with zipfile.ZipFile(kext) as zip_file:
-                zip_file.extractall(self.constants.kexts_path)
-            kext.unlink()
-
-        for item in self.constants.oc_folder.rglob("*.zip"):
-            with zipfile.ZipFile(item) as zip_file:
-                zip_file.extractall(self.constants.oc_folder)
-            item.unlink()
-
-        if not self.constants.recovery_status:
-            # Crashes in RecoveryOS for unknown reason
-            for i in self.constants.build_path.rglob("__MACOSX"):
-                shutil.rmtree(i)
-
-        Path(self.constants.opencore_zip_copied).unlink()
+        self.config_index.prune()
+
+        self.dump_plist(self.config, Path(self.constants.plist_path))
+        if self.plan_mode is False:
+            self.extract_staged_archives()
+
+    def extract_staged_archives(self):
+        # Concurrent extractions into the same path would race, with the last writer silently winning
+        extracted_by = {}
+        for archive_path, (destination, top_level_suffix) in self.staged_archives.items():
+            for top_level in utilities.archive_top_levels(archive_path, top_level_suffix):
+                path = Path(destination) / Path(top_level)
+                if path in extracted_by:
+                    raise Exception(f"{extracted_by[path].name} and {archive_path.name} both extract to {path}")
+                extracted_by[path] = archive_path
+
+        # zlib releases the GIL while inflating, allowing archives to be extracted concurrently
+        with ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1)) as executor:
+            extractions = [
+                (archive_path, executor.submit(self.extract_archive, archive_path, destination, top_level_suffix))
+                for archive_path, (destination, top_level_suffix) in self.staged_archives.items()
+            ]
+        # Report failures in staging order regardless of completion order
+        failed = [(archive_path, extraction.exception()) for archive_path, extraction in extractions if extraction.exception()]
+        if failed:
+            for archive_path, error in failed:
+                print(f"- Failed to extract {archive_path.name}: {error}")
+            raise Exception(f"Failed to extract {len(failed)} archive(s): {', '.join(archive_path.name for archive_path, _ in failed)}")
+
+    def extract_archive(self, archive_path, destination, top_level_suffix=None):
+        start = time.perf_counter()
+        bytes_read, bytes_written = utilities.extract_archive(archive_path, destination, top_level_suffix)
+        if top_level_suffix == ".kext":
+            self.profiler.record_kext(archive_path.name, time.perf_counter() - start, bytes_read, bytes_written)
+        else:
+            self.profiler.record_io(bytes_read, bytes_written)
+
+    def copy_file(self, source, destination):
+        if self.plan_mode is True:
+            # All build copies target folders
+            self.planned_files[Path(destination) / Path(source).name] = Path(source)
+            return
+        self.profiler.record_io(Path(source).stat().st_size, Path(source).stat().st_size)
+        shutil.copy(source, destination)
+
+    def move_file(self, source, destination):
+        if self.plan_mode is True:
+            if Path(source) in self.planned_files:
+                self.planned_files[Path(destination)] = self.planned_files.pop(Path(source))
+            self.planned_moves.append((Path(source), Path(destination)))
+            return
+        shutil.move(source, destination)
+
+    def make_directory(self, path):
+        if self.plan_mode is True:
+            return
+        Path(path).mkdir()
+
+    def load_plist(self, path):
+        if self.plan_mode is True:
+            if Path(path) in self.planned_plists:
+                return self.planned_plists[Path(path)]
+            return load_cached_plist(self.planned_files[Path(path)])
+        return plistlib.load(Path(path).open("rb"))
+
+    def dump_plist(self, data, path):
+        if self.plan_mode is True:
+            self.planned_plists[Path(path)] = data
+            return
+        with self.profiler.phase("plist_dump"):
+            plist_data = plistlib.dumps(data, sort_keys=True)
+            Path(path).write_bytes(plist_data)
+            self.profiler.record_io(0, len(plist_data))
+
+    def run_command(self, *args, **kwargs):
+        self.profiler.record_subprocess()
+        return subprocess.run(*args, **kwargs)
 
     def sign_files(self):
-        if self.constants.vault is True:
+        if self.constants.vault is True and self.plan_mode is False:
             if utilities.check_command_line_tools() is True:
                 # sign.command checks for the existance of '/usr/bin/strings' however does not verify whether it's executable
                 # sign.command will continue to run and create an unbootable OpenCore.efi due to the missing strings binary
                 # macOS has dummy binaries that just reroute to the actual binaries after you install Xcode's Command Line Tools
                 print("- Vaulting EFI")
-                subprocess.run([str(self.constants.vault_path), f"{self.constants.oc_folder}/"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+                self.run_command([str(self.constants.vault_path), f"{self.constants.oc_folder}/"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
             else:
                 print("- Missing Command Line tools, skipping Vault for saftey reasons")
                 print("- Install via 'xcode-select --install' and rerun OCLP if you wish to vault this config")
 
-    def build_opencore(self):
+    def plan_opencore(self):
+        # Computes the final config and every file the build would stage, without touching the build folder
+        self.plan_mode = True
         self.build_efi()
         if self.constants.allow_oc_everywhere is False or self.constants.allow_native_spoofs is True:
             self.set_smbios()
         self.cleanup()
-        self.sign_files()
+        return {
+            "config": self.config,
+            "archives": [(Path(self.constants.opencore_zip_source), Path(self.constants.build_path), None)] + [
+                (archive_path, Path(destination), top_level_suffix) for archive_path, (destination, top_level_suffix) in self.staged_archives.items()
+            ],
+            "files": self.planned_files,
+            "plists": self.planned_plists,
+            "moves": self.planned_moves,
+        }
+
+    def save_plan(self, plan_path):
+        # Paths are stored relative to payloads and the build folder, plans from other machines and patcher versions can be diffed
+        plan = self.plan_opencore()
+
+        def relative_path(path):
+            for root in [self.constants.payload_path, self.constants.build_path]:
+                try:
+                    return str(Path(path).relative_to(root))
+                except ValueError:
+                    continue
+            return str(path)
+
+        report = {
+            "Config": plan["config"],
+            "Archives": [
+                {"Archive": relative_path(archive_path), "Destination": relative_path(destination), "Top Level Suffix": top_level_suffix or ""}
+                for archive_path, destination, top_level_suffix in plan["archives"]
+            ],
+            "Files": {relative_path(destination): relative_path(source) for destination, source in plan["files"].items()},
+            "Plists": {relative_path(path): data for path, data in plan["plists"].items() if Path(path) != Path(self.constants.plist_path)},
+            "Moves": [[relative_path(source), relative_path(destination)] for source, destination in plan["moves"]],
+        }
+        Path(plan_path).write_bytes(plistlib.dumps(report, sort_keys=True))
+        print(f"- Build plan saved to {plan_path}")
+
+    def build_opencore(self):
+        with self.profiler.phase("build_opencore"):
+            cache = None
+            if self.constants.build_cache is True:
+                cache = build_cache.BuildCache(self.model, self.constants)
+            with self.profiler.phase("build_cache"):
+                cache_restored = cache is not None and cache.restore()
+            if cache_restored is False:
+                with self.profiler.phase("build_efi"):
+                    self.build_efi()
+                if self.constants.allow_oc_everywhere is False or self.constants.allow_native_spoofs is True:
+                    with self.profiler.phase("set_smbios"):
+                        self.set_smbios()
+                with self.profiler.phase("cleanup"):
+                    self.cleanup()
+                with self.profiler.phase("sign_files"):
+                    self.sign_files()
+                if cache is not None:
+                    with self.profiler.phase("build_cache"):
+                        cache.store()
+        self.profiler.write_report()
         print("")
         print(f"Your OpenCore EFI for {self.model} has been built at:")
         print(f"    {self.constants.opencore_release_folder}")
@@ -0,0 +1,326 @@
+# Content-addressed cache of finished OpenCore builds
+# Allows repeated builds of the same model and settings to skip the entire build process
+
+import hashlib
+import json
+import os
+import shutil
+import sys
+from ctypes import CDLL, c_char_p, c_int
+from datetime import date
+from pathlib import Path
+
+from resources import constants, utilities
+
+
+# Settings that never influence the generated EFI
+# Everything else stored in Constants is treated as a build input
+IGNORED_SETTINGS = [
+    "gui_mode",
+    "launcher_binary",
+    "launcher_script",
+    "ignore_updates",
+    "walkthrough",
+    "patch_disk",
+    "current_path",
+    "payload_path",
+    "build_cache",
+    "profile_build",
+    "verify_cache",
+]
+
+# Payload folders read during build_opencore()
+PAYLOAD_FOLDERS = [
+    "OpenCore",
+    "Config",
+    "ACPI",
+    "Drivers",
+    "Kexts",
+    "Icon",
+]
+
+
+def hash_file(file_path):
+    checksum = hashlib.sha256()
+    with Path(file_path).open("rb") as file:
+        chunk = file.read(1024 * 1024 * 16)
+        while chunk:
+            checksum.update(chunk)
+            chunk = file.read(1024 * 1024 * 16)
+    return checksum.hexdigest()
+
+
+# clonefile(2), loaded on first use
+clonefile = None
+
+
+def reflink_file(source, destination):
+    # APFS copy-on-write clone, safe to modify without affecting the source
+    global clonefile
+    if sys.platform != "darwin":
+        return False
+    if clonefile is None:
+        clonefile = CDLL("/usr/lib/libSystem.dylib").clonefile
+        clonefile.argtypes = [c_char_p, c_char_p, c_int]
+    return clonefile(os.fsencode(source), os.fsencode(destination), 0) == 0
+
+
+def clone_file(source, destination, link=True):
+    if reflink_file(source, destination):
+        return
+    # Hardlinks are near-instant, fall back to copying when crossing volumes or on unsupported filesystems
+    if link is True:
+        try:
+            os.link(source, destination)
+            return
+        except OSError:
+            pass
+    shutil.copy2(source, destination)
+
+
+class BuildCache:
+    def __init__(self, model, versions):
+        self.model = model
+        self.constants: constants.Constants = versions
+        self.key = None
+
+    def cache_supported(self):
+        # Builds that are unique per run cannot be reused
+        if self.constants.serial_settings == "Advanced":
+            # macserial generates a new serial number and UUID for every build
+            return False
+        if self.constants.vault is True:
+            # Vaulting signs OpenCore.efi with a freshly generated key
+            return False
+        if self.constants.disk != "":
+            # Volume icon depends on the target disk
+            return False
+        return True
+
+    def payload_hashes(self):
+        # Hashing every payload on each build is wasteful, reuse digests of unmodified files
+        digest_cache_path = Path(self.constants.build_cache_path) / Path("payloads.json")
+        try:
+            digest_cache = json.loads(digest_cache_path.read_text())
+        except (OSError, ValueError):
+            digest_cache = {}
+
+        payload_digests = {}
+        for folder in PAYLOAD_FOLDERS:
+            for file in sorted((Path(self.constants.payload_path) / Path(folder)).rglob("*")):
+                if not file.is_file():
+                    continue
+                stat = file.stat()
+                entry = digest_cache.get(str(file))
+                if not entry or entry[0] != stat.st_size or entry[1] != stat.st_mtime_ns:
+                    entry = [stat.st_size, stat.st_mtime_ns, hash_file(file)]
+                    digest_cache[str(file)] = entry
+                payload_digests[str(file.relative_to(self.constants.payload_path))] = entry[2]
+
+        Path(self.constants.build_cache_path).mkdir(parents=True, exist_ok=True)
+        digest_cache_path.write_text(json.dumps(digest_cache, sort_keys=True))
+        return payload_digests
+
+    def settings_hash(self):
+        settings = {}
+        for name, value in vars(self.constants).items():
+            if name in IGNORED_SETTINGS:
+                continue
+            if name == "computer":
+                # Hardware probe is only embedded when building for the host
+                value = None if self.constants.custom_model else repr(value)
+            settings[name] = value
+        return hashlib.sha256(json.dumps(settings, sort_keys=True, default=repr).encode()).hexdigest()
+
+    def generate_key(self):
+        key_data = {
+            "model": self.model,
+            # Build-Version in config.plist embeds the build date
+            "date": str(date.today()),
+            "settings": self.settings_hash(),
+            "payloads": self.payload_hashes(),
+        }
+        self.key = hashlib.sha256(json.dumps(key_data, sort_keys=True).encode()).hexdigest()
+        return self.key
+
+    def entry_path(self):
+        return Path(self.constants.build_cache_path) / Path(self.key)
+
+    def restore(self):
+        # Returns True if the cached build was restored into opencore_release_folder
+        if not self.cache_supported():
+            print("- Build settings are unique per build, skipping build cache")
+            return False
+        self.generate_key()
+        manifest_path = self.entry_path() / Path("manifest.json")
+        if not manifest_path.exists():
+            print("- No cached build found")
+            return False
+        try:
+            manifest = json.loads(manifest_path.read_text())
+        except ValueError:
+            print("- Cached build manifest is corrupted, rebuilding")
+            return False
+
+        cached_tree = self.entry_path() / Path("OpenCore-Build")
+        for file, size in manifest["files"].items():
+            if not (cached_tree / Path(file)).exists() or (cached_tree / Path(file)).stat().st_size != size:
+                print("- Cached build is incomplete, rebuilding")
+                return False
+
+        print(f"- Restoring cached build for {self.model}")
+        if Path(self.constants.opencore_release_folder).exists():
+            shutil.rmtree(self.constants.opencore_release_folder, ignore_errors=True)
+        for directory in manifest["directories"]:
+            (Path(self.constants.opencore_release_folder) / Path(directory)).mkdir(parents=True, exist_ok=True)
+        for file in manifest["files"]:
+            # plists are commonly edited by hand after building, never share them with the cache
+            clone_file(cached_tree / Path(file), Path(self.constants.opencore_release_folder) / Path(file), link=not file.endswith(".plist"))
+        return True
+
+    def store(self):
+        if not self.cache_supported():
+            return
+        if self.key is None:
+            self.generate_key()
+        if self.entry_path().exists():
+            return
+
+        print("- Adding build to cache")
+        self.prune()
+        release_folder = Path(self.constants.opencore_release_folder)
+        staging_path = Path(self.constants.build_cache_path) / Path(f"{self.key}.{os.getpid()}.tmp")
+        if staging_path.exists():
+            shutil.rmtree(staging_path)
+        staging_path.mkdir(parents=True)
+        shutil.copytree(release_folder, staging_path / Path("OpenCore-Build"), symlinks=True)
+
+        manifest = {
+            "model": self.model,
+            "date": str(date.today()),
+            "directories": [],
+            "files": {},
+        }
+        for item in sorted(release_folder.rglob("*")):
+            if item.is_dir():
+                manifest["directories"].append(str(item.relative_to(release_folder)))
+            else:
+                manifest["files"][str(item.relative_to(release_folder))] = item.stat().st_size
+        (staging_path / Path("manifest.json")).write_text(json.dumps(manifest, indent=4))
+
+        try:
+            # Rename is atomic, another process may have populated the same entry in the meantime
+            os.rename(staging_path, self.entry_path())
+        except OSError:
+            shutil.rmtree(staging_path, ignore_errors=True)
+
+    def prune(self):
+        # Entries are keyed by build date, older entries can never be hit again
+        for entry in Path(self.constants.build_cache_path).glob("*/manifest.json"):
+            try:
+                if json.loads(entry.read_text())["date"] == str(date.today()):
+                    continue
+            except (OSError, ValueError, KeyError):
+                pass
+            shutil.rmtree(entry.parent, ignore_errors=True)
+
+
+class BaseTreeCache:
+    # Expanded OpenCore archive, identical for every build of the same OpenCore version and variant
+    # Entries are matched to the archive by its size and modification time, contents are only hashed
+    # when populating or when verify_cache is set
+
+    # Files modified in place after cloning, never hardlinked to the cache
+    # OpenCore.efi is signed in place when vaulting
+    PRIVATE_FILES = [
+        "OpenCore-Build/EFI/OC/OpenCore.efi",
+    ]
+
+    def __init__(self, versions):
+        self.constants: constants.Constants = versions
+        self.archive_hash = None
+
+    def entry_path(self):
+        return Path(self.constants.opencore_base_cache_path) / Path(f"{self.constants.opencore_version}-{self.constants.opencore_build}-{self.archive_hash[:16]}")
+
+    def archive_stat(self):
+        archive_stat = Path(self.constants.opencore_zip_source).stat()
+        return [archive_stat.st_size, archive_stat.st_mtime_ns]
+
+    def find_entry(self):
+        # Returns the manifest of the entry populated from the current archive
+        archive_stat = self.archive_stat()
+        for manifest_path in Path(self.constants.opencore_base_cache_path).glob(f"{self.constants.opencore_version}-{self.constants.opencore_build}-*/manifest.json"):
+            try:
+                manifest = json.loads(manifest_path.read_text())
+            except (OSError, ValueError):
+                continue
+            if manifest.get("archive_stat") == archive_stat:
+                self.archive_hash = manifest["archive_hash"]
+                return manifest
+        return None
+
+    def verify(self, manifest):
+        # Hashing the archive and tree reads as much as extracting it, by default only sizes are checked
+        tree_path = self.entry_path() / Path("tree")
+        try:
+            if self.constants.verify_cache is True and hash_file(self.constants.opencore_zip_source) != manifest["archive_hash"]:
+                return False
+            for file, (size, file_hash) in manifest["files"].items():
+                if (tree_path / Path(file)).stat().st_size != size:
+                    return False
+                if self.constants.verify_cache is True and hash_file(tree_path / Path(file)) != file_hash:
+                    return False
+        except (OSError, ValueError, KeyError, TypeError):
+            return False
+        return True
+
+    def populate(self):
+        print(f"- Caching OpenCore v{self.constants.opencore_version} {self.constants.opencore_build}")
+        # Remove entries built from older copies of this archive
+        for entry in Path(self.constants.opencore_base_cache_path).glob(f"{self.constants.opencore_version}-{self.constants.opencore_build}-*"):
+            shutil.rmtree(entry, ignore_errors=True)
+
+        archive_stat = self.archive_stat()
+        self.archive_hash = hash_file(self.constants.opencore_zip_source)
+        staging_path = Path(self.constants.opencore_base_cache_path) / Path(f"{self.archive_hash[:16]}.{os.getpid()}.tmp")
+        utilities.extract_archive(self.constants.opencore_zip_source, staging_path / Path("tree"))
+        manifest = {
+            "opencore_version": self.constants.opencore_version,
+            "opencore_build": self.constants.opencore_build,
+            "archive_hash": self.archive_hash,
+            "archive_stat": archive_stat,
+            "directories": [],
+            "files": {},
+        }
+        tree_path = staging_path / Path("tree")
+        for item in sorted(tree_path.rglob("*")):
+            if item.is_dir():
+                manifest["directories"].append(str(item.relative_to(tree_path)))
+            else:
+                manifest["files"][str(item.relative_to(tree_path))] = [item.stat().st_size, hash_file(item)]
+        (staging_path / Path("manifest.json")).write_text(json.dumps(manifest, indent=4))
+        try:
+            os.rename(staging_path, self.entry_path())
+        except OSError:
+            shutil.rmtree(staging_path, ignore_errors=True)
+
+    def clone_into(self, destination):
+        try:
+            manifest = self.find_entry()
+            if manifest is None or not self.verify(manifest):
+                self.populate()
+                manifest = self.find_entry()
+            if manifest is None or not self.verify(manifest):
+                raise OSError("OpenCore base tree failed verification")
+        except OSError as error:
+            # Cache location may be read-only, extract directly instead
+            print(f"- Unable to use OpenCore cache ({error}), extracting archive")
+            utilities.extract_archive(self.constants.opencore_zip_source, destination)
+            return
+
+        tree_path = self.entry_path() / Path("tree")
+        for directory in manifest["directories"]:
+            (Path(destination) / Path(directory)).mkdir(parents=True, exist_ok=True)
+        for file in manifest["files"]:
+            clone_file(tree_path / Path(file), Path(destination) / Path(file), link=file not in self.PRIVATE_FILES)
@@ -0,0 +1,78 @@
+# Build phase profiler
+# Records wall time, file I/O and subprocess usage per build phase and per kext
+
+import json
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+from resources import constants
+
+
+class BuildProfiler:
+    def __init__(self, model, versions):
+        self.model = model
+        self.constants: constants.Constants = versions
+        self.enabled = self.constants.profile_build
+        self.phases = {}
+        self.kexts = {}
+        self.active_phases = []
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name):
+        if self.enabled is False:
+            yield
+            return
+        with self.lock:
+            stats = self.phases.setdefault(name, {"calls": 0, "seconds": 0.0, "bytes_read": 0, "bytes_written": 0, "subprocesses": 0})
+            stats["calls"] += 1
+            self.active_phases.append(stats)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self.lock:
+                stats["seconds"] += time.perf_counter() - start
+                self.active_phases.remove(stats)
+
+    def record_io(self, bytes_read=0, bytes_written=0):
+        if self.enabled is False:
+            return
+        # Nested phases include the I/O of their children
+        with self.lock:
+            for stats in self.active_phases:
+                stats["bytes_read"] += bytes_read
+                stats["bytes_written"] += bytes_written
+
+    def record_subprocess(self):
+        if self.enabled is False:
+            return
+        with self.lock:
+            for stats in self.active_phases:
+                stats["subprocesses"] += 1
+
+    def record_kext(self, name, seconds, bytes_read, bytes_written):
+        if self.enabled is False:
+            return
+        with self.lock:
+            self.kexts[name] = {"seconds": seconds, "bytes_read": bytes_read, "bytes_written": bytes_written}
+        self.record_io(bytes_read, bytes_written)
+
+    def write_report(self):
+        if self.enabled is False:
+            return
+        report = {
+            "patcher_version": self.constants.patcher_version,
+            "opencore_version": self.constants.opencore_version,
+            "opencore_build": self.constants.opencore_build,
+            "kext_variant": self.constants.kext_variant,
+            "model": self.model,
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "phases": self.phases,
+            "kexts": self.kexts,
+        }
+        Path(self.constants.build_profile_path).write_text(json.dumps(report, indent=4))
+        print(f"- Build profile saved to {self.constants.build_profile_path}")
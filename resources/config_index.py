@@ -0,0 +1,42 @@
+# Hash index over OpenCore's config.plist entries
+# Avoids rescanning entry lists on every lookup while building
+
+# Sections holding lists of entries toggled by the "Enabled" key
+INDEXED_SECTIONS = [
+    ("ACPI", "Add"),
+    ("ACPI", "Patch"),
+    ("Booter", "Patch"),
+    ("Kernel", "Add"),
+    ("Kernel", "Patch"),
+    ("Misc", "Tools"),
+    ("UEFI", "Drivers"),
+]
+
+# Keys entries are looked up by
+INDEXED_KEYS = [
+    "Comment",
+    "BundlePath",
+    "Identifier",
+    "Path",
+]
+
+
+class ConfigIndex:
+    def __init__(self, config):
+        self.config = config
+        self.entries = {}
+        for section, entry_type in INDEXED_SECTIONS:
+            for entry in self.config[section][entry_type]:
+                for key in INDEXED_KEYS:
+                    if key in entry:
+                        # Match linear scan behaviour, first entry with the value wins
+                        self.entries.setdefault((section, entry_type, key, entry[key]), entry)
+
+    def get(self, section, entry_type, key, value):
+        return self.entries.get((section, entry_type, key, value))
+
+    def prune(self):
+        # Remove disabled entries from every indexed section in a single pass
+        for section, entry_type in INDEXED_SECTIONS:
+            self.config[section][entry_type] = [entry for entry in self.config[section][entry_type] if entry["Enabled"]]
+        self.entries = {key: entry for key, entry in self.entries.items() if entry["Enabled"]}
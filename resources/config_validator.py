@@ -0,0 +1,285 @@
+# In-process validation of generated OpenCore config.plist files
+# Schema is derived from the bundled config.plist template, with cross-field rules mirroring ocvalidate
+
+import plistlib
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+
+
+@dataclass
+class ConfigError:
+    path: str
+    message: str
+
+    def __str__(self):
+        return f"{self.path}: {self.message}"
+
+
+GUID_PATTERN = re.compile(r"^[0-9A-F]{8}-[0-9A-F]{4}-[0-9A-F]{4}-[0-9A-F]{4}-[0-9A-F]{12}$")
+KERNEL_VERSION_PATTERN = re.compile(r"^(\d+(\.\d+){0,2})?$")
+
+# Element schemas for arrays left empty in the template
+EMPTY_ARRAY_SCHEMAS = {
+    "ACPI/Delete": {"All": bool, "Comment": str, "Enabled": bool, "OemTableId": bytes, "TableLength": int, "TableSignature": bytes},
+    "Booter/MmioWhitelist": {"Address": int, "Comment": str, "Enabled": bool},
+    "Kernel/Block": {"Arch": str, "Comment": str, "Enabled": bool, "Identifier": str, "MaxKernel": str, "MinKernel": str},
+    "Kernel/Force": {"Arch": str, "BundlePath": str, "Comment": str, "Enabled": bool, "ExecutablePath": str, "Identifier": str, "MaxKernel": str, "MinKernel": str, "PlistPath": str},
+    "Misc/BlessOverride": str,
+    "Misc/Entries": {"Arguments": str, "Auxiliary": bool, "Comment": str, "Enabled": bool, "Flavour": str, "Name": str, "Path": str, "TextMode": bool},
+    "UEFI/ReservedMemory": {"Address": int, "Comment": str, "Enabled": bool, "Size": int, "Type": str},
+}
+
+# Keys introduced after the template was written, allowed but not required
+OPTIONAL_ARRAY_KEYS = {
+    "Kernel/Block": ["Strategy"],
+}
+
+# Dictionaries keyed by device paths or GUIDs instead of fixed keys
+# Value is the expected type of each entry
+MAPPED_DICTIONARIES = {
+    "DeviceProperties/Add": dict,
+    "DeviceProperties/Delete": list,
+    "NVRAM/Add": dict,
+    "NVRAM/Delete": list,
+    "NVRAM/LegacySchema": list,
+}
+GUID_KEYED_DICTIONARIES = ["NVRAM/Add", "NVRAM/Delete", "NVRAM/LegacySchema"]
+
+ENUMS = {
+    "Booter/Patch/Arch": ["Any", "i386", "x86_64"],
+    "Kernel/Add/Arch": ["Any", "i386", "x86_64"],
+    "Kernel/Block/Arch": ["Any", "i386", "x86_64"],
+    "Kernel/Force/Arch": ["Any", "i386", "x86_64"],
+    "Kernel/Patch/Arch": ["Any", "i386", "x86_64"],
+    "Kernel/Block/Strategy": ["Disable", "Exclude"],
+    "Kernel/Scheme/KernelArch": ["Auto", "i386", "i386-user32", "x86_64"],
+    "Kernel/Scheme/KernelCache": ["Auto", "Cacheless", "Mkext", "Prelinked"],
+    "Misc/Boot/HibernateMode": ["None", "Auto", "RTC", "NVRAM"],
+    "Misc/Boot/LauncherOption": ["Disabled", "Full", "Short", "System"],
+    "Misc/Boot/PickerMode": ["Builtin", "External", "Apple"],
+    "Misc/Security/DmgLoading": ["Disabled", "Signed", "Any"],
+    "Misc/Security/Vault": ["Optional", "Basic", "Secure"],
+    "Misc/Security/SecureBootModel": [
+        "Default", "Disabled", "j137", "j680", "j132", "j174", "j140k", "j780", "j213",
+        "j140a", "j152f", "j160", "j230k", "j214k", "j223", "j215", "j185", "j185f", "x86legacy",
+    ],
+    "PlatformInfo/UpdateSMBIOSMode": ["TryOverwrite", "Create", "Overwrite", "Custom"],
+    "UEFI/ReservedMemory/Type": [
+        "Reserved", "LoaderCode", "LoaderData", "BootServiceCode", "BootServiceData", "RuntimeCode", "RuntimeData",
+        "Available", "Persistent", "UnusableMemory", "ACPIReclaimMemory", "ACPIMemoryNVS", "MemoryMappedIO", "MemoryMappedIOPortSpace", "PalCode",
+    ],
+}
+
+# Sections whose enabled entries must reference unique files with one of the given extensions
+UNIQUE_PATHS = {
+    "ACPI/Add": (".aml", ".bin"),
+    "Misc/Tools": (".efi",),
+    "UEFI/Drivers": (".efi",),
+}
+
+PATCH_SECTIONS = ["ACPI/Patch", "Booter/Patch", "Kernel/Patch"]
+
+
+def type_name(value_type):
+    return {bool: "boolean", int: "integer", str: "string", bytes: "data", dict: "dictionary", list: "array", float: "real"}.get(value_type, value_type.__name__)
+
+
+def matches_type(value, value_type):
+    # bool is a subclass of int, plist booleans and integers must not be interchangeable
+    if value_type is int:
+        return isinstance(value, int) and not isinstance(value, bool)
+    return isinstance(value, value_type)
+
+
+def build_schema(template, path=""):
+    # Converts the template into nested dicts of expected types
+    if path in EMPTY_ARRAY_SCHEMAS:
+        return [EMPTY_ARRAY_SCHEMAS[path]]
+    if path in MAPPED_DICTIONARIES:
+        # Entries are checked by check_mapped_dictionaries()
+        return dict
+    if isinstance(template, dict):
+        return {key: build_schema(value, f"{path}/{key}" if path else key) for key, value in template.items()}
+    if isinstance(template, list):
+        if not template:
+            return [None]
+        if isinstance(template[0], dict):
+            # Merge every template entry, keys present in all entries are required
+            element = {}
+            for entry in template:
+                for key, value in entry.items():
+                    element.setdefault(key, type(value))
+            required = set.intersection(*[set(entry) for entry in template])
+            return [element, required]
+        return [type(template[0])]
+    return type(template)
+
+
+@lru_cache(maxsize=None)
+def load_schema(template_path):
+    with Path(template_path).open("rb") as template_file:
+        return build_schema(plistlib.load(template_file))
+
+
+class ConfigValidator:
+    def __init__(self, config, template_path):
+        self.config = config
+        self.schema = load_schema(str(template_path))
+        self.errors = []
+
+    def error(self, path, message):
+        self.errors.append(ConfigError(path, message))
+
+    def validate(self):
+        self.check_node(self.config, self.schema, "")
+        for check in [self.check_enums, self.check_kexts, self.check_patches, self.check_unique_paths, self.check_mapped_dictionaries]:
+            try:
+                check()
+            except (KeyError, TypeError, AttributeError):
+                # Malformed sections have already been reported by check_node()
+                pass
+        return self.errors
+
+    def check_node(self, value, schema, path):
+        if schema is None:
+            return
+        if isinstance(schema, dict):
+            if not isinstance(value, dict):
+                self.error(path, f"expected dictionary, found {type_name(type(value))}")
+                return
+            for key, key_schema in schema.items():
+                if key.startswith("#"):
+                    continue
+                if key not in value:
+                    self.error(f"{path}/{key}" if path else key, "missing key")
+                    continue
+                self.check_node(value[key], key_schema, f"{path}/{key}" if path else key)
+            for key in value:
+                if key not in schema and not key.startswith("#"):
+                    self.error(f"{path}/{key}" if path else key, "unknown key")
+        elif isinstance(schema, list):
+            if not isinstance(value, list):
+                self.error(path, f"expected array, found {type_name(type(value))}")
+                return
+            element_schema = schema[0]
+            required = schema[1] if len(schema) > 1 else None
+            for index, entry in enumerate(value):
+                entry_path = f"{path}[{index}]"
+                if isinstance(element_schema, dict):
+                    if not isinstance(entry, dict):
+                        self.error(entry_path, f"expected dictionary, found {type_name(type(entry))}")
+                        continue
+                    for key, key_type in element_schema.items():
+                        if key not in entry:
+                            if required is None or key in required:
+                                self.error(f"{entry_path}/{key}", "missing key")
+                        elif not matches_type(entry[key], key_type):
+                            self.error(f"{entry_path}/{key}", f"expected {type_name(key_type)}, found {type_name(type(entry[key]))}")
+                    for key in entry:
+                        if key not in element_schema and key not in OPTIONAL_ARRAY_KEYS.get(path, []):
+                            self.error(f"{entry_path}/{key}", "unknown key")
+                elif element_schema is not None and not matches_type(entry, element_schema):
+                    self.error(entry_path, f"expected {type_name(element_schema)}, found {type_name(type(entry))}")
+        elif not matches_type(value, schema):
+            self.error(path, f"expected {type_name(schema)}, found {type_name(type(value))}")
+
+    def entries(self, section):
+        category, entry_type = section.split("/")
+        return enumerate(self.config[category][entry_type])
+
+    def check_enums(self):
+        for path, values in ENUMS.items():
+            parts = path.split("/")
+            section = "/".join(parts[:2])
+            if isinstance(self.config[parts[0]][parts[1]], list):
+                # Enum applies to every entry of an array
+                for index, entry in self.entries(section):
+                    if parts[2] in entry and entry[parts[2]] not in values:
+                        self.error(f"{section}[{index}]/{parts[2]}", f"invalid value '{entry[parts[2]]}'")
+                continue
+            value = self.config
+            for part in parts:
+                value = value[part]
+            if value not in values:
+                self.error(path, f"invalid value '{value}'")
+
+        for section in ["Kernel/Add", "Kernel/Block", "Kernel/Force", "Kernel/Patch"]:
+            for index, entry in self.entries(section):
+                for key in ["MinKernel", "MaxKernel"]:
+                    if not KERNEL_VERSION_PATTERN.match(entry[key]):
+                        self.error(f"{section}[{index}]/{key}", f"invalid kernel version '{entry[key]}'")
+
+    def check_kexts(self):
+        enabled_kexts = {}
+        for index, kext in self.entries("Kernel/Add"):
+            if not kext["Enabled"]:
+                continue
+            bundle_path = kext["BundlePath"]
+            if bundle_path in enabled_kexts:
+                self.error(f"Kernel/Add[{index}]/BundlePath", f"duplicate kext {bundle_path}, first defined at Kernel/Add[{enabled_kexts[bundle_path]}]")
+                continue
+            if not bundle_path.endswith(".kext"):
+                self.error(f"Kernel/Add[{index}]/BundlePath", f"{bundle_path} is not a kext")
+            if not kext["PlistPath"]:
+                self.error(f"Kernel/Add[{index}]/PlistPath", "PlistPath must not be empty")
+            if "/Contents/PlugIns/" in bundle_path:
+                # Plugins can only be injected after their parent kext
+                parent = bundle_path.split("/Contents/PlugIns/")[0]
+                if parent not in enabled_kexts:
+                    self.error(f"Kernel/Add[{index}]/BundlePath", f"plugin {bundle_path} requires {parent} to be enabled before it")
+            enabled_kexts[bundle_path] = index
+
+    def check_patches(self):
+        for section in PATCH_SECTIONS:
+            for index, patch in self.entries(section):
+                entry_path = f"{section}[{index}]"
+                find = patch["Find"]
+                replace = patch["Replace"]
+                if not find and not patch.get("Base"):
+                    self.error(entry_path, "patch requires either Find or Base")
+                if find and len(find) != len(replace):
+                    self.error(f"{entry_path}/Replace", f"length {len(replace)} does not match Find length {len(find)}")
+                if patch["Mask"] and len(patch["Mask"]) != len(find):
+                    self.error(f"{entry_path}/Mask", f"length {len(patch['Mask'])} does not match Find length {len(find)}")
+                if patch["ReplaceMask"] and len(patch["ReplaceMask"]) != len(replace):
+                    self.error(f"{entry_path}/ReplaceMask", f"length {len(patch['ReplaceMask'])} does not match Replace length {len(replace)}")
+
+    def check_unique_paths(self):
+        for section, extensions in UNIQUE_PATHS.items():
+            paths = {}
+            for index, entry in self.entries(section):
+                if not entry["Enabled"]:
+                    continue
+                path = entry["Path"]
+                if not path.lower().endswith(extensions):
+                    self.error(f"{section}[{index}]/Path", f"{path} must end with {' or '.join(extensions)}")
+                if path in paths:
+                    self.error(f"{section}[{index}]/Path", f"duplicate entry {path}, first defined at {section}[{paths[path]}]")
+                paths.setdefault(path, index)
+
+    def check_mapped_dictionaries(self):
+        for section, value_type in MAPPED_DICTIONARIES.items():
+            category, entry_type = section.split("/")
+            for key, value in self.config[category][entry_type].items():
+                if section in GUID_KEYED_DICTIONARIES and not GUID_PATTERN.match(key):
+                    self.error(f"{section}/{key}", "invalid GUID")
+                if not isinstance(value, value_type):
+                    self.error(f"{section}/{key}", f"expected {type_name(value_type)}, found {type_name(type(value))}")
+                elif value_type is list and not all(isinstance(item, str) for item in value):
+                    self.error(f"{section}/{key}", "expected array of strings")
+
+
+def validate_config(config, template_path):
+    # Returns a list of ConfigError, empty if the config is valid
+    return ConfigValidator(config, template_path).validate()
+
+
+def validate_file(config_path, template_path):
+    try:
+        with Path(config_path).open("rb") as config_file:
+            config = plistlib.load(config_file)
+    except (OSError, plistlib.InvalidFileException, ValueError) as error:
+        return [ConfigError(str(config_path), f"unable to load config: {error}")]
+    return validate_config(config, template_path)
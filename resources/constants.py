@@ -99,6 +99,9 @@ class Constants:
         self.launcher_binary = None #       Determine launch binary (ie. Python vs PyInstaller)
         self.launcher_script = None  #      Determine launch file (if run via Python)
         self.ignore_updates = False  #      Ignore OCLP updates
+        self.build_cache = False  #         Reuse previously built EFIs with identical settings
+        self.profile_build = False  #       Record build phase timings
+        self.verify_cache = False  #        Rehash cached OpenCore trees before reusing them
 
         ## Hardware
         self.computer: device_probe.Computer = None  # type: ignore
@@ -405,6 +408,35 @@ class Constants:
     def build_path(self):
         return self.current_path / Path("Build-Folder/")
 
+    @property
+    def build_cache_path(self):
+        return self.current_path / Path("Build-Cache/")
+
+    @property
+    def opencore_base_cache_path(self):
+        return self.build_cache_path / Path("OpenCore/")
+
+    @property
+    def build_profile_path(self):
+        return self.build_path / Path("Build-Profile.json")
+
+    @property
+    def patch_simulation_root(self):
+        return self.current_path / Path("Patch-Simulation/")
+
+    @property
+    def patch_simulation_path(self):
+        return self.current_path / Path("Patch-Simulation.json")
+
+    @property
+    def build_plan_path(self):
+        return self.current_path / Path("Build-Plan.plist")
+
+    # Shared between the user and root launches of the patcher
+    @property
+    def probe_cache_path(self):
+        return Path("/Users/Shared/.OCLP-Probe-Cache.json")
+
     @property
     def opencore_release_folder(self):
         return self.build_path / Path(f"OpenCore-Build")
@@ -533,6 +565,11 @@ class Constants:
     def payload_apple_root_path(self):
         return self.payload_path / Path("Apple")
 
+    # Downloaded PatcherSupportPkg releases, outside of the app bundle so they outlive each patcher download
+    @property
+    def support_pkg_store_path(self):
+        return Path("/Users/Shared/.OCLP-Support-Pkg-Store/")
+
     @property
     def payload_apple_kexts_path(self):
         return self.payload_apple_root_path / Path("Extensions")
@@ -5,22 +5,110 @@ from __future__ import annotations
 
 import binascii
 import enum
+import functools
 import itertools
-import subprocess
 import plistlib
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from dataclasses import dataclass, field
 from typing import Any, ClassVar, Optional, Type, Union
 
-from resources import utilities, ioreg
+from resources import utilities, ioreg_backend
 from data import pci_data
 
 
+def build_id_table(id_lists: list):
+    # Maps each device ID to the first matching value, keeping the precedence of the lists' order
+    table = {}
+    for device_ids, value in id_lists:
+        for device_id in device_ids:
+            table.setdefault(device_id, value)
+    return table
+
+
+def run_probe_graph(steps: dict):
+    # Runs each step as soon as the steps it depends on have finished
+    # steps: name -> (function, [dependency names]), functions receive their dependencies' results in order
+    # Probes mostly wait on IOKit or external tools, so threads overlap them despite the GIL
+    results = {}
+    pending = dict(steps)
+    running = {}
+    with ThreadPoolExecutor(max_workers=len(steps)) as executor:
+        while pending or running:
+            for name, (function, dependencies) in list(pending.items()):
+                if all(dependency in results for dependency in dependencies):
+                    running[executor.submit(function, *[results[dependency] for dependency in dependencies])] = name
+                    del pending[name]
+            if not running:
+                raise Exception(f"Unresolvable probe dependencies: {', '.join(pending)}")
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                results[running.pop(future)] = future.result()
+    return results
+
+
 @dataclass
 class CPU:
     name: str
     flags: list[str]
 
 
+@dataclass
+class IORegistryNode:
+    entry_id: int  # Registry entry ID, stable for the lifetime of the entry
+    kind: str  # "pci", "acpi", "bridge" or "other"
+    name: Optional[str] = None  # Name of IORegistryEntry
+    location: Optional[list[str]] = None  # Location in the IOService plane, PCI devices only
+    uid: Optional[str] = None  # _UID, ACPI platform devices only
+    parent_id: Optional[int] = None
+    properties: dict = field(default_factory=dict)  # PCI devices only
+
+
+class IORegistrySnapshot:
+    # In-memory view of the IOService plane, every probe classifies from this instead of querying IOKit again
+    # Registry is captured in a single walk by the active ioreg_backend, either live or replayed from a recording
+
+    def __init__(self, registry: dict):
+        self.nodes: dict[int, IORegistryNode] = {}
+        self.pci_path_cache: dict[int, Optional[list[str]]] = {}
+        for entry_id, entry in registry["Entries"].items():
+            node = IORegistryNode(int(entry_id), entry["Kind"], name=entry.get("Name"), uid=entry.get("UID"), properties=entry.get("Properties", {}))
+            if "Location" in entry:
+                node.location = [hex(int(i, 16)) for i in entry["Location"].split(",") + ["0"]]
+            if "Parent" in entry:
+                node.parent_id = int(entry["Parent"])
+            self.nodes[node.entry_id] = node
+
+        self.pci_devices: list[IORegistryNode] = [self.nodes[int(i)] for i in registry["PCI Devices"]]
+        self.nvme_controllers: list[IORegistryNode] = [self.nodes[int(i)] for i in registry["NVMe Controllers"]]  # PCI devices hosting an IONVMeController
+        self.country_codes: dict[int, str] = {int(i): country_code for i, country_code in registry["Country Codes"].items()}  # PCI device entry ID -> IO80211CountryCode
+        self.platform_properties: dict = registry["Platform"]
+
+    def pci_components(self, entry_id: int):
+        # Based off gfxutil logic, seems to work.
+        # None if there's something in between that's not PCI
+        if entry_id not in self.pci_path_cache:
+            node = self.nodes[entry_id]
+            if node.kind == "acpi":
+                components = [f"PciRoot({node.uid})"]
+            elif node.kind in ["pci", "bridge"]:
+                components = self.pci_components(node.parent_id) if node.parent_id is not None else []
+                if components is not None and node.kind == "pci":
+                    components = components + [f"Pci({node.location[0]},{node.location[1]})"]  # type: ignore
+            else:
+                components = None
+            self.pci_path_cache[entry_id] = components
+        return self.pci_path_cache[entry_id]
+
+    def pci_path(self, node: IORegistryNode):
+        return "/".join(self.pci_components(node.entry_id) or [])
+
+    def match_class_codes(self, *class_codes: bytes):
+        return [node for node in self.pci_devices if node.properties.get("class-code") in class_codes]
+
+    def match_name(self, name: str):
+        return next((node for node in self.pci_devices if name in [node.name, node.properties.get("IOName")]), None)
+
+
 @dataclass
 class PCIDevice:
     VENDOR_ID: ClassVar[int]  # Default vendor id, for subclasses.
@@ -41,19 +129,19 @@ class PCIDevice:
     #     return state
 
     @classmethod
-    def from_ioregistry(cls, entry: ioreg.io_registry_entry_t, anti_spoof=False):
-        properties: dict = ioreg.corefoundation_to_native(ioreg.IORegistryEntryCreateCFProperties(entry, None, ioreg.kCFAllocatorDefault, ioreg.kNilOptions)[1])  # type: ignore
+    def from_snapshot(cls, snapshot: IORegistrySnapshot, node: IORegistryNode, anti_spoof=False):
+        properties = node.properties
         if anti_spoof and "IOName" in properties:
             vendor_id, device_id = (int(i, 16) for i in properties["IOName"][3:].split(","))
         else:
             vendor_id, device_id = [int.from_bytes(properties[i][:4], byteorder="little") for i in ["vendor-id", "device-id"]]
 
-        device = cls(vendor_id, device_id, int.from_bytes(properties["class-code"][:6], byteorder="little"), name=ioreg.io_name_t_to_str(ioreg.IORegistryEntryGetName(entry, None)[1]))
+        device = cls(vendor_id, device_id, int.from_bytes(properties["class-code"][:6], byteorder="little"), name=node.name)
         if "model" in properties:
             device.model = properties["model"].strip(b"\0").decode()
         if "acpi-path" in properties:
             device.acpi_path = properties["acpi-path"]
-        device.populate_pci_path(entry)
+        device.pci_path = snapshot.pci_path(node)
         return device
 
     # @staticmethod
@@ -63,8 +151,14 @@ class PCIDevice:
     #             return i
     #     return None
 
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def vendor_classes(vendor_id: int):
+        # Vendor classes (ie. NVIDIA, Broadcom) for a vendor ID, the class hierarchy never changes once loaded
+        return tuple(i for i in itertools.chain.from_iterable([subclass.__subclasses__() for subclass in PCIDevice.__subclasses__()]) if i.VENDOR_ID == vendor_id)
+
     def vendor_detect(self, *, inherits: ClassVar[Any] = None, classes: list = None):
-        for i in classes or itertools.chain.from_iterable([subclass.__subclasses__() for subclass in PCIDevice.__subclasses__()]):
+        for i in classes or PCIDevice.vendor_classes(self.vendor_id):
             if issubclass(i, inherits or object) and i.detect(self):
                 return i
         return None
@@ -77,29 +171,6 @@ class PCIDevice:
     #     # Eventually
     #     raise NotImplementedError
 
-    def populate_pci_path(self, original_entry: ioreg.io_registry_entry_t):
-        # Based off gfxutil logic, seems to work.
-        paths = []
-        entry = original_entry
-        while entry:
-            if ioreg.IOObjectConformsTo(entry, "IOPCIDevice".encode()):
-                location = [hex(int(i, 16)) for i in ioreg.io_name_t_to_str(ioreg.IORegistryEntryGetLocationInPlane(entry, "IOService".encode(), None)[1]).split(",") + ["0"]]
-                paths.append(f"Pci({location[0]},{location[1]})")
-            elif ioreg.IOObjectConformsTo(entry, "IOACPIPlatformDevice".encode()):
-                paths.append(f"PciRoot({hex(int(ioreg.corefoundation_to_native(ioreg.IORegistryEntryCreateCFProperty(entry, '_UID', ioreg.kCFAllocatorDefault, ioreg.kNilOptions)) or 0))})")  # type: ignore
-                break
-            elif ioreg.IOObjectConformsTo(entry, "IOPCIBridge".encode()):
-                pass
-            else:
-                # There's something in between that's not PCI! Abort
-                paths = []
-                break
-            parent = ioreg.IORegistryEntryGetParentEntry(entry, "IOService".encode(), None)[1]
-            if entry != original_entry:
-                ioreg.IOObjectRelease(entry)
-            entry = parent
-        self.pci_path = "/".join(reversed(paths))
-
 
 @dataclass
 class GPU(PCIDevice):
@@ -122,20 +193,9 @@ class WirelessCard(PCIDevice):
         self.detect_chipset()
 
     @classmethod
-    def from_ioregistry(cls, entry: ioreg.io_registry_entry_t, anti_spoof=True):
-        device = super().from_ioregistry(entry, anti_spoof=anti_spoof)
-
-        matching_dict = {
-            "IOParentMatch": ioreg.corefoundation_to_native(ioreg.IORegistryEntryIDMatching(ioreg.IORegistryEntryGetRegistryEntryID(entry, None)[1])),
-            "IOProviderClass": "IO80211Interface",
-        }
-
-        interface = next(ioreg.ioiterator_to_list(ioreg.IOServiceGetMatchingServices(ioreg.kIOMasterPortDefault, matching_dict, None)[1]), None)
-        if interface:
-            device.country_code = ioreg.corefoundation_to_native(ioreg.IORegistryEntryCreateCFProperty(interface, "IO80211CountryCode", ioreg.kCFAllocatorDefault, ioreg.kNilOptions))  # type: ignore # If not present, will be None anyways
-        else:
-            device.country_code = None  # type: ignore
-
+    def from_snapshot(cls, snapshot: IORegistrySnapshot, node: IORegistryNode, anti_spoof=True):
+        device = super().from_snapshot(snapshot, node, anti_spoof=anti_spoof)
+        device.country_code = snapshot.country_codes.get(node.entry_id)  # type: ignore # If not present, will be None anyways
         return device
 
     def detect_chipset(self):
@@ -173,18 +233,17 @@ class NVIDIA(GPU):
 
     arch: Archs = field(init=False)
 
+    ARCH_TABLE: ClassVar[dict] = build_id_table(
+        [
+            (pci_data.nvidia_ids.curie_ids, Archs.Curie),
+            (pci_data.nvidia_ids.tesla_ids, Archs.Tesla),
+            (pci_data.nvidia_ids.fermi_ids, Archs.Fermi),
+            (pci_data.nvidia_ids.kepler_ids, Archs.Kepler),
+        ]
+    )
+
     def detect_arch(self):
-        # G80/G80GL
-        if self.device_id in pci_data.nvidia_ids.curie_ids:
-            self.arch = NVIDIA.Archs.Curie
-        elif self.device_id in pci_data.nvidia_ids.tesla_ids:
-            self.arch = NVIDIA.Archs.Tesla
-        elif self.device_id in pci_data.nvidia_ids.fermi_ids:
-            self.arch = NVIDIA.Archs.Fermi
-        elif self.device_id in pci_data.nvidia_ids.kepler_ids:
-            self.arch = NVIDIA.Archs.Kepler
-        else:
-            self.arch = NVIDIA.Archs.Unknown
+        self.arch = NVIDIA.ARCH_TABLE.get(self.device_id, NVIDIA.Archs.Unknown)
 
 
 @dataclass
@@ -206,27 +265,22 @@ class AMD(GPU):
 
     arch: Archs = field(init=False)
 
+    ARCH_TABLE: ClassVar[dict] = build_id_table(
+        [
+            (pci_data.amd_ids.r500_ids, Archs.R500),
+            (pci_data.amd_ids.gcn_7000_ids, Archs.Legacy_GCN_7000),
+            (pci_data.amd_ids.gcn_8000_ids, Archs.Legacy_GCN_8000),
+            (pci_data.amd_ids.gcn_9000_ids, Archs.Legacy_GCN_9000),
+            (pci_data.amd_ids.terascale_1_ids, Archs.TeraScale_1),
+            (pci_data.amd_ids.terascale_2_ids, Archs.TeraScale_2),
+            (pci_data.amd_ids.polaris_ids, Archs.Polaris),
+            (pci_data.amd_ids.vega_ids, Archs.Vega),
+            (pci_data.amd_ids.navi_ids, Archs.Navi),
+        ]
+    )
+
     def detect_arch(self):
-        if self.device_id in pci_data.amd_ids.r500_ids:
-            self.arch = AMD.Archs.R500
-        elif self.device_id in pci_data.amd_ids.gcn_7000_ids:
-            self.arch = AMD.Archs.Legacy_GCN_7000
-        elif self.device_id in pci_data.amd_ids.gcn_8000_ids:
-            self.arch = AMD.Archs.Legacy_GCN_8000
-        elif self.device_id in pci_data.amd_ids.gcn_9000_ids:
-            self.arch = AMD.Archs.Legacy_GCN_9000
-        elif self.device_id in pci_data.amd_ids.terascale_1_ids:
-            self.arch = AMD.Archs.TeraScale_1
-        elif self.device_id in pci_data.amd_ids.terascale_2_ids:
-            self.arch = AMD.Archs.TeraScale_2
-        elif self.device_id in pci_data.amd_ids.polaris_ids:
-            self.arch = AMD.Archs.Polaris
-        elif self.device_id in pci_data.amd_ids.vega_ids:
-            self.arch = AMD.Archs.Vega
-        elif self.device_id in pci_data.amd_ids.navi_ids:
-            self.arch = AMD.Archs.Navi
-        else:
-            self.arch = AMD.Archs.Unknown
+        self.arch = AMD.ARCH_TABLE.get(self.device_id, AMD.Archs.Unknown)
 
 
 @dataclass
@@ -251,33 +305,25 @@ class Intel(GPU):
 
     arch: Archs = field(init=False)
 
+    ARCH_TABLE: ClassVar[dict] = build_id_table(
+        [
+            (pci_data.intel_ids.gma_950_ids, Archs.GMA_950),
+            (pci_data.intel_ids.gma_x3100_ids, Archs.GMA_X3100),
+            (pci_data.intel_ids.iron_ids, Archs.Iron_Lake),
+            (pci_data.intel_ids.sandy_ids, Archs.Sandy_Bridge),
+            (pci_data.intel_ids.ivy_ids, Archs.Ivy_Bridge),
+            (pci_data.intel_ids.haswell_ids, Archs.Haswell),
+            (pci_data.intel_ids.broadwell_ids, Archs.Broadwell),
+            (pci_data.intel_ids.skylake_ids, Archs.Skylake),
+            (pci_data.intel_ids.kaby_lake_ids, Archs.Kaby_Lake),
+            (pci_data.intel_ids.coffee_lake_ids, Archs.Coffee_Lake),
+            (pci_data.intel_ids.comet_lake_ids, Archs.Comet_Lake),
+            (pci_data.intel_ids.ice_lake_ids, Archs.Ice_Lake),
+        ]
+    )
+
     def detect_arch(self):
-        if self.device_id in pci_data.intel_ids.gma_950_ids:
-            self.arch = Intel.Archs.GMA_950
-        elif self.device_id in pci_data.intel_ids.gma_x3100_ids:
-            self.arch = Intel.Archs.GMA_X3100
-        elif self.device_id in pci_data.intel_ids.iron_ids:
-            self.arch = Intel.Archs.Iron_Lake
-        elif self.device_id in pci_data.intel_ids.sandy_ids:
-            self.arch = Intel.Archs.Sandy_Bridge
-        elif self.device_id in pci_data.intel_ids.ivy_ids:
-            self.arch = Intel.Archs.Ivy_Bridge
-        elif self.device_id in pci_data.intel_ids.haswell_ids:
-            self.arch = Intel.Archs.Haswell
-        elif self.device_id in pci_data.intel_ids.broadwell_ids:
-            self.arch = Intel.Archs.Broadwell
-        elif self.device_id in pci_data.intel_ids.skylake_ids:
-            self.arch = Intel.Archs.Skylake
-        elif self.device_id in pci_data.intel_ids.kaby_lake_ids:
-            self.arch = Intel.Archs.Kaby_Lake
-        elif self.device_id in pci_data.intel_ids.coffee_lake_ids:
-            self.arch = Intel.Archs.Coffee_Lake
-        elif self.device_id in pci_data.intel_ids.comet_lake_ids:
-            self.arch = Intel.Archs.Comet_Lake
-        elif self.device_id in pci_data.intel_ids.ice_lake_ids:
-            self.arch = Intel.Archs.Ice_Lake
-        else:
-            self.arch = Intel.Archs.Unknown
+        self.arch = Intel.ARCH_TABLE.get(self.device_id, Intel.Archs.Unknown)
 
 
 @dataclass
@@ -295,19 +341,18 @@ class Broadcom(WirelessCard):
 
     chipset: Chipsets = field(init=False)
 
+    CHIPSET_TABLE: ClassVar[dict] = build_id_table(
+        [
+            (pci_data.broadcom_ids.AppleBCMWLANBusInterfacePCIe, Chipsets.AppleBCMWLANBusInterfacePCIe),
+            (pci_data.broadcom_ids.AirPortBrcmNIC, Chipsets.AirportBrcmNIC),
+            (pci_data.broadcom_ids.AirPortBrcm4360, Chipsets.AirPortBrcm4360),
+            (pci_data.broadcom_ids.AirPortBrcm4331, Chipsets.AirPortBrcm4331),
+            (pci_data.broadcom_ids.AppleAirPortBrcm43224, Chipsets.AirPortBrcm43224),
+        ]
+    )
+
     def detect_chipset(self):
-        if self.device_id in pci_data.broadcom_ids.AppleBCMWLANBusInterfacePCIe:
-            self.chipset = Broadcom.Chipsets.AppleBCMWLANBusInterfacePCIe
-        elif self.device_id in pci_data.broadcom_ids.AirPortBrcmNIC:
-            self.chipset = Broadcom.Chipsets.AirportBrcmNIC
-        elif self.device_id in pci_data.broadcom_ids.AirPortBrcm4360:
-            self.chipset = Broadcom.Chipsets.AirPortBrcm4360
-        elif self.device_id in pci_data.broadcom_ids.AirPortBrcm4331:
-            self.chipset = Broadcom.Chipsets.AirPortBrcm4331
-        elif self.device_id in pci_data.broadcom_ids.AppleAirPortBrcm43224:
-            self.chipset = Broadcom.Chipsets.AirPortBrcm43224
-        else:
-            self.chipset = Broadcom.Chipsets.Unknown
+        self.chipset = Broadcom.CHIPSET_TABLE.get(self.device_id, Broadcom.Chipsets.Unknown)
 
 
 @dataclass
@@ -322,11 +367,27 @@ class Atheros(WirelessCard):
 
     chipset: Chipsets = field(init=False)
 
+    CHIPSET_TABLE: ClassVar[dict] = build_id_table(
+        [
+            (pci_data.atheros_ids.AtherosWifi, Chipsets.AirPortAtheros40),
+        ]
+    )
+
     def detect_chipset(self):
-        if self.device_id in pci_data.atheros_ids.AtherosWifi:
-            self.chipset = Atheros.Chipsets.AirPortAtheros40
+        self.chipset = Atheros.CHIPSET_TABLE.get(self.device_id, Atheros.Chipsets.Unknown)
+
+
+def classify_devices(devices: list[PCIDevice], inherits: ClassVar[Any] = None):
+    # Batch form of vendor_detect, ie. for classifying many hardware dumps at once
+    # Returns each device converted to its vendor class (with arch or chipset detected), None if unknown
+    classified: list[Optional[PCIDevice]] = []
+    for device in devices:
+        vendor = device.vendor_detect(inherits=inherits)
+        if vendor:
+            classified.append(vendor(device.vendor_id, device.device_id, device.class_code, name=device.name, model=device.model, acpi_path=device.acpi_path, pci_path=device.pci_path))
         else:
-            self.chipset = Atheros.Chipsets.Unknown
+            classified.append(None)
+    return classified
 
 
 @dataclass
@@ -349,127 +410,87 @@ class Computer:
     @staticmethod
     def probe():
         computer = Computer()
-        computer.gpu_probe()
-        computer.dgpu_probe()
-        computer.igpu_probe()
-        computer.wifi_probe()
-        computer.storage_probe()
-        computer.smbios_probe()
-        computer.cpu_probe()
-        computer.bluetooth_probe()
-        computer.sata_disk_probe()
-        return computer
-
-    def gpu_probe(self):
-        # Chain together two iterators: one for class code 00000300, the other for class code 00800300
-        devices = ioreg.ioiterator_to_list(
-            ioreg.IOServiceGetMatchingServices(
-                ioreg.kIOMasterPortDefault, {"IOProviderClass": "IOPCIDevice", "IOPropertyMatch": [{"class-code": binascii.a2b_hex("00000300")}, {"class-code": binascii.a2b_hex("00800300")}]}, None
-            )[1]
+        # IOKit steps only need the registry snapshot, sysctl and system_profiler run alongside them
+        # Each step fills in separate fields, so steps never touch the same state
+        run_probe_graph(
+            {
+                "snapshot": (lambda: IORegistrySnapshot(ioreg_backend.get_backend().capture()), []),
+                "gpu": (computer.gpu_probe, ["snapshot"]),
+                "dgpu": (computer.dgpu_probe, ["snapshot"]),
+                "igpu": (computer.igpu_probe, ["snapshot"]),
+                "wifi": (computer.wifi_probe, ["snapshot"]),
+                "storage": (computer.storage_probe, ["snapshot"]),
+                "smbios": (computer.smbios_probe, ["snapshot"]),
+                "cpu": (computer.cpu_probe, []),
+                "bluetooth": (computer.bluetooth_probe, []),
+                "sata_disk": (computer.sata_disk_probe, []),
+            }
         )
+        return computer
 
-        for device in devices:
-            vendor: Type[GPU] = PCIDevice.from_ioregistry(device).vendor_detect(inherits=GPU)  # type: ignore
+    def gpu_probe(self, snapshot: IORegistrySnapshot):
+        # Match both class code 00000300 and class code 00800300
+        for node in snapshot.match_class_codes(binascii.a2b_hex("00000300"), binascii.a2b_hex("00800300")):
+            vendor: Type[GPU] = PCIDevice.from_snapshot(snapshot, node).vendor_detect(inherits=GPU)  # type: ignore
             if vendor:
-                self.gpus.append(vendor.from_ioregistry(device))  # type: ignore
-            ioreg.IOObjectRelease(device)
+                self.gpus.append(vendor.from_snapshot(snapshot, node))  # type: ignore
 
-    def dgpu_probe(self):
-        device = next(ioreg.ioiterator_to_list(ioreg.IOServiceGetMatchingServices(ioreg.kIOMasterPortDefault, ioreg.IOServiceNameMatching("GFX0".encode()), None)[1]), None)
-        if not device:
+    def dgpu_probe(self, snapshot: IORegistrySnapshot):
+        node = snapshot.match_name("GFX0")
+        if not node:
             # No devices
             return
 
-        vendor: Type[GPU] = PCIDevice.from_ioregistry(device).vendor_detect(inherits=GPU)  # type: ignore
+        vendor: Type[GPU] = PCIDevice.from_snapshot(snapshot, node).vendor_detect(inherits=GPU)  # type: ignore
         if vendor:
-            self.dgpu = vendor.from_ioregistry(device)  # type: ignore
-        ioreg.IOObjectRelease(device)
+            self.dgpu = vendor.from_snapshot(snapshot, node)  # type: ignore
 
-    def igpu_probe(self):
-        device = next(ioreg.ioiterator_to_list(ioreg.IOServiceGetMatchingServices(ioreg.kIOMasterPortDefault, ioreg.IOServiceNameMatching("IGPU".encode()), None)[1]), None)
-        if not device:
+    def igpu_probe(self, snapshot: IORegistrySnapshot):
+        node = snapshot.match_name("IGPU")
+        if not node:
             # No devices
             return
 
-        vendor: Type[GPU] = PCIDevice.from_ioregistry(device).vendor_detect(inherits=GPU)  # type: ignore
+        vendor: Type[GPU] = PCIDevice.from_snapshot(snapshot, node).vendor_detect(inherits=GPU)  # type: ignore
         if vendor:
-            self.igpu = vendor.from_ioregistry(device)  # type: ignore
-        ioreg.IOObjectRelease(device)
+            self.igpu = vendor.from_snapshot(snapshot, node)  # type: ignore
 
-    def wifi_probe(self):
+    def wifi_probe(self, snapshot: IORegistrySnapshot):
         # result = subprocess.run("ioreg -r -c IOPCIDevice -a -d2".split(), stdout=subprocess.PIPE).stdout.strip()
-        devices = ioreg.ioiterator_to_list(
-            ioreg.IOServiceGetMatchingServices(
-                ioreg.kIOMasterPortDefault,
-                {"IOProviderClass": "IOPCIDevice", "IOPropertyMatch": {"class-code": binascii.a2b_hex(utilities.hexswap(hex(WirelessCard.CLASS_CODE)[2:].zfill(8)))}},
-                None,
-            )[1]
-        )
-
-        for device in devices:
-            vendor: Type[WirelessCard] = PCIDevice.from_ioregistry(device, anti_spoof=True).vendor_detect(inherits=WirelessCard)  # type: ignore
+        for node in snapshot.match_class_codes(binascii.a2b_hex(utilities.hexswap(hex(WirelessCard.CLASS_CODE)[2:].zfill(8)))):
+            vendor: Type[WirelessCard] = PCIDevice.from_snapshot(snapshot, node, anti_spoof=True).vendor_detect(inherits=WirelessCard)  # type: ignore
             if vendor:
-                self.wifi = vendor.from_ioregistry(device, anti_spoof=True)  # type: ignore
+                self.wifi = vendor.from_snapshot(snapshot, node, anti_spoof=True)  # type: ignore
                 break
-            ioreg.IOObjectRelease(device)
-
-    def storage_probe(self):
-        sata_controllers = ioreg.ioiterator_to_list(
-            ioreg.IOServiceGetMatchingServices(
-                ioreg.kIOMasterPortDefault,
-                {"IOProviderClass": "IOPCIDevice", "IOPropertyMatch": [{"class-code": binascii.a2b_hex(utilities.hexswap(hex(SATAController.CLASS_CODE)[2:].zfill(8)))}]},
-                None,
-            )[1]
-        )
-        sas_controllers = ioreg.ioiterator_to_list(
-            ioreg.IOServiceGetMatchingServices(
-                ioreg.kIOMasterPortDefault,
-                {"IOProviderClass": "IOPCIDevice", "IOPropertyMatch": [{"class-code": binascii.a2b_hex(utilities.hexswap(hex(SASController.CLASS_CODE)[2:].zfill(8)))}]},
-                None,
-            )[1]
-        )
 
-        nvme_controllers = ioreg.ioiterator_to_list(
-            ioreg.IOServiceGetMatchingServices(
-                ioreg.kIOMasterPortDefault, {"IOProviderClass": "IONVMeController", "IOParentMatch": {"IOProviderClass": "IOPCIDevice"}, "IOPropertyMatch": {"IOClass": "IONVMeController"}}, None
-            )[1]
-        )
-        for device in sata_controllers:
-            self.storage.append(SATAController.from_ioregistry(device))
-            ioreg.IOObjectRelease(device)
-        
-        for device in sas_controllers:
-            self.storage.append(SASController.from_ioregistry(device))
-            ioreg.IOObjectRelease(device)
+    def storage_probe(self, snapshot: IORegistrySnapshot):
+        for node in snapshot.match_class_codes(binascii.a2b_hex(utilities.hexswap(hex(SATAController.CLASS_CODE)[2:].zfill(8)))):
+            self.storage.append(SATAController.from_snapshot(snapshot, node))
 
-        for device in nvme_controllers:
-            parent = ioreg.IORegistryEntryGetParentEntry(device, "IOService".encode(), None)[1]
-            ioreg.IOObjectRelease(device)
+        for node in snapshot.match_class_codes(binascii.a2b_hex(utilities.hexswap(hex(SASController.CLASS_CODE)[2:].zfill(8)))):
+            self.storage.append(SASController.from_snapshot(snapshot, node))
 
-            aspm: Union[int, bytes] = ioreg.corefoundation_to_native(ioreg.IORegistryEntryCreateCFProperty(parent, "pci-aspm-default", ioreg.kCFAllocatorDefault, ioreg.kNilOptions)) or 0  # type: ignore
+        for node in snapshot.nvme_controllers:
+            aspm: Union[int, bytes] = node.properties.get("pci-aspm-default") or 0
             if isinstance(aspm, bytes):
                 aspm = int.from_bytes(aspm, byteorder="little")
 
-            controller = NVMeController.from_ioregistry(parent)
+            controller = NVMeController.from_snapshot(snapshot, node)
             controller.aspm = aspm
 
             if controller.vendor_id != 0x106B:
                 # Handle Apple Vendor ID
                 self.storage.append(controller)
 
-            ioreg.IOObjectRelease(parent)
-
-    def smbios_probe(self):
+    def smbios_probe(self, snapshot: IORegistrySnapshot):
         # Reported model
-        entry = next(ioreg.ioiterator_to_list(ioreg.IOServiceGetMatchingServices(ioreg.kIOMasterPortDefault, ioreg.IOServiceMatching("IOPlatformExpertDevice".encode()), None)[1]))
-        self.reported_model = ioreg.corefoundation_to_native(ioreg.IORegistryEntryCreateCFProperty(entry, "model", ioreg.kCFAllocatorDefault, ioreg.kNilOptions)).strip(b"\0").decode()  # type: ignore
-        translated = subprocess.run("sysctl -in sysctl.proc_translated".split(), stdout=subprocess.PIPE).stdout.decode()
+        self.reported_model = snapshot.platform_properties["model"].strip(b"\0").decode()
+        translated = ioreg_backend.get_backend().run_command("sysctl -in sysctl.proc_translated".split()).decode()
         if translated:
             board = "target-type"
         else:
             board = "board-id"
-        self.reported_board_id = ioreg.corefoundation_to_native(ioreg.IORegistryEntryCreateCFProperty(entry, board, ioreg.kCFAllocatorDefault, ioreg.kNilOptions)).strip(b"\0").decode()  # type: ignore
-        ioreg.IOObjectRelease(entry)
+        self.reported_board_id = snapshot.platform_properties[board].strip(b"\0").decode()
 
         # Real model
         # TODO: We previously had logic for OC users using iMacPro1,1 with incorrect ExposeSensitiveData. Add logic?
@@ -482,12 +503,12 @@ class Computer:
 
     def cpu_probe(self):
         self.cpu = CPU(
-            subprocess.run("sysctl machdep.cpu.brand_string".split(), stdout=subprocess.PIPE).stdout.decode().partition(": ")[2].strip(),
-            subprocess.run("sysctl machdep.cpu.features".split(), stdout=subprocess.PIPE).stdout.decode().partition(": ")[2].strip().split(" "),
+            ioreg_backend.get_backend().run_command("sysctl machdep.cpu.brand_string".split()).decode().partition(": ")[2].strip(),
+            ioreg_backend.get_backend().run_command("sysctl machdep.cpu.features".split()).decode().partition(": ")[2].strip().split(" "),
         )
 
     def bluetooth_probe(self):
-        usb_data: str = subprocess.run("system_profiler SPUSBDataType".split(), stdout=subprocess.PIPE, stderr=subprocess.STDOUT).stdout.decode()
+        usb_data: str = ioreg_backend.get_backend().run_command("system_profiler SPUSBDataType".split(), merge_stderr=True).decode()
         if "BRCM20702 Hub" in usb_data:
             self.bluetooth_chipset = "BRCM20702 Hub"
         elif "BCM20702A0" in usb_data or "BCM2045A0" in usb_data:
@@ -502,7 +523,11 @@ class Computer:
     def sata_disk_probe(self):
         # Get all SATA Controllers/Disks from 'system_profiler SPSerialATADataType'
         # Determine whether SATA SSD is present and Apple-made
-        sp_sata_data = plistlib.loads(subprocess.run(f"system_profiler SPSerialATADataType -xml".split(), stdout=subprocess.PIPE).stdout.decode().strip().encode())
+        sp_sata_output = ioreg_backend.get_backend().run_command(f"system_profiler SPSerialATADataType -xml".split()).decode().strip().encode()
+        if not sp_sata_output:
+            # No output to parse, ie. a replayed recording without this command
+            return
+        sp_sata_data = plistlib.loads(sp_sata_output)
         for root in sp_sata_data:
             for ahci_controller in root["_items"]:
                 # Each AHCI controller will have its own entry
@@ -0,0 +1,220 @@
+# Download engine for utilities.download_file()
+# Large files are fetched as byte ranges over several pooled connections, with progress saved next to the
+# partial file so interrupted downloads resume (ie. 12GB InstallAssistant.pkg)
+# Servers without range support are downloaded as a single stream
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# Ranges are fetched in segments of this size, progress is tracked per segment
+SEGMENT_SIZE = 1024 * 1024 * 16
+CONNECTIONS = 4
+# Attempts per segment before giving up, each attempt continues where the last one stopped
+SEGMENT_ATTEMPTS = 5
+CHUNK_SIZE = 1024 * 1024
+TIMEOUT = (10, 60)
+# Returned once a signed redirect target expires, ie. GitHub release assets served from S3
+EXPIRED_STATUS_CODES = [403]
+
+
+class RangeNotSatisfied(Exception):
+    pass
+
+
+class FileChanged(Exception):
+    pass
+
+
+class Download:
+    def __init__(self, requests, link, location, connections=CONNECTIONS):
+        self.requests = requests
+        self.link = link
+        self.location = Path(location)
+        self.connections = connections
+        self.partial_path = self.location.with_name(f"{self.location.name}.partial")
+        self.state_path = self.location.with_name(f"{self.location.name}.partial.json")
+        self.url = link
+        self.total_size = 0
+        self.ranged = False
+        self.validator = None
+        self.segments = []
+        self.downloaded = 0
+        self.resumed = 0
+        self.lock = threading.Lock()
+        self.resolve_lock = threading.Lock()
+        self.stop = threading.Event()
+
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=connections)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def probe(self):
+        # Single HEAD, following redirects to where the ranges are served from
+        try:
+            response = self.session.head(self.link, allow_redirects=True, timeout=5)
+        except (self.requests.exceptions.Timeout, self.requests.exceptions.TooManyRedirects, self.requests.exceptions.ConnectionError, self.requests.exceptions.HTTPError):
+            return False
+        self.url = response.url
+        try:
+            # Handle cases where Content-Length has garbage or is missing
+            self.total_size = int(response.headers["Content-Length"])
+        except (KeyError, ValueError):
+            self.total_size = 0
+        self.ranged = response.status_code == 200 and self.total_size > 0 and response.headers.get("Accept-Ranges", "").lower() == "bytes"
+        # Resuming is only safe while the file on the server is unchanged
+        self.validator = response.headers.get("ETag") or response.headers.get("Last-Modified")
+        return True
+
+    def resolve(self, expired_url):
+        # Redirects are followed again from the original link, the file itself must not have changed
+        # Segments failing together only resolve once
+        with self.resolve_lock:
+            if self.url != expired_url:
+                return
+            response = self.session.head(self.link, allow_redirects=True, timeout=5)
+            response.raise_for_status()
+            if (response.headers.get("ETag") or response.headers.get("Last-Modified")) != self.validator:
+                raise FileChanged(f"{self.link} changed on the server")
+            self.url = response.url
+
+    def load_state(self):
+        try:
+            state = json.loads(self.state_path.read_text())
+        except (OSError, ValueError):
+            return None
+        if [state.get("Link"), state.get("Size"), state.get("Validator"), state.get("Segment Size")] != [self.link, self.total_size, self.validator, SEGMENT_SIZE]:
+            return None
+        if not self.partial_path.exists() or self.partial_path.stat().st_size != self.total_size:
+            return None
+        return state["Segments"]
+
+    def save_state(self):
+        # Only the original link is saved, redirect targets may be signed and expire before resuming
+        with self.lock:
+            state = {"Link": self.link, "Size": self.total_size, "Validator": self.validator, "Segment Size": SEGMENT_SIZE, "Segments": list(self.segments)}
+        staging_path = self.state_path.with_name(f"{self.state_path.name}.tmp")
+        staging_path.write_text(json.dumps(state))
+        os.replace(staging_path, self.state_path)
+
+    def clear_state(self):
+        self.state_path.unlink(missing_ok=True)
+        self.partial_path.unlink(missing_ok=True)
+
+    def fetch_segment(self, index):
+        start = index * SEGMENT_SIZE
+        end = min(start + SEGMENT_SIZE, self.total_size) - 1
+        for attempt in range(SEGMENT_ATTEMPTS):
+            if self.stop.is_set():
+                return
+            offset = start + self.segments[index]
+            if offset > end:
+                return
+            url = self.url
+            try:
+                response = self.session.get(url, headers={"Range": f"bytes={offset}-{end}"}, stream=True, timeout=TIMEOUT)
+                response.raise_for_status()
+                if response.status_code != 206:
+                    # Server ignored the range, ie. a mirror without Accept-Ranges behind a redirect
+                    raise RangeNotSatisfied(f"Server returned {response.status_code} for a ranged request")
+                # Unbuffered, progress saved to disk never runs ahead of the data written
+                with self.partial_path.open("r+b", buffering=0) as file:
+                    file.seek(offset)
+                    for chunk in response.iter_content(CHUNK_SIZE):
+                        if self.stop.is_set():
+                            return
+                        chunk = chunk[: end + 1 - offset]
+                        file.write(chunk)
+                        offset += len(chunk)
+                        with self.lock:
+                            self.segments[index] = offset - start
+                            self.downloaded += len(chunk)
+                if offset > end:
+                    return
+            except self.requests.exceptions.RequestException as error:
+                if attempt == SEGMENT_ATTEMPTS - 1:
+                    raise
+                if getattr(error.response, "status_code", None) in EXPIRED_STATUS_CODES:
+                    # Long or resumed downloads outlive the signed URL, retry right away with a fresh one
+                    self.resolve(url)
+                    continue
+                time.sleep(2 ** attempt)
+        raise self.requests.exceptions.ConnectionError(f"Segment {index} of {self.link} could not be completed")
+
+    def run_ranged(self, progress):
+        segments = self.load_state()
+        if segments is None:
+            self.clear_state()
+            with self.partial_path.open("wb") as file:
+                file.truncate(self.total_size)
+            segments = [0] * -(-self.total_size // SEGMENT_SIZE)
+        self.segments = segments
+        self.resumed = sum(segments)
+        self.save_state()
+
+        with ThreadPoolExecutor(max_workers=self.connections) as executor:
+            futures = [executor.submit(self.fetch_segment, index) for index in range(len(self.segments))]
+            try:
+                while True:
+                    # First failed segment ends the download
+                    finished = [future for future in futures if future.done()]
+                    for future in finished:
+                        future.result()
+                    if len(finished) == len(futures):
+                        break
+                    time.sleep(0.5)
+                    progress(self.resumed + self.downloaded, self.total_size)
+                    self.save_state()
+            except BaseException:
+                # Remaining segments stop early, progress so far is kept for resuming
+                self.stop.set()
+                executor.shutdown(wait=True)
+                self.save_state()
+                raise
+        progress(self.total_size, self.total_size)
+
+    def run_stream(self, progress):
+        self.clear_state()
+        response = self.session.get(self.url, stream=True, timeout=TIMEOUT)
+        response.raise_for_status()
+        with self.partial_path.open("wb") as file:
+            for chunk in response.iter_content(CHUNK_SIZE * 4):
+                file.write(chunk)
+                self.downloaded += len(chunk)
+                progress(self.downloaded, self.total_size)
+
+    def run(self, progress):
+        # progress(downloaded, total) is called periodically, total is 0 when unknown
+        # Returns whether the file was downloaded to location
+        try:
+            if self.ranged:
+                try:
+                    self.run_ranged(progress)
+                except RangeNotSatisfied:
+                    print("- Server does not support ranged downloads, downloading as a single stream")
+                    self.stop.clear()
+                    self.downloaded = 0
+                    self.run_stream(progress)
+            else:
+                self.run_stream(progress)
+        except FileChanged as error:
+            print(f"- Download interrupted: {error}")
+            # Progress belongs to the old file
+            self.clear_state()
+            return False
+        except (self.requests.exceptions.RequestException, OSError) as error:
+            print(f"- Download interrupted: {error}")
+            if self.state_path.exists():
+                print("- Progress saved, downloading again will resume")
+            return False
+        if self.total_size and self.partial_path.stat().st_size != self.total_size:
+            print(f"- Download incomplete, expected {self.total_size} bytes")
+            self.clear_state()
+            return False
+        os.replace(self.partial_path, self.location)
+        self.state_path.unlink(missing_ok=True)
+        return True
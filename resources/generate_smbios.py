@@ -1,5 +1,5 @@
 from data import smbios_data, os_data, cpu_data
-from resources import utilities
+from resources import utilities, smbios_catalog
 
 
 def set_smbios_model_spoof(model):
@@ -94,16 +94,13 @@ def find_model_off_board(board):
             board = board[:-2]
         board = board.lower()
 
-    for key in smbios_data.smbios_dictionary:
-        if board in [smbios_data.smbios_dictionary[key]["Board ID"], smbios_data.smbios_dictionary[key]["SecureBootModel"]]:
-            if key.endswith("_v2") or key.endswith("_v3") or key.endswith("_v4"):
-                # smbios_data has duplicate SMBIOS to handle multiple board IDs
-                key = key[:-3]
-            if key == "MacPro4,1":
-                # 4,1 and 5,1 have the same board ID, best to return the newer ID
-                key = "MacPro5,1"
-            return key
-    return None
+    record = smbios_catalog.catalog.find_by_board(board)
+    if record is None:
+        return None
+    if record.canonical_model == "MacPro4,1":
+        # 4,1 and 5,1 have the same board ID, best to return the newer ID
+        return "MacPro5,1"
+    return record.canonical_model
 
 def check_firewire(model):
     # MacBooks never supported FireWire
@@ -0,0 +1,225 @@
+# IORegistry backends for hardware probing
+# Live backend reads IOKit through PyObjC, replay backend serves a registry recorded on another machine
+# Allows device probing to be exercised off a Mac, ie. CI on Linux
+
+import platform
+import plistlib
+import subprocess
+from pathlib import Path
+
+# Bumped whenever the recorded layout changes
+REGISTRY_VERSION = 1
+
+backend = None
+
+
+def get_backend():
+    global backend
+    if backend is None:
+        backend = IOKitBackend()
+    return backend
+
+
+def set_backend(new_backend):
+    global backend
+    backend = new_backend
+
+
+class IOKitBackend:
+    # Live registry of the running machine
+
+    def __init__(self):
+        # PyObjC and the IOKit bundle are only available on macOS, load them on first use
+        from resources import ioreg
+
+        self.ioreg = ioreg
+
+    def capture(self):
+        # Single walk of the IOService plane, shared ancestors are only visited once
+        ioreg = self.ioreg
+        registry = {
+            "Version": REGISTRY_VERSION,
+            "Entries": {},
+            "PCI Devices": [],
+            "NVMe Controllers": [],
+            "Country Codes": {},
+            "Platform": {},
+        }
+
+        for entry in ioreg.ioiterator_to_list(ioreg.IOServiceGetMatchingServices(ioreg.kIOMasterPortDefault, {"IOProviderClass": "IOPCIDevice"}, None)[1]):
+            registry["PCI Devices"].append(self.add_entry(registry, entry))
+            ioreg.IOObjectRelease(entry)
+
+        for entry in ioreg.ioiterator_to_list(
+            ioreg.IOServiceGetMatchingServices(
+                ioreg.kIOMasterPortDefault, {"IOProviderClass": "IONVMeController", "IOParentMatch": {"IOProviderClass": "IOPCIDevice"}, "IOPropertyMatch": {"IOClass": "IONVMeController"}}, None
+            )[1]
+        ):
+            parent = ioreg.IORegistryEntryGetParentEntry(entry, "IOService".encode(), None)[1]
+            ioreg.IOObjectRelease(entry)
+            registry["NVMe Controllers"].append(self.add_entry(registry, parent))
+            ioreg.IOObjectRelease(parent)
+
+        for entry in ioreg.ioiterator_to_list(ioreg.IOServiceGetMatchingServices(ioreg.kIOMasterPortDefault, {"IOProviderClass": "IO80211Interface"}, None)[1]):
+            country_code = ioreg.corefoundation_to_native(ioreg.IORegistryEntryCreateCFProperty(entry, "IO80211CountryCode", ioreg.kCFAllocatorDefault, ioreg.kNilOptions))
+            # Attribute the interface to the closest PCI device above it
+            current = ioreg.IORegistryEntryGetParentEntry(entry, "IOService".encode(), None)[1]
+            ioreg.IOObjectRelease(entry)
+            while current:
+                current_id = str(ioreg.IORegistryEntryGetRegistryEntryID(current, None)[1])
+                if registry["Entries"].get(current_id, {}).get("Kind") == "pci":
+                    if country_code is not None:
+                        registry["Country Codes"].setdefault(current_id, country_code)
+                    ioreg.IOObjectRelease(current)
+                    break
+                parent = ioreg.IORegistryEntryGetParentEntry(current, "IOService".encode(), None)[1]
+                ioreg.IOObjectRelease(current)
+                current = parent
+
+        entry = next(ioreg.ioiterator_to_list(ioreg.IOServiceGetMatchingServices(ioreg.kIOMasterPortDefault, ioreg.IOServiceMatching("IOPlatformExpertDevice".encode()), None)[1]))
+        for key in ["model", "board-id", "target-type"]:
+            value = ioreg.corefoundation_to_native(ioreg.IORegistryEntryCreateCFProperty(entry, key, ioreg.kCFAllocatorDefault, ioreg.kNilOptions))
+            if value is not None:
+                registry["Platform"][key] = value
+        ioreg.IOObjectRelease(entry)
+
+        return registry
+
+    def create_entry(self, registry, entry, entry_id):
+        ioreg = self.ioreg
+        if ioreg.IOObjectConformsTo(entry, "IOPCIDevice".encode()):
+            node = {
+                "Kind": "pci",
+                "Name": ioreg.io_name_t_to_str(ioreg.IORegistryEntryGetName(entry, None)[1]),
+                "Location": ioreg.io_name_t_to_str(ioreg.IORegistryEntryGetLocationInPlane(entry, "IOService".encode(), None)[1]),
+                "Properties": ioreg.corefoundation_to_native(ioreg.IORegistryEntryCreateCFProperties(entry, None, ioreg.kCFAllocatorDefault, ioreg.kNilOptions)[1]),
+            }
+        elif ioreg.IOObjectConformsTo(entry, "IOACPIPlatformDevice".encode()):
+            node = {"Kind": "acpi", "UID": hex(int(ioreg.corefoundation_to_native(ioreg.IORegistryEntryCreateCFProperty(entry, "_UID", ioreg.kCFAllocatorDefault, ioreg.kNilOptions)) or 0))}
+        elif ioreg.IOObjectConformsTo(entry, "IOPCIBridge".encode()):
+            node = {"Kind": "bridge"}
+        else:
+            node = {"Kind": "other"}
+        registry["Entries"][entry_id] = node
+        return node
+
+    def add_entry(self, registry, original_entry):
+        # Records the entry and any ancestors not seen yet, up to the PCI root
+        # Entry IDs are stored as strings, plist keys cannot be integers
+        ioreg = self.ioreg
+        entry_id = str(ioreg.IORegistryEntryGetRegistryEntryID(original_entry, None)[1])
+        if entry_id in registry["Entries"]:
+            return entry_id
+
+        node = self.create_entry(registry, original_entry, entry_id)
+        entry = original_entry
+        while node["Kind"] in ["pci", "bridge"]:
+            parent = ioreg.IORegistryEntryGetParentEntry(entry, "IOService".encode(), None)[1]
+            if entry != original_entry:
+                ioreg.IOObjectRelease(entry)
+            entry = parent
+            if not entry:
+                break
+            parent_id = str(ioreg.IORegistryEntryGetRegistryEntryID(entry, None)[1])
+            node["Parent"] = parent_id
+            if parent_id in registry["Entries"]:
+                break
+            node = self.create_entry(registry, entry, parent_id)
+        if entry and entry != original_entry:
+            ioreg.IOObjectRelease(entry)
+        return entry_id
+
+    def device_tree_properties(self, path):
+        ioreg = self.ioreg
+        entry = ioreg.IORegistryEntryFromPath(ioreg.kIOMasterPortDefault, f"IODeviceTree:{path}".encode())
+        properties = ioreg.corefoundation_to_native(ioreg.IORegistryEntryCreateCFProperties(entry, None, ioreg.kCFAllocatorDefault, ioreg.kNilOptions)[1]) or {}
+        ioreg.IOObjectRelease(entry)
+        return properties
+
+    def device_tree_property(self, path, key):
+        ioreg = self.ioreg
+        entry = ioreg.IORegistryEntryFromPath(ioreg.kIOMasterPortDefault, f"IODeviceTree:{path}".encode())
+        value = ioreg.IORegistryEntryCreateCFProperty(entry, key, ioreg.kCFAllocatorDefault, ioreg.kNilOptions)
+        ioreg.IOObjectRelease(entry)
+        if not value:
+            return None
+        return ioreg.corefoundation_to_native(value)
+
+    def get_nvram(self, key):
+        return self.device_tree_property("/options", key)
+
+    def get_rom(self, key):
+        return self.device_tree_property("/rom", key)
+
+    def run_command(self, command, merge_stderr=False):
+        return subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT if merge_stderr else None).stdout
+
+    def kernel_release(self):
+        return platform.uname().release
+
+
+class RecordingBackend(IOKitBackend):
+    # Live backend which remembers every command run, so the probe can be replayed later
+
+    def __init__(self):
+        super().__init__()
+        self.commands = {}
+
+    def run_command(self, command, merge_stderr=False):
+        output = super().run_command(command, merge_stderr)
+        self.commands[" ".join(command)] = output
+        return output
+
+    def record(self, path):
+        registry = self.capture()
+        registry["NVRAM"] = self.device_tree_properties("/options")
+        registry["ROM"] = self.device_tree_properties("/rom")
+        registry["Commands"] = self.commands
+        registry["Kernel Release"] = self.kernel_release()
+        Path(path).write_bytes(plistlib.dumps(registry, sort_keys=True))
+        print(f"- Saved IORegistry recording to {path}")
+
+
+class ReplayBackend:
+    # Serves a registry previously saved by RecordingBackend.record()
+
+    def __init__(self, path):
+        self.registry = plistlib.loads(Path(path).read_bytes())
+        if self.registry.get("Version") != REGISTRY_VERSION:
+            raise Exception(f"Unsupported IORegistry recording version: {self.registry.get('Version')}")
+
+    def capture(self):
+        return self.registry
+
+    def get_nvram(self, key):
+        return self.registry["NVRAM"].get(key) or None
+
+    def get_rom(self, key):
+        return self.registry["ROM"].get(key) or None
+
+    def run_command(self, command, merge_stderr=False):
+        # Commands missing from the recording behave like a tool without output
+        return self.registry["Commands"].get(" ".join(command), b"")
+
+    def kernel_release(self):
+        return self.registry["Kernel Release"]
+
+
+class HeadlessBackend:
+    # Stands in for the host when building for another model, nothing is read from the running machine
+    # Keeps host NVRAM (ie. boot-args) from leaking into another machine's config, and works off macOS
+
+    def capture(self):
+        return {"Version": REGISTRY_VERSION, "Entries": {}, "PCI Devices": [], "NVMe Controllers": [], "Country Codes": {}, "Platform": {}}
+
+    def get_nvram(self, key):
+        return None
+
+    def get_rom(self, key):
+        return None
+
+    def run_command(self, command, merge_stderr=False):
+        return b""
+
+    def kernel_release(self):
+        return "0.0.0"
@@ -6,11 +6,16 @@ import subprocess
 import sys
 from pathlib import Path
 
-from resources import build, cli_menu, constants, utilities, device_probe, os_probe, defaults, arguments, install
+from resources import build, constants, utilities, os_probe, defaults, arguments, ioreg_backend, probe_cache, device_probe
 from data import model_array
 
 class OpenCoreLegacyPatcher:
     def __init__(self, launch_gui=False):
+        if utilities.parse_cli_args().privileged_helper:
+            # Spawned through sudo by sys_patch, runs a single batch of file operations and exits
+            from resources import privileged_helper
+            privileged_helper.serve()
+            return
         print("- Loading...")
         self.constants = constants.Constants()
         self.generate_base_data()
@@ -22,10 +27,31 @@ class OpenCoreLegacyPatcher:
                 self.main_menu()
 
     def generate_base_data(self):
-        self.constants.detected_os = os_probe.detect_kernel_major()
-        self.constants.detected_os_minor = os_probe.detect_kernel_minor()
-        self.constants.detected_os_build = os_probe.detect_kernel_build()
-        self.constants.computer = device_probe.Computer.probe()
+        cli_args = utilities.parse_cli_args()
+        # Headless builds for another model and validation only need smbios_data and example_data,
+        # the host's hardware is never consulted (ie. CI on Linux)
+        headless = bool((((cli_args.build or cli_args.plan) and cli_args.model) or cli_args.validate) and not cli_args.ioreg_replay and not cli_args.ioreg_record)
+        if headless:
+            if cli_args.validate:
+                print("- Skipping hardware probe, validating")
+            else:
+                print(f"- Skipping hardware probe, {'planning' if cli_args.plan else 'building'} for {cli_args.model}")
+            ioreg_backend.set_backend(ioreg_backend.HeadlessBackend())
+        elif cli_args.ioreg_replay:
+            print(f"- Replaying IORegistry from {cli_args.ioreg_replay}")
+            ioreg_backend.set_backend(ioreg_backend.ReplayBackend(cli_args.ioreg_replay))
+        elif cli_args.ioreg_record:
+            ioreg_backend.set_backend(ioreg_backend.RecordingBackend())
+        if headless:
+            # Host OS is left at its defaults, it does not describe the target
+            self.constants.computer = device_probe.Computer()
+        else:
+            self.constants.detected_os = os_probe.detect_kernel_major()
+            self.constants.detected_os_minor = os_probe.detect_kernel_minor()
+            self.constants.detected_os_build = os_probe.detect_kernel_build()
+            self.constants.computer = probe_cache.ProbeCache(self.constants).probe(reprobe=cli_args.reprobe)
+        if cli_args.ioreg_record and not cli_args.ioreg_replay:
+            ioreg_backend.get_backend().record(cli_args.ioreg_record)
         self.constants.recovery_status = utilities.check_recovery()
         self.computer = self.constants.computer
         launcher_script = None
@@ -37,7 +63,9 @@ class OpenCoreLegacyPatcher:
                 launcher_script = launcher_script.replace("/resources/main.py", "/OpenCore-Patcher-GUI.command")
         self.constants.launcher_binary = launcher_binary
         self.constants.launcher_script = launcher_script
-        defaults.generate_defaults.probe(self.computer.real_model, True, self.constants)
+        if not headless:
+            # Custom models are handled by arguments instead
+            defaults.generate_defaults.probe(self.computer.real_model, True, self.constants)
         if utilities.check_cli_args() is not None:
             print("- Detected arguments, switching to CLI mode")
             self.constants.gui_mode = True  # Assumes no user interaction is required
@@ -50,6 +78,9 @@ class OpenCoreLegacyPatcher:
             print("- No arguments present, loading TUI")
 
     def main_menu(self):
+        # TUI only modules, kept out of the headless startup path
+        from resources import cli_menu, install
+
         response = None
         while not (response and response == -1):
             title = [
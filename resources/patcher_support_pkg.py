@@ -0,0 +1,214 @@
+# PatcherSupportPkg payload handling
+# Downloads are kept in a local store keyed by PatcherSupportPkg version and OS, payloads are inflated once into
+# SHA-256 addressed objects and hardlinked into place, only for the payloads a patch set uses
+# Avoids re-downloading or expanding the whole archive (several hundred MB) on the slow disks of most supported Macs
+
+import hashlib
+import json
+import os
+import shutil
+import stat
+import time
+import zipfile
+from pathlib import Path
+
+from resources import build_cache, constants
+
+# Least recently used versions are evicted past this size, the version in use is always kept
+STORE_LIMIT = 2 * 1024 * 1024 * 1024
+
+
+def member_path(member):
+    # Release zips hold a single root folder named after the OS, ie. 12-Monterey/Extensions/...
+    root, _, relative_path = member.filename.partition("/")
+    relative_path = relative_path.rstrip("/")
+    if not relative_path or root == "__MACOSX":
+        return None
+    if relative_path.startswith("/") or ".." in relative_path.split("/"):
+        raise Exception(f"Unsafe path in PatcherSupportPkg: {member.filename}")
+    return relative_path
+
+
+def member_mode(member):
+    # Zips created on macOS keep the full st_mode in the upper bits
+    return member.external_attr >> 16
+
+
+def selected(relative_path, payloads):
+    return any(relative_path == payload or relative_path.startswith(payload + "/") for payload in payloads)
+
+
+def write_json(path, data):
+    staging_path = Path(path).with_name(f"{Path(path).name}.{os.getpid()}.tmp")
+    staging_path.write_text(json.dumps(data, indent=4, sort_keys=True))
+    os.replace(staging_path, path)
+
+
+class SupportPkgStore:
+    def __init__(self, versions, os_version):
+        self.constants: constants.Constants = versions
+        self.os_version = os_version  # Release zip name, ie. 12-Monterey
+
+    def store_path(self):
+        return Path(self.constants.support_pkg_store_path)
+
+    def entry_path(self):
+        return self.store_path() / Path(f"{self.constants.patcher_support_pkg_version}-{self.os_version}")
+
+    def object_path(self, file_hash):
+        return self.store_path() / Path("Objects") / Path(file_hash[:2]) / Path(file_hash)
+
+    def manifests(self):
+        for manifest_path in self.store_path().glob("*/manifest.json"):
+            try:
+                yield manifest_path.parent, json.loads(manifest_path.read_text())
+            except (OSError, ValueError):
+                continue
+
+    def load(self):
+        try:
+            return json.loads((self.entry_path() / Path("manifest.json")).read_text())
+        except (OSError, ValueError):
+            return None
+
+    def available(self):
+        manifest = self.load()
+        if manifest is None or not (self.entry_path() / Path("Archive.zip")).exists():
+            return False
+        return (self.entry_path() / Path("Archive.zip")).stat().st_size == manifest["archive_size"]
+
+    def remove(self):
+        shutil.rmtree(self.entry_path(), ignore_errors=True)
+
+    def add_archive(self, archive_path, archive_hash=None):
+        # Takes ownership of archive_path, only the central directory is read
+        if archive_hash is None:
+            archive_hash = build_cache.hash_file(archive_path)
+        # Payloads unchanged since other stored versions are reused without inflating them again
+        known_hashes = {}
+        for _, manifest in self.manifests():
+            for relative_path, file in manifest["files"].items():
+                if file["hash"] and self.object_path(file["hash"]).exists():
+                    known_hashes[(relative_path, file["size"], file["crc"])] = file["hash"]
+
+        manifest = {
+            "version": self.constants.patcher_support_pkg_version,
+            "os": self.os_version,
+            "archive_hash": archive_hash,
+            "archive_size": Path(archive_path).stat().st_size,
+            "last_used": time.time(),
+            "directories": [],
+            "symlinks": {},
+            "files": {},
+        }
+        with zipfile.ZipFile(archive_path) as archive:
+            for member in archive.infolist():
+                relative_path = member_path(member)
+                if relative_path is None:
+                    continue
+                if member.is_dir():
+                    manifest["directories"].append(relative_path)
+                elif stat.S_ISLNK(member_mode(member)):
+                    manifest["symlinks"][relative_path] = archive.read(member).decode()
+                else:
+                    manifest["files"][relative_path] = {
+                        "member": member.filename,
+                        "size": member.file_size,
+                        "crc": member.CRC,
+                        "mode": stat.S_IMODE(member_mode(member)) or 0o644,
+                        # Same timestamps on every install, letting root patching skip unchanged files without hashing
+                        "modified": time.mktime(member.date_time + (0, 0, -1)),
+                        "hash": known_hashes.get((relative_path, member.file_size, member.CRC)),
+                    }
+
+        self.remove()
+        self.entry_path().mkdir(parents=True)
+        # Downloads may sit on another volume, ie. the app's temporary folder
+        shutil.move(archive_path, self.entry_path() / Path("Archive.zip"))
+        write_json(self.entry_path() / Path("manifest.json"), manifest)
+        print(f"- Stored PatcherSupportPkg {manifest['version']} for {self.os_version}")
+        self.evict()
+
+    def inflate(self, archive, relative_path, file):
+        # zipfile checks the CRC once a member is fully read, a mismatch raises BadZipFile
+        staging_path = self.store_path() / Path("Objects") / Path(f"{os.getpid()}.tmp")
+        staging_path.parent.mkdir(parents=True, exist_ok=True)
+        checksum = hashlib.sha256()
+        try:
+            with archive.open(file["member"]) as source, staging_path.open("wb") as destination:
+                chunk = source.read(1024 * 1024)
+                while chunk:
+                    checksum.update(chunk)
+                    destination.write(chunk)
+                    chunk = source.read(1024 * 1024)
+        except zipfile.BadZipFile as error:
+            staging_path.unlink(missing_ok=True)
+            raise Exception(f"Failed to extract {relative_path} from PatcherSupportPkg, please redownload: {error}")
+        os.chmod(staging_path, file["mode"])
+        os.utime(staging_path, (file["modified"], file["modified"]))
+        file["hash"] = checksum.hexdigest()
+        self.object_path(file["hash"]).parent.mkdir(parents=True, exist_ok=True)
+        os.replace(staging_path, self.object_path(file["hash"]))
+
+    def materialize(self, destination, payloads):
+        # Rebuilds destination with only the given payloads, ie. Extensions/Legacy-Mux
+        # Returns the number of files inflated from the archive
+        manifest = self.load()
+        files = {relative_path: file for relative_path, file in manifest["files"].items() if selected(relative_path, payloads)}
+        missing = [
+            relative_path
+            for relative_path, file in files.items()
+            if not file["hash"] or not self.object_path(file["hash"]).exists() or self.object_path(file["hash"]).stat().st_size != file["size"]
+        ]
+        if missing:
+            print(f"- Verifying PatcherSupportPkg {manifest['version']} archive")
+            if build_cache.hash_file(self.entry_path() / Path("Archive.zip")) != manifest["archive_hash"]:
+                raise Exception("PatcherSupportPkg archive does not match its SHA-256, please redownload")
+            with zipfile.ZipFile(self.entry_path() / Path("Archive.zip")) as archive:
+                for relative_path in missing:
+                    self.inflate(archive, relative_path, files[relative_path])
+
+        # Objects are hardlinked, rebuilding is cheap and never leaves payloads of other versions behind
+        if Path(destination).exists():
+            shutil.rmtree(destination)
+        for relative_path in [directory for directory in manifest["directories"] if selected(directory, payloads)]:
+            (Path(destination) / Path(relative_path)).mkdir(parents=True, exist_ok=True)
+        for relative_path, file in files.items():
+            path = Path(destination) / Path(relative_path)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # Identical contents may be stored under different modes, those cannot share an inode
+            same_mode = stat.S_IMODE(self.object_path(file["hash"]).stat().st_mode) == file["mode"]
+            build_cache.clone_file(self.object_path(file["hash"]), path, link=same_mode)
+            if not same_mode:
+                os.chmod(path, file["mode"])
+        for relative_path, target in manifest["symlinks"].items():
+            if selected(relative_path, payloads):
+                (Path(destination) / Path(relative_path)).parent.mkdir(parents=True, exist_ok=True)
+                (Path(destination) / Path(relative_path)).symlink_to(target)
+
+        manifest["last_used"] = time.time()
+        write_json(self.entry_path() / Path("manifest.json"), manifest)
+        return len(missing)
+
+    def store_size(self):
+        return sum(file.stat().st_size for file in self.store_path().rglob("*") if file.is_file() and not file.is_symlink())
+
+    def evict(self):
+        entries = sorted(
+            [(manifest["last_used"], entry) for entry, manifest in self.manifests() if entry != self.entry_path()],
+            key=lambda item: item[0],
+        )
+        while entries and self.store_size() > STORE_LIMIT:
+            _, entry = entries.pop(0)
+            print(f"- Evicting {entry.name} from PatcherSupportPkg store")
+            shutil.rmtree(entry, ignore_errors=True)
+            self.collect_objects()
+
+    def collect_objects(self):
+        # Objects no longer referenced by any stored version
+        referenced = set()
+        for _, manifest in self.manifests():
+            referenced.update(file["hash"] for file in manifest["files"].values() if file["hash"])
+        for object_path in (self.store_path() / Path("Objects")).glob("*/*"):
+            if object_path.name not in referenced:
+                object_path.unlink(missing_ok=True)
@@ -0,0 +1,404 @@
+# Batched file operations for root patching
+# sys_patch queues its rm/cp/rsync/chmod/chown work and hands it over in a single privileged call,
+# rather than spawning a sudo process per command. Operations run in-process with os and shutil.
+# The queued operations form the patch plan, a journal of the original paths they touch allows rollback.
+
+import hashlib
+import json
+import os
+import shutil
+import stat
+import subprocess
+import sys
+import time
+import zlib
+
+from resources import constants, utilities
+
+# Ownership can only be changed by root, simulated patching without root leaves it alone
+apply_ownership = True
+
+
+def remove_path(path):
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    else:
+        os.unlink(path)
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def same_file(source_stat, source, destination):
+    # Size first, then mtime, content hash only when the mtime differs (ie. installed by 'cp -R')
+    try:
+        destination_stat = os.lstat(destination)
+    except FileNotFoundError:
+        return False
+    if not stat.S_ISREG(destination_stat.st_mode) or destination_stat.st_size != source_stat.st_size:
+        return False
+    if destination_stat.st_mtime_ns == source_stat.st_mtime_ns:
+        return True
+    return file_hash(source) == file_hash(destination)
+
+
+def sync_tree(source, destination, mode=None, owner=None, delete=False, permissions=None, skip=None):
+    # Makes destination match source, entries already matching are left untouched
+    # mode and owner apply to every entry when set, otherwise the source's are kept like 'rsync -a' run as root
+    # permissions overrides mode and owner for the trees at the given destination paths
+    # delete removes entries missing from source, making destination an exact copy
+    # skip lists destination files left alone, ie. overwritten later in the batch
+    # Returns whether anything was written
+    if permissions and os.path.normpath(destination) in permissions:
+        mode, owner = permissions[os.path.normpath(destination)]
+    source_stat = os.lstat(source)
+    if skip and not stat.S_ISDIR(source_stat.st_mode) and os.path.normpath(destination) in skip:
+        return False
+    changed = False
+    if stat.S_ISLNK(source_stat.st_mode):
+        if not os.path.islink(destination) or os.readlink(destination) != os.readlink(source):
+            if os.path.lexists(destination):
+                remove_path(destination)
+            os.symlink(os.readlink(source), destination)
+            changed = True
+    elif stat.S_ISDIR(source_stat.st_mode):
+        if os.path.lexists(destination) and (os.path.islink(destination) or not os.path.isdir(destination)):
+            remove_path(destination)
+        if not os.path.isdir(destination):
+            os.mkdir(destination)
+            changed = True
+        names = []
+        for entry in os.scandir(source):
+            names.append(entry.name)
+            changed = sync_tree(entry.path, os.path.join(destination, entry.name), mode, owner, delete, permissions, skip) or changed
+        if delete is True:
+            for name in set(os.listdir(destination)) - set(names):
+                remove_path(os.path.join(destination, name))
+                changed = True
+    elif not same_file(source_stat, source, destination):
+        if os.path.lexists(destination):
+            remove_path(destination)
+        shutil.copy2(source, destination)
+        changed = True
+
+    destination_stat = os.lstat(destination)
+    expected_owner = tuple(owner) if owner is not None else (source_stat.st_uid, source_stat.st_gid)
+    if apply_ownership is True and (destination_stat.st_uid, destination_stat.st_gid) != expected_owner:
+        os.lchown(destination, *expected_owner)
+        changed = True
+    expected_mode = mode if mode is not None else stat.S_IMODE(source_stat.st_mode)
+    if not stat.S_ISLNK(destination_stat.st_mode) and stat.S_IMODE(destination_stat.st_mode) != expected_mode:
+        os.chmod(destination, expected_mode)
+        changed = True
+    return changed
+
+
+def walk_tree(path):
+    yield path
+    if os.path.isdir(path) and not os.path.islink(path):
+        for root, directories, files in os.walk(path):
+            for name in directories + files:
+                yield os.path.join(root, name)
+
+
+class Journal:
+    # Originals of every path touched while patching, stored next to the patched files
+    # Rollback only restores these paths instead of the whole of Extensions and Frameworks
+    # File contents are stored once per SHA-256 under Objects/ as zlib streams, manifests describe each tree exactly
+    def __init__(self, path):
+        self.path = path
+        self.journal_file = os.path.join(path, "Journal.json")
+        self.objects_path = os.path.join(path, "Objects")
+        self.entries = []
+        # Bumped by every run that changes the volume
+        self.generation = 0
+        self.bumped = False
+        if os.path.exists(self.journal_file):
+            # Earlier patch runs hold the true originals, keep extending them
+            with open(self.journal_file) as journal:
+                journal_data = json.load(journal)
+            self.entries = journal_data["Entries"]
+            self.generation = journal_data.get("Generation", 0)
+
+    def journaled(self, path):
+        return any(path == entry["Path"] or path.startswith(entry["Path"] + "/") for entry in self.entries)
+
+    def save(self):
+        os.makedirs(self.path, exist_ok=True)
+        staging_file = f"{self.journal_file}.tmp"
+        with open(staging_file, "w") as journal:
+            json.dump({"Generation": self.generation, "Entries": self.entries}, journal, indent=4)
+        os.replace(staging_file, self.journal_file)
+
+    def object_path(self, digest):
+        return os.path.join(self.objects_path, digest[:2], digest)
+
+    def store_file(self, path):
+        # Hashes and compresses in one pass, identical contents are only kept once
+        os.makedirs(self.objects_path, exist_ok=True)
+        digest = hashlib.sha256()
+        compressor = zlib.compressobj()
+        staging_file = os.path.join(self.objects_path, f"{os.getpid()}.tmp")
+        with open(path, "rb") as source, open(staging_file, "wb") as destination:
+            for chunk in iter(lambda: source.read(1024 * 1024), b""):
+                digest.update(chunk)
+                destination.write(compressor.compress(chunk))
+            destination.write(compressor.flush())
+        object_path = self.object_path(digest.hexdigest())
+        if os.path.exists(object_path):
+            os.unlink(staging_file)
+        else:
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            os.replace(staging_file, object_path)
+        return digest.hexdigest()
+
+    def store_tree(self, path):
+        manifest = []
+        for entry in walk_tree(path):
+            entry_stat = os.lstat(entry)
+            item = {
+                "Path": os.path.relpath(entry, path),
+                "Mode": stat.S_IMODE(entry_stat.st_mode),
+                "UID": entry_stat.st_uid,
+                "GID": entry_stat.st_gid,
+                "Modified": entry_stat.st_mtime_ns,
+            }
+            if stat.S_ISLNK(entry_stat.st_mode):
+                item.update({"Type": "symlink", "Target": os.readlink(entry)})
+            elif stat.S_ISDIR(entry_stat.st_mode):
+                item["Type"] = "directory"
+            else:
+                item.update({"Type": "file", "Hash": self.store_file(entry)})
+            manifest.append(item)
+        return manifest
+
+    def restore_file(self, digest, path):
+        decompressor = zlib.decompressobj()
+        with open(self.object_path(digest), "rb") as source, open(path, "wb") as destination:
+            for chunk in iter(lambda: source.read(1024 * 1024), b""):
+                destination.write(decompressor.decompress(chunk))
+            destination.write(decompressor.flush())
+
+    def restore_tree(self, path, manifest):
+        # Manifest is in walk order, parents always precede their contents
+        for item in manifest:
+            target = os.path.normpath(os.path.join(path, item["Path"]))
+            if item["Type"] == "directory":
+                os.makedirs(target, exist_ok=True)
+            elif item["Type"] == "symlink":
+                os.symlink(item["Target"], target)
+            else:
+                self.restore_file(item["Hash"], target)
+            if apply_ownership is True:
+                os.lchown(target, item["UID"], item["GID"])
+            if item["Type"] != "symlink":
+                os.chmod(target, item["Mode"])
+        # Directory times change as contents are written, apply them deepest first
+        for item in reversed(manifest):
+            if item["Type"] != "symlink":
+                os.utime(os.path.normpath(os.path.join(path, item["Path"])), ns=(item["Modified"], item["Modified"]))
+
+    def record(self, path):
+        # Saves the original before it is changed
+        path = os.path.normpath(path)
+        if self.journaled(path):
+            return
+        entry = {"Path": path, "Manifest": None}
+        if os.path.lexists(path):
+            entry["Manifest"] = self.store_tree(path)
+        # Written once the contents are stored, an interrupted backup leaves the original untouched
+        self.entries.append(entry)
+        self.save()
+
+    def rollback(self):
+        for entry in reversed(self.entries):
+            if os.path.lexists(entry["Path"]):
+                remove_path(entry["Path"])
+            if entry["Manifest"] is not None:
+                self.restore_tree(entry["Path"], entry["Manifest"])
+            # Added by patching otherwise
+        shutil.rmtree(self.path)
+
+
+def journal_paths(operation):
+    # Paths an operation changes, at the granularity originals are journaled
+    kind = operation["Operation"]
+    path = operation["Path"]
+    if kind == "copy":
+        return [os.path.join(path, os.path.basename(operation["Source"]))]
+    if kind == "merge":
+        if not os.path.lexists(path):
+            # Missing parents are created as well, journal the topmost one
+            while not os.path.lexists(os.path.dirname(path)):
+                path = os.path.dirname(path)
+            return [path]
+        return [os.path.join(path, name) for name in os.listdir(operation["Source"])]
+    if kind == "move":
+        return [operation["Source"], path]
+    return [path]
+
+
+def shadowed_files(operations):
+    # Files a merge writes which a later merge in the batch overwrites again, ie. overlapping framework payloads
+    # Leaving them to the last merge keeps reruns from rewriting them twice and reporting changes every time
+    shadowed = {}
+    final_merge = {}
+    for index, operation in enumerate(operations):
+        if operation["Operation"] != "merge":
+            # Anything touching these files in between must see the earlier merge's result
+            touched = [os.path.normpath(operation["Path"])] + ([os.path.normpath(operation["Source"])] if "Source" in operation else [])
+            final_merge = {file: merge for file, merge in final_merge.items() if not any(file == path or file.startswith(path + "/") for path in touched)}
+            continue
+        for root, directories, files in os.walk(operation["Source"]):
+            for name in files + [directory for directory in directories if os.path.islink(os.path.join(root, directory))]:
+                file = os.path.normpath(os.path.join(operation["Path"], os.path.relpath(os.path.join(root, name), operation["Source"])))
+                if file in final_merge:
+                    shadowed.setdefault(final_merge[file], set()).add(file)
+                final_merge[file] = index
+    return shadowed
+
+
+def run_operation(operation, journal=None, skip=None):
+    # Returns whether the operation changed anything
+    kind = operation["Operation"]
+    path = operation["Path"]
+    if kind == "rollback":
+        Journal(path).rollback()
+        return True
+    if kind == "remove" and not os.path.lexists(path):
+        if operation["Missing OK"]:
+            return False
+        raise FileNotFoundError(f"No such file or directory: '{path}'")
+    if journal is not None:
+        for journal_path in journal_paths(operation):
+            journal.record(journal_path)
+    if kind == "remove":
+        remove_path(path)
+        return True
+    if kind == "sync":
+        # 'rm -R destination', 'cp -R source destination', 'chmod -Rf' and 'chown -Rf' in one pass
+        return sync_tree(operation["Source"], path, operation["Mode"], operation["Owner"], delete=True)
+    if kind == "copy":
+        # 'cp -R source destination/', copies belong to the caller
+        return sync_tree(operation["Source"], os.path.join(path, os.path.basename(operation["Source"])), owner=(os.getuid(), os.getgid()))
+    if kind == "merge":
+        # 'rsync -r -a source/ destination', followed by 'chmod' and 'chown' of the paths in Permissions
+        return sync_tree(operation["Source"], path, permissions=operation["Permissions"], skip=skip)
+    if kind == "move":
+        shutil.move(operation["Source"], path)
+        return True
+    raise Exception(f"Unknown privileged operation: {kind}")
+
+
+def run_operations(operations, journal_path=None):
+    # Runs in order and stops at the first failure of a checked operation
+    journal = Journal(journal_path) if journal_path else None
+    shadowed = shadowed_files(operations)
+    results = []
+    for index, operation in enumerate(operations):
+        changed = False
+        start = time.perf_counter()
+        try:
+            changed = run_operation(operation, journal, shadowed.get(index))
+            results.append({"Success": True, "Changed": changed, "Error": "", "Duration": time.perf_counter() - start})
+        except Exception as e:
+            # Every failure is reported as a result, the caller always gets one per operation run
+            # Partially applied operations may have written files
+            changed = True
+            results.append({"Success": False, "Changed": True, "Error": f"{type(e).__name__}: {e}", "Duration": time.perf_counter() - start})
+            if operation["Check"]:
+                break
+        finally:
+            if journal is not None and changed and not journal.bumped:
+                # Marks the volume as differing from any snapshot built before this run
+                journal.bumped = True
+                journal.generation += 1
+                journal.save()
+    return results
+
+
+def journal_generation(path):
+    # Generation of the journal at path, None without one
+    try:
+        with open(os.path.join(path, "Journal.json")) as journal:
+            return json.load(journal).get("Generation", 0)
+    except (OSError, ValueError):
+        return None
+
+
+def serve():
+    # Entry point for '--privileged_helper', reads a batch on stdin and reports results on stdout
+    batch = json.load(sys.stdin)
+    results = run_operations(batch["Operations"], batch["Journal"])
+    json.dump(results, sys.stdout)
+
+
+class PrivilegedOperations:
+    def __init__(self, versions):
+        self.constants: constants.Constants = versions
+        self.operations = []
+        # Every operation run so far with its result
+        self.history = []
+        # Set for simulated volumes, which never need root
+        self.in_process = False
+
+    def queue(self, kind, path, check, **fields):
+        self.operations.append({"Operation": kind, "Path": str(path), "Check": check, **fields})
+
+    def remove(self, path, missing_ok=False, check=True):
+        self.queue("remove", path, check, **{"Missing OK": missing_ok})
+
+    def copy(self, source, destination, check=True):
+        self.queue("copy", destination, check, Source=str(source))
+
+    def merge(self, source, destination, permissions=None, check=True):
+        # permissions maps merged paths to their (mode, owner), applied while merging so unchanged files stay untouched
+        permissions = {os.path.normpath(str(path)): [mode, list(owner)] for path, (mode, owner) in (permissions or {}).items()}
+        self.queue("merge", destination, check, Source=str(source), Permissions=permissions)
+
+    def sync(self, source, destination, mode=0o755, owner=(0, 0), check=True):
+        # Replaces destination with source, defaults match 'chmod -Rf 755' and 'chown -Rf root:wheel'
+        # Removing the destination first is redundant, and would rewrite it on every run (ie. IOAcceleratorFamily2.kext)
+        # Earlier syncs to the same destination are replaced too, ie. TeraScale 2 kexts synced over the General ones on MacBookPro8,2
+        self.operations = [operation for operation in self.operations if not (operation["Operation"] in ["remove", "sync"] and operation["Path"] == str(destination))]
+        self.queue("sync", destination, check, Source=str(source), Mode=mode, Owner=list(owner) if owner else None)
+
+    def move(self, source, destination, check=True):
+        self.queue("move", destination, check, Source=str(source))
+
+    def rollback(self, journal_path):
+        self.queue("rollback", journal_path, True)
+
+    def helper_command(self):
+        if self.constants.launcher_script is None:
+            return [self.constants.launcher_binary, "--privileged_helper"]
+        return [self.constants.launcher_binary, self.constants.launcher_script, "--privileged_helper"]
+
+    def run(self, journal_path=None):
+        # Changed paths are journaled to journal_path when set
+        operations, self.operations = self.operations, []
+        if not operations:
+            return []
+        print(f"- Running {len(operations)} privileged file operations")
+        # Same privilege rules as utilities.elevated()
+        if os.getuid() == 0 or utilities.check_cli_args() is not None or self.in_process is True:
+            results = run_operations(operations, journal_path)
+        else:
+            batch = {"Journal": str(journal_path) if journal_path else None, "Operations": operations}
+            helper = subprocess.run(["sudo"] + self.helper_command(), input=json.dumps(batch).encode(), stdout=subprocess.PIPE)
+            if helper.returncode != 0:
+                raise Exception(f"Privileged helper failed with exit code {helper.returncode}")
+            results = json.loads(helper.stdout)
+
+        self.history += [{**operation, **result} for operation, result in zip(operations, results)]
+        for operation, result in zip(operations, results):
+            if not result["Success"] and operation["Check"]:
+                print(f"Privileged {operation['Operation']} failed for {operation['Path']}")
+                print("Please file an issue on our Github")
+                raise Exception(f"Operation result: \n{result['Error']}")
+        return results
@@ -0,0 +1,142 @@
+# Persistent cache of the probed hardware
+# Hardware cannot change within a boot, later launches (ie. relaunching as root) reuse the first probe
+
+import base64
+import dataclasses
+import enum
+import json
+import os
+import stat
+from pathlib import Path
+
+from resources import constants, device_probe, ioreg_backend
+
+# Bumped whenever the serialized layout of Computer changes
+PROBE_CACHE_VERSION = 1
+
+# Only these classes may be instantiated from the cache
+CACHED_CLASSES = {
+    cls.__name__: cls
+    for cls in [
+        device_probe.Computer,
+        device_probe.CPU,
+        device_probe.PCIDevice,
+        device_probe.NVMeController,
+        device_probe.SATAController,
+        device_probe.SASController,
+        device_probe.NVIDIA,
+        device_probe.AMD,
+        device_probe.Intel,
+        device_probe.Broadcom,
+        device_probe.Atheros,
+    ]
+}
+
+
+def encode(value):
+    if dataclasses.is_dataclass(value):
+        fields = {}
+        for field in dataclasses.fields(value):
+            if not hasattr(value, field.name):
+                # Fields set after init may be missing, ie. country_code in example dumps
+                continue
+            # Architectures and chipsets are derived from the device ID in __post_init__
+            if not isinstance(getattr(value, field.name), enum.Enum):
+                fields[field.name] = encode(getattr(value, field.name))
+        return {"Type": type(value).__name__, "Fields": fields}
+    if isinstance(value, list):
+        return [encode(item) for item in value]
+    if isinstance(value, bytes):
+        # Raw IORegistry properties, ie. pci-aspm-default
+        return {"Type": "bytes", "Data": base64.b64encode(value).decode()}
+    return value
+
+
+def decode(value):
+    if isinstance(value, list):
+        return [decode(item) for item in value]
+    if isinstance(value, dict) and value["Type"] == "bytes":
+        return base64.b64decode(value["Data"])
+    if isinstance(value, dict):
+        cls = CACHED_CLASSES[value["Type"]]
+        fields = {name: decode(item) for name, item in value["Fields"].items()}
+        init_fields = [field.name for field in dataclasses.fields(cls) if field.init]
+        instance = cls(**{name: item for name, item in fields.items() if name in init_fields})
+        for name, item in fields.items():
+            if name not in init_fields:
+                setattr(instance, name, item)
+        return instance
+    return value
+
+
+class ProbeCache:
+    def __init__(self, versions):
+        self.constants: constants.Constants = versions
+
+    def generate_key(self):
+        return {
+            "Version": PROBE_CACHE_VERSION,
+            "Patcher Version": self.constants.patcher_version,
+            "Boot Session": ioreg_backend.get_backend().run_command("sysctl -n kern.bootsessionuuid".split()).decode().strip(),
+            "OS Build": self.constants.detected_os_build,
+        }
+
+    def trusted(self):
+        # Root relaunches read the cache, only accept files written by us, root or the logged in user
+        file_stat = Path(self.constants.probe_cache_path).stat()
+        owners = [os.getuid(), 0]
+        if os.getuid() == 0:
+            owners.append(Path("/dev/console").stat().st_uid)
+        if file_stat.st_uid not in owners:
+            return False
+        if file_stat.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+            return False
+        return stat.S_ISREG(file_stat.st_mode)
+
+    def load(self, key):
+        try:
+            if not self.trusted():
+                print("- Ignoring hardware probe cache with unexpected ownership")
+                return None
+            cache = json.loads(Path(self.constants.probe_cache_path).read_text())
+            if cache["Key"] != key:
+                return None
+            return decode(cache["Computer"])
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def store(self, key, computer):
+        cache_path = Path(self.constants.probe_cache_path)
+        staging_path = cache_path.with_name(f"{cache_path.name}.{os.getpid()}.tmp")
+        try:
+            # Created fresh so a pre-existing file's permissions are never inherited
+            file = os.open(staging_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+            with os.fdopen(file, "w") as cache_file:
+                json.dump({"Key": key, "Computer": encode(computer)}, cache_file)
+            os.replace(staging_path, cache_path)
+        except OSError:
+            # Cache is only an optimisation, ie. unwritable location
+            Path(staging_path).unlink(missing_ok=True)
+        except (TypeError, ValueError) as error:
+            # Every launch would probe again, make it visible
+            print(f"- Unable to cache hardware probe, value cannot be stored: {error}")
+            Path(staging_path).unlink(missing_ok=True)
+
+    def probe(self, reprobe=False):
+        if type(ioreg_backend.get_backend()) is not ioreg_backend.IOKitBackend:
+            # Recordings must reflect a real probe, replays are already instant
+            return device_probe.Computer.probe()
+
+        key = self.generate_key()
+        if not key["Boot Session"]:
+            # Unable to tell boots apart
+            return device_probe.Computer.probe()
+        if reprobe is False:
+            computer = self.load(key)
+            if computer is not None:
+                print("- Using cached hardware probe")
+                return computer
+
+        computer = device_probe.Computer.probe()
+        self.store(key, computer)
+        return computer
@@ -0,0 +1,91 @@
+# Indexed view of smbios_data
+# Typed per-model records with reverse lookups by Board ID and SecureBootModel
+
+from typing import Any, NamedTuple, Optional
+
+from data import smbios_data
+
+# smbios_data key -> SMBIOSRecord field
+# Keys without a field are left out of the catalog, they stay available through smbios_data
+FIELD_KEYS = {
+    "Board ID": "board_id",
+    "FirmwareFeatures": "firmware_features",
+    "SecureBootModel": "secure_boot_model",
+    "CPU Generation": "cpu_generation",
+    "Max OS Supported": "max_os_supported",
+    "Wireless Model": "wireless_model",
+    "Bluetooth Model": "bluetooth_model",
+    "Screen Size": "screen_size",
+    "UGA Graphics": "uga_graphics",
+    "Ethernet Chipset": "ethernet_chipset",
+    "Legacy iSight": "legacy_isight",
+    "Stock GPUs": "stock_gpus",
+    "Stock Storage": "stock_storage",
+    "nForce Chipset": "nforce_chipset",
+    "Switchable GPUs": "switchable_gpus",
+    "Socketed GPUs": "socketed_gpus",
+    "5K Display": "display_5k",
+}
+
+
+class SMBIOSRecord(NamedTuple):
+    model: str  # Key in smbios_data, ie. iMac9,1_v2
+    canonical_model: str  # Model without the suffix used for duplicate Board IDs, ie. iMac9,1
+    board_id: Optional[str] = None
+    firmware_features: Optional[str] = None
+    secure_boot_model: Optional[str] = None
+    cpu_generation: Optional[int] = None
+    max_os_supported: Optional[int] = None
+    wireless_model: Any = None
+    bluetooth_model: Any = None
+    screen_size: Optional[int] = None  # Only set for portables
+    uga_graphics: Optional[bool] = None
+    ethernet_chipset: Optional[str] = None
+    legacy_isight: Optional[bool] = None
+    stock_gpus: Optional[list] = None
+    stock_storage: Optional[list] = None
+    nforce_chipset: Optional[bool] = None
+    switchable_gpus: Optional[bool] = None
+    socketed_gpus: Optional[str] = None
+    display_5k: Optional[bool] = None
+
+
+def canonical_model(model):
+    # smbios_data has duplicate SMBIOS to handle multiple board IDs
+    if model.endswith("_v2") or model.endswith("_v3") or model.endswith("_v4"):
+        return model[:-3]
+    return model
+
+
+class SMBIOSCatalog:
+    def __init__(self, dictionary):
+        self.records: dict[str, SMBIOSRecord] = {}
+        self.by_board_id: dict[str, SMBIOSRecord] = {}
+        self.by_secure_boot_model: dict[str, SMBIOSRecord] = {}
+        for model, data in dictionary.items():
+            record = SMBIOSRecord(model, canonical_model(model), **{FIELD_KEYS[key]: value for key, value in data.items() if key in FIELD_KEYS})
+            self.records[model] = record
+            # First entry wins, matching a linear scan of smbios_data
+            if record.board_id is not None:
+                self.by_board_id.setdefault(record.board_id, record)
+            if record.secure_boot_model is not None:
+                self.by_secure_boot_model.setdefault(record.secure_boot_model, record)
+
+    def get(self, model):
+        return self.records.get(model)
+
+    def find_by_board(self, board):
+        # Board IDs and SecureBootModels never overlap
+        return self.by_board_id.get(board) or self.by_secure_boot_model.get(board)
+
+    def select(self, *predicates, **fields):
+        # Records matching every predicate and field value, in smbios_data order
+        # Fields missing from smbios_data are None, ie. select(lambda record: record.cpu_generation is not None and record.cpu_generation <= cpu_data.cpu_data.penryn.value, ethernet_chipset="Nvidia")
+        return [
+            record
+            for record in self.records.values()
+            if all(getattr(record, name) == value for name, value in fields.items()) and all(predicate(record) for predicate in predicates)
+        ]
+
+
+catalog = SMBIOSCatalog(smbios_data.smbios_dictionary)
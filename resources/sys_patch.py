@@ -12,7 +12,7 @@ import zipfile
 from pathlib import Path
 import sys
 
-from resources import constants, device_probe, utilities, generate_smbios
+from resources import constants, device_probe, utilities, generate_smbios, privileged_helper, patcher_support_pkg
 from data import sip_data, sys_patch_data, model_array, os_data, smbios_data, cpu_data, dylib_data
 
 
@@ -46,14 +46,18 @@ class PatchSysVolume:
         self.no_patch = True
         self.validate = False
         self.supports_metal = False
+        # File operations are queued and run as a single privileged batch before the snapshot is rebuilt
+        self.operations = privileged_helper.PrivilegedOperations(self.constants)
 
         if self.constants.detected_os > os_data.os_data.catalina:
             # Big Sur and newer use APFS snapshots
-            self.mount_location = "/System/Volumes/Update/mnt1"
-            self.mount_location_data = ""
+            self.set_mount_location("/System/Volumes/Update/mnt1", "")
         else:
-            self.mount_location = ""
-            self.mount_location_data = ""
+            self.set_mount_location("", "")
+
+    def set_mount_location(self, mount_location, mount_location_data):
+        self.mount_location = mount_location
+        self.mount_location_data = mount_location_data
         self.mount_coreservices = f"{self.mount_location}/System/Library/CoreServices"
         self.mount_extensions = f"{self.mount_location}/System/Library/Extensions"
         self.mount_frameworks = f"{self.mount_location}/System/Library/Frameworks"
@@ -63,21 +67,29 @@ class PatchSysVolume:
         self.mount_extensions_mux = f"{self.mount_location}/System/Library/Extensions/AppleGraphicsControl.kext/Contents/PlugIns/"
         self.mount_private_etc = f"{self.mount_location_data}/private/etc"
         self.mount_application_support = f"{self.mount_location_data}/Library/Application Support"
+        self.booted_journal = "/System/Library/OCLP-Patch-Journal"
+        self.mount_journal = f"{self.mount_location}{self.booted_journal}"
+
+    # macOS tools are run through these, allowing sys_patch_simulator to stand in for them
+    def elevated(self, *args, **kwargs):
+        return utilities.elevated(*args, **kwargs)
+
+    def run_command(self, *args, **kwargs):
+        return subprocess.run(*args, **kwargs)
+
+    def kext_loaded(self, kext_name):
+        return utilities.check_kext_loaded(kext_name, self.constants.detected_os)
 
     def find_mount_root_vol(self, patch):
         self.root_mount_path = utilities.get_disk_path()
         if self.root_mount_path.startswith("disk"):
             if self.constants.detected_os == os_data.os_data.catalina and self.validate is False:
                 print("- Mounting Catalina Root Volume as writable")
-                utilities.elevated(["mount", "-uw", f"{self.mount_location}/"], stdout=subprocess.PIPE).stdout.decode().strip().encode()
+                self.elevated(["mount", "-uw", f"{self.mount_location}/"], stdout=subprocess.PIPE).stdout.decode().strip().encode()
             print(f"- Found Root Volume at: {self.root_mount_path}")
             if Path(self.mount_extensions).exists():
                 print("- Root Volume is already mounted")
                 if patch is True:
-                    # Root Volume unpatching is unreliable due to being a live volume
-                    # Only worth while on Big Sur as '--last-sealed-snapshot' is hit or miss
-                    if self.constants.detected_os == os_data.os_data.big_sur and utilities.check_seal() is True:
-                        self.backup_volume()
                     self.patch_root_vol()
                     return True
                 else:
@@ -86,16 +98,12 @@ class PatchSysVolume:
             else:
                 if self.constants.detected_os > os_data.os_data.catalina:
                     print("- Mounting APFS Snapshot as writable")
-                    result = utilities.elevated(["mount", "-o", "nobrowse", "-t", "apfs", f"/dev/{self.root_mount_path}", self.mount_location], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+                    result = self.elevated(["mount", "-o", "nobrowse", "-t", "apfs", f"/dev/{self.root_mount_path}", self.mount_location], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
                     if result.returncode == 0:
                         print(f"- Mounted APFS Snapshot as writable at: {self.mount_location}")
                 if Path(self.mount_extensions).exists():
                     print("- Successfully mounted the Root Volume")
                     if patch is True:
-                        # Root Volume unpatching is unreliable due to being a live volume
-                        # Only worth while on Big Sur as '--last-sealed-snapshot' is hit or miss
-                        if self.constants.detected_os == os_data.os_data.big_sur and utilities.check_seal() is True:
-                            self.backup_volume()
                         self.patch_root_vol()
                         return True
                     else:
@@ -111,51 +119,17 @@ class PatchSysVolume:
             if self.constants.gui_mode is False:
                 input("- Press [ENTER] to exit: ")
 
-    def backup_volume(self):
-        for location in sys_patch_data.BackupLocations:
-            utilities.cls()
-            print("Backing up root volume before patching (This may take some time)")
-            print(f"- Attempting to backup {location}")
-            location_zip = f"{location}-Backup.zip"
-            location_zip_path = Path(self.mount_location) / Path(location_zip)
-
-            if location_zip_path.exists():
-                print(f"- Found existing {location_zip}, skipping")
-            else:
-                print(f"- Backing up {location}")
-                # cp -r ./Extensions ./Extensions-Backup
-                # ditto -c -k --sequesterRsrc --keepParent ./Extensions-Backup ./Extensions-Backup.zip
-                # rm -r ./Extensions-Backup
-
-                print("- Creating Backup folder")
-                utilities.process_status(
-                    utilities.elevated(
-                        ["cp", "-r", f"{self.mount_location}/{location}", f"{self.mount_location}/{location}-Backup"],
-                        stdout=subprocess.PIPE,
-                        stderr=subprocess.STDOUT,
-                    )
-                )
-                print("- Zipping Backup folder")
-                utilities.process_status(
-                    utilities.elevated(
-                        ["ditto", "-c", "-k", "--sequesterRsrc", "--keepParent", f"{self.mount_location}/{location}-Backup", f"{self.mount_location}/{location_zip}"],
-                        stdout=subprocess.PIPE,
-                        stderr=subprocess.STDOUT,
-                    )
-                )
-
-                print("- Removing Backup folder")
-                utilities.process_status(
-                    utilities.elevated(
-                        ["rm", "-r", f"{self.mount_location}/{location}-Backup"],
-                        stdout=subprocess.PIPE,
-                        stderr=subprocess.STDOUT,
-                    )
-                )
-
     def manual_root_patch_revert(self):
         print("- Attempting to revert patches")
-        if (Path(self.mount_location) / Path("/System/Library/Extensions-Backup.zip")).exists():
+        if (Path(self.mount_journal) / Path("Journal.json")).exists():
+            # Only the files touched by patching are restored
+            print("- Found root patch journal, restoring original files")
+            self.operations.rollback(self.mount_journal)
+            self.operations.run()
+            if self.validate is False:
+                self.rebuild_snapshot()
+        elif (Path(self.mount_location) / Path("/System/Library/Extensions-Backup.zip")).exists():
+            # Volumes patched by older releases
             print("- Verified manual unpatching is available")
 
             for location in sys_patch_data.BackupLocations:
@@ -178,33 +152,33 @@ class PatchSysVolume:
                     print(f"- Found {location_zip}")
 
                     print(f"- Unzipping {location_zip}")
-                    utilities.process_status(utilities.elevated(["unzip", location_zip_path, "-d", copy_path], stdout=subprocess.PIPE, stderr=subprocess.STDOUT))
+                    utilities.process_status(self.elevated(["unzip", location_zip_path, "-d", copy_path], stdout=subprocess.PIPE, stderr=subprocess.STDOUT))
 
                     if location_old_path.exists():
                         print(f"- Renaming {location}")
-                        utilities.process_status(utilities.elevated(["mv", location_old_path, f"{location_old_path}-Patched"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT))
+                        utilities.process_status(self.elevated(["mv", location_old_path, f"{location_old_path}-Patched"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT))
 
                     print(f"- Renaming {location}-Backup")
-                    utilities.process_status(utilities.elevated(["mv", f"{location_old_path}-Backup", location_old_path], stdout=subprocess.PIPE, stderr=subprocess.STDOUT))
+                    utilities.process_status(self.elevated(["mv", f"{location_old_path}-Backup", location_old_path], stdout=subprocess.PIPE, stderr=subprocess.STDOUT))
 
                     print(f"- Removing {location_old_path}-Patched")
-                    utilities.process_status(utilities.elevated(["rm", "-r", f"{location_old_path}-Patched"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT))
+                    utilities.process_status(self.elevated(["rm", "-r", f"{location_old_path}-Patched"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT))
 
                     # ditto will create a '__MACOSX' folder
                     # print("- Removing __MACOSX folder")
-                    # utilities.process_status(utilities.elevated(["rm", "-r", f"{copy_path}/__MACOSX"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT))
+                    # utilities.process_status(self.elevated(["rm", "-r", f"{copy_path}/__MACOSX"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT))
 
                 else:
                     print(f"- Failed to find {location_zip}, unable to unpatch")
             if self.validate is False:
                 self.rebuild_snapshot()
         else:
-            print("- Could not find Extensions.zip, cannot manually unpatch root volume")
+            print("- Could not find root patch journal or Extensions.zip, cannot manually unpatch root volume")
 
     def unpatch_root_vol(self):
         if self.constants.detected_os > os_data.os_data.catalina:
             print("- Reverting to last signed APFS snapshot")
-            result = utilities.elevated(["bless", "--mount", self.mount_location, "--bootefi", "--last-sealed-snapshot"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            result = self.elevated(["bless", "--mount", self.mount_location, "--bootefi", "--last-sealed-snapshot"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
             if result.returncode != 0:
                 print("- Unable to revert root volume patches")
                 print("Reason for unpatch Failure:")
@@ -220,9 +194,9 @@ class PatchSysVolume:
     def rebuild_snapshot(self):
         print("- Rebuilding Kernel Cache (This may take some time)")
         if self.constants.detected_os > os_data.os_data.catalina:
-            result = utilities.elevated(["kmutil", "install", "--volume-root", self.mount_location, "--update-all"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            result = self.elevated(["kmutil", "install", "--volume-root", self.mount_location, "--update-all"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
         else:
-            result = utilities.elevated(["kextcache", "-i", f"{self.mount_location}/"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            result = self.elevated(["kextcache", "-i", f"{self.mount_location}/"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
 
         # kextcache always returns 0, even if it fails
         # Check the output for 'KernelCache ID' to see if the cache was successfully rebuilt
@@ -246,7 +220,7 @@ class PatchSysVolume:
             #         input("Press [ENTER] to continue with kernel and dyld cache merging")
             if self.constants.detected_os > os_data.os_data.catalina:
                 print("- Creating new APFS snapshot")
-                bless = utilities.elevated(
+                bless = self.elevated(
                     ["bless", "--folder", f"{self.mount_location}/System/Library/CoreServices", "--bootefi", "--create-snapshot"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT
                 )
                 if bless.returncode != 0:
@@ -261,9 +235,9 @@ class PatchSysVolume:
             else:
                 if self.constants.detected_os == os_data.os_data.catalina:
                     print("- Merging kernel cache")
-                    utilities.process_status(utilities.elevated(["kcditto"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT))
+                    utilities.process_status(self.elevated(["kcditto"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT))
                 print("- Merging dyld cache")
-                utilities.process_status(utilities.elevated(["update_dyld_shared_cache", "-root", f"{self.mount_location}/"]))
+                utilities.process_status(self.elevated(["update_dyld_shared_cache", "-root", f"{self.mount_location}/"]))
             print("- Patching complete")
             print("\nPlease reboot the machine for patches to take effect")
             if self.amd_ts2 is True and self.constants.allow_ts2_accel is True:
@@ -278,34 +252,33 @@ set million colour before rebooting"""
 
     def unmount_drive(self):
         print("- Unmounting Root Volume (Don't worry if this fails)")
-        utilities.elevated(["diskutil", "unmount", self.root_mount_path], stdout=subprocess.PIPE).stdout.decode().strip().encode()
+        self.elevated(["diskutil", "unmount", self.root_mount_path], stdout=subprocess.PIPE).stdout.decode().strip().encode()
 
     def delete_old_binaries(self, vendor_patch):
         for delete_current_kext in vendor_patch:
             delete_path = Path(self.mount_extensions) / Path(delete_current_kext)
             if Path(delete_path).exists():
                 print(f"- Deleting {delete_current_kext}")
-                utilities.process_status(utilities.elevated(["rm", "-R", delete_path], stdout=subprocess.PIPE, stderr=subprocess.STDOUT))
+                # Checked again when the batch runs, earlier operations may have removed it already
+                self.operations.remove(delete_path, missing_ok=True)
             else:
                 print(f"- Couldn't find {delete_current_kext}, skipping")
 
     def add_new_binaries(self, vendor_patch, vendor_location):
         for add_current_kext in vendor_patch:
-            existing_path = Path(self.mount_extensions) / Path(add_current_kext)
-            if Path(existing_path).exists():
-                print(f"- Found conflicting kext, Deleting Root Volume's {add_current_kext}")
-                utilities.process_status(utilities.elevated(["rm", "-R", existing_path], stdout=subprocess.PIPE, stderr=subprocess.STDOUT))
             print(f"- Adding {add_current_kext}")
-            utilities.process_status(utilities.elevated(["cp", "-R", f"{vendor_location}/{add_current_kext}", self.mount_extensions], stdout=subprocess.PIPE, stderr=subprocess.STDOUT))
-            utilities.process_status(utilities.elevated(["chmod", "-Rf", "755", f"{self.mount_extensions}/{add_current_kext}"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT))
-            utilities.process_status(utilities.elevated(["chown", "-Rf", "root:wheel", f"{self.mount_extensions}/{add_current_kext}"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT))
+            # Replaces any conflicting kext, files already matching the payload are not rewritten
+            self.operations.sync(f"{vendor_location}/{add_current_kext}", f"{self.mount_extensions}/{add_current_kext}")
         
     def add_brightness_patch(self):
         self.delete_old_binaries(sys_patch_data.DeleteBrightness)
         self.add_new_binaries(sys_patch_data.AddBrightness, self.constants.legacy_brightness)
-        utilities.elevated(["rsync", "-r", "-i", "-a", f"{self.constants.payload_apple_private_frameworks_path_brightness}/", self.mount_private_frameworks], stdout=subprocess.PIPE)
-        utilities.process_status(utilities.elevated(["chmod", "-Rf", "755", f"{self.mount_private_frameworks}/DisplayServices.framework"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT))
-        utilities.process_status(utilities.elevated(["chown", "-Rf", "root:wheel", f"{self.mount_private_frameworks}/DisplayServices.framework"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT))
+        # Checked, a failed permission fix leaves the root volume unbootable
+        self.operations.merge(
+            self.constants.payload_apple_private_frameworks_path_brightness,
+            self.mount_private_frameworks,
+            permissions={f"{self.mount_private_frameworks}/DisplayServices.framework": (0o755, (0, 0))},
+        )
 
     def add_audio_patch(self):
         if self.model in ["iMac7,1", "iMac8,1"]:
@@ -316,34 +289,28 @@ set million colour before rebooting"""
 
     def add_wifi_patch(self):
         print("- Merging Wireless CoreSerices patches")
-        utilities.elevated(["rsync", "-r", "-i", "-a", f"{self.constants.legacy_wifi_coreservices}/", self.mount_coreservices], stdout=subprocess.PIPE)
-        utilities.process_status(utilities.elevated(["chmod", "-Rf", "755", f"{self.mount_coreservices}/WiFiAgent.app"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT))
-        utilities.process_status(utilities.elevated(["chown", "-Rf", "root:wheel", f"{self.mount_coreservices}/WiFiAgent.app"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT))
+        self.operations.merge(self.constants.legacy_wifi_coreservices, self.mount_coreservices, permissions={f"{self.mount_coreservices}/WiFiAgent.app": (0o755, (0, 0))})
         print("- Merging Wireless usr/libexec patches")
-        utilities.elevated(["rsync", "-r", "-i", "-a", f"{self.constants.legacy_wifi_libexec}/", self.mount_libexec], stdout=subprocess.PIPE)
-        utilities.process_status(utilities.elevated(["chmod", "755", f"{self.mount_libexec}/airportd"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT))
-        utilities.process_status(utilities.elevated(["chown", "root:wheel", f"{self.mount_libexec}/airportd"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT))
+        self.operations.merge(self.constants.legacy_wifi_libexec, self.mount_libexec, permissions={f"{self.mount_libexec}/airportd": (0o755, (0, 0))})
 
         # dylib patch to resolve password crash prompt
         # Note requires ASentientBot's SkyLight to function
         # Thus Metal machines do not benefit from this patch, however install anyways as harmless 
         print("- Merging Wireless SkyLightPlugins")
-        utilities.elevated(["rsync", "-r", "-i", "-a", f"{self.constants.legacy_wifi_support}/", self.mount_application_support], stdout=subprocess.PIPE)
+        self.operations.merge(self.constants.legacy_wifi_support, self.mount_application_support, check=False)
 
     def add_legacy_mux_patch(self):
         self.delete_old_binaries(sys_patch_data.DeleteDemux)
         print("- Merging Legacy Mux Kext patches")
-        utilities.process_status(
-            utilities.elevated(["cp", "-R", f"{self.constants.legacy_mux_path}/AppleMuxControl.kext", self.mount_extensions_mux], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-        )
+        self.operations.copy(f"{self.constants.legacy_mux_path}/AppleMuxControl.kext", self.mount_extensions_mux)
     
     def add_legacy_keyboard_backlight_patch(self):
         print("- Merging Keyboard Backlight SkyLightPlugins")
-        utilities.elevated(["rsync", "-r", "-i", "-a", f"{self.constants.legacy_keyboard_backlight_support}/", self.mount_application_support], stdout=subprocess.PIPE)
+        self.operations.merge(self.constants.legacy_keyboard_backlight_support, self.mount_application_support, check=False)
     
     def add_legacy_dropbox_patch(self):
         print("- Merging DropboxHack SkyLightPlugins")
-        utilities.elevated(["rsync", "-r", "-i", "-a", f"{self.constants.legacy_dropbox_support}/", self.mount_application_support], stdout=subprocess.PIPE)
+        self.operations.merge(self.constants.legacy_dropbox_support, self.mount_application_support, check=False)
 
     def gpu_accel_legacy(self):
         if self.constants.detected_os == os_data.os_data.mojave:
@@ -445,32 +412,18 @@ set million colour before rebooting"""
             # add_new_binaries() and delete_old_binaries() have a bug when the passed array has a single element
             #   'TypeError: expected str, bytes or os.PathLike object, not list'
             # This is a temporary workaround to fix that
-            utilities.elevated(["rm", "-r", f"{self.mount_extensions}/AppleIntelSNBGraphicsFB-Clean.kext"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-            utilities.elevated(["rm", "-r", f"{self.mount_extensions}/AppleIntelSNBGraphicsFB.kext"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-            # Add kext
+            self.operations.remove(f"{self.mount_extensions}/AppleIntelSNBGraphicsFB-Clean.kext", missing_ok=True, check=False)
+            # Add kext, installed under the stock name
             print("- Adding AppleIntelSNBGraphicsFB.kext")
-            utilities.elevated(
-                ["cp", "-r", f"{self.constants.legacy_intel_gen2_path}/AppleIntelSNBGraphicsFB-Clean.kext", f"{self.mount_extensions}"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT
-            )
-            # Rename kext
-            utilities.elevated(
-                ["mv", f"{self.mount_extensions}/AppleIntelSNBGraphicsFB-Clean.kext", f"{self.mount_extensions}/AppleIntelSNBGraphicsFB.kext"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT
-            )
-            # Fix permissions
-            utilities.elevated(["chown", "-Rf", "root:wheel", f"{self.mount_extensions}/AppleIntelSNBGraphicsFB.kext"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-            utilities.elevated(["chmod", "-Rf", "755", f"{self.mount_extensions}/AppleIntelSNBGraphicsFB.kext"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            self.operations.sync(f"{self.constants.legacy_intel_gen2_path}/AppleIntelSNBGraphicsFB-Clean.kext", f"{self.mount_extensions}/AppleIntelSNBGraphicsFB.kext", check=False)
 
         else:
             # Adjust board ID for spoofs
             print("- Using Board ID patched AppleIntelSNBGraphicsFB")
-            utilities.elevated(["rm", "-r", f"{self.mount_extensions}/AppleIntelSNBGraphicsFB-Clean.kext"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-            utilities.elevated(["rm", "-r", f"{self.mount_extensions}/AppleIntelSNBGraphicsFB.kext"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            self.operations.remove(f"{self.mount_extensions}/AppleIntelSNBGraphicsFB-Clean.kext", missing_ok=True, check=False)
             # Add kext
             print("- Adding AppleIntelSNBGraphicsFB.kext")
-            utilities.elevated(["cp", "-r", f"{self.constants.legacy_intel_gen2_path}/AppleIntelSNBGraphicsFB.kext", f"{self.mount_extensions}"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-            # Fix permissions
-            utilities.elevated(["chown", "-Rf", "root:wheel", f"{self.mount_extensions}/AppleIntelSNBGraphicsFB.kext"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-            utilities.elevated(["chmod", "-Rf", "755", f"{self.mount_extensions}/AppleIntelSNBGraphicsFB.kext"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            self.operations.sync(f"{self.constants.legacy_intel_gen2_path}/AppleIntelSNBGraphicsFB.kext", f"{self.mount_extensions}/AppleIntelSNBGraphicsFB.kext", check=False)
 
     def gpu_framebuffer_ivybridge_master(self):
         if self.constants.detected_os == os_data.os_data.monterey:
@@ -478,11 +431,11 @@ set million colour before rebooting"""
             self.add_new_binaries(sys_patch_data.AddIntelGen3Accel, self.constants.legacy_intel_gen3_path)
             if self.validate is False:
                 print("- Fixing Acceleration in CoreMedia")
-                utilities.process_status(subprocess.run(["defaults", "write", "com.apple.coremedia", "hardwareVideoDecoder", "-string", "enable"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT))
+                utilities.process_status(self.run_command(["defaults", "write", "com.apple.coremedia", "hardwareVideoDecoder", "-string", "enable"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT))
             print("- Merging Ivy Bridge Frameworks")
-            utilities.elevated(["rsync", "-r", "-i", "-a", f"{self.constants.payload_apple_frameworks_path_accel_ivy}/", self.mount_frameworks], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            self.operations.merge(self.constants.payload_apple_frameworks_path_accel_ivy, self.mount_frameworks, check=False)
             print("- Merging Ivy Bridge PrivateFrameworks")
-            utilities.elevated(["rsync", "-r", "-i", "-a", f"{self.constants.payload_apple_private_frameworks_path_accel_ivy}/", self.mount_private_frameworks], stdout=subprocess.PIPE)
+            self.operations.merge(self.constants.payload_apple_private_frameworks_path_accel_ivy, self.mount_private_frameworks, check=False)
         else:
             print("- Installing basic Ivy Bridge Kext patches for generic OS")
             self.add_new_binaries(sys_patch_data.AddIntelGen3Accel, self.constants.legacy_intel_gen3_path)
@@ -492,38 +445,36 @@ set million colour before rebooting"""
             print("- Installing Kepler Acceleration Kext patches for Monterey")
             self.add_new_binaries(sys_patch_data.AddNvidiaKeplerAccel11, self.constants.legacy_nvidia_kepler_path)
             print("- Merging Kepler Frameworks")
-            utilities.elevated(["rsync", "-r", "-i", "-a", f"{self.constants.payload_apple_frameworks_path_accel_kepler}/", self.mount_frameworks], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            self.operations.merge(self.constants.payload_apple_frameworks_path_accel_kepler, self.mount_frameworks, check=False)
         else:
             print("- Installing Kepler Kext patches for generic OS")
             self.add_new_binaries(sys_patch_data.AddNvidiaKeplerAccel11, self.constants.legacy_nvidia_kepler_path)
 
     def gpu_accel_legacy_gva(self):
         print("- Merging AppleGVA Hardware Accel patches for non-Metal")
-        utilities.elevated(["rsync", "-r", "-i", "-a", f"{self.constants.payload_apple_private_frameworks_path_legacy_drm}/", self.mount_private_frameworks], stdout=subprocess.PIPE)
+        self.operations.merge(self.constants.payload_apple_private_frameworks_path_legacy_drm, self.mount_private_frameworks, check=False)
 
     def gpu_accel_legacy_extended(self):
         if self.constants.detected_os == os_data.os_data.monterey:
             self.add_legacy_dropbox_patch()
 
         print("- Merging general legacy Frameworks")
-        utilities.elevated(["rsync", "-r", "-i", "-a", f"{self.constants.payload_apple_frameworks_path_accel}/", self.mount_frameworks], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        self.operations.merge(self.constants.payload_apple_frameworks_path_accel, self.mount_frameworks, check=False)
         if self.constants.detected_os > os_data.os_data.big_sur:
             print("- Merging Monterey WebKit patch")
-            utilities.elevated(["rsync", "-r", "-i", "-a", f"{self.constants.payload_apple_frameworks_path_accel_ivy}/", self.mount_frameworks], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            self.operations.merge(self.constants.payload_apple_frameworks_path_accel_ivy, self.mount_frameworks, check=False)
 
         print("- Merging general legacy PrivateFrameworks")
-        utilities.elevated(["rsync", "-r", "-i", "-a", f"{self.constants.payload_apple_private_frameworks_path_accel}/", self.mount_private_frameworks], stdout=subprocess.PIPE)
+        self.operations.merge(self.constants.payload_apple_private_frameworks_path_accel, self.mount_private_frameworks, check=False)
         if self.constants.detected_os > os_data.os_data.catalina:
             # With PatcherSupportPkg v0.2.0, IOHID-Fixup.plist is deprecated and integrated into SkyLight patch set
             if (Path(self.mount_lauchd) / Path("IOHID-Fixup.plist")).exists():
                 print("- Stripping legacy IOHID-Fixup.plist")
-                utilities.process_status(
-                    utilities.elevated(["rm", "-f", f"{self.mount_lauchd}/IOHID-Fixup.plist"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-                )
+                self.operations.remove(f"{self.mount_lauchd}/IOHID-Fixup.plist", missing_ok=True)
         else:
             print("- Disabling Library Validation")
             utilities.process_status(
-                utilities.elevated(
+                self.elevated(
                     ["defaults", "write", "/Library/Preferences/com.apple.security.libraryvalidation.plist", "DisableLibraryValidation", "-bool", "true"],
                     stdout=subprocess.PIPE,
                     stderr=subprocess.STDOUT,
@@ -532,13 +483,13 @@ set million colour before rebooting"""
 
     def gpu_accel_legacy_extended_ts2(self):
         print("- Merging TeraScale 2 legacy Frameworks")
-        utilities.elevated(["rsync", "-r", "-i", "-a", f"{self.constants.payload_apple_frameworks_path_accel_ts2}/", self.mount_frameworks], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        self.operations.merge(self.constants.payload_apple_frameworks_path_accel_ts2, self.mount_frameworks, check=False)
 
         print("- Merging TeraScale 2 PrivateFrameworks")
-        utilities.elevated(["rsync", "-r", "-i", "-a", f"{self.constants.payload_apple_private_frameworks_path_accel_ts2}/", self.mount_private_frameworks], stdout=subprocess.PIPE)
+        self.operations.merge(self.constants.payload_apple_private_frameworks_path_accel_ts2, self.mount_private_frameworks, check=False)
         if self.validate is False:
             print("- Fixing Acceleration in CMIO")
-            utilities.process_status(subprocess.run(["defaults", "write", "com.apple.cmio", "CMIO_Unit_Input_ASC.DoNotUseOpenCL", "-bool", "true"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT))
+            utilities.process_status(self.run_command(["defaults", "write", "com.apple.cmio", "CMIO_Unit_Input_ASC.DoNotUseOpenCL", "-bool", "true"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT))
 
     def patch_root_vol(self):
         print(f"- Running patches for {self.model}")
@@ -634,39 +585,66 @@ set million colour before rebooting"""
             print("- Installing Legacy Keyboard Backlight support")
             self.add_legacy_keyboard_backlight_patch()
 
+        self.extract_payloads()
+
+        # Originals of every touched path are journaled on the root volume for manual unpatching
+        results = self.operations.run(journal_path=self.mount_journal)
+        if self.root_volume_unchanged(results):
+            print("- No changes to the root volume, skipping kernel cache rebuild")
+            self.success_status = True
+            if self.validate is False:
+                # Left mounted otherwise, rebuild_snapshot() would have unmounted it after blessing
+                self.unmount_drive()
+            if self.constants.gui_mode is False:
+                input("\nPress [ENTER] to continue")
+            return
+
         if self.validate is False:
             self.rebuild_snapshot()
 
+    def root_volume_unchanged(self, results):
+        # The kernel cache and snapshot only need rebuilding when files changed,
+        # or an earlier run changed them without the booted snapshot picking them up
+        if self.constants.detected_os <= os_data.os_data.catalina:
+            # Patches land on the live volume, nothing records whether the last cache rebuild succeeded
+            return False
+        if any(result["Changed"] for result in results):
+            return False
+        return privileged_helper.journal_generation(self.mount_journal) == privileged_helper.journal_generation(self.booted_journal)
+
+    def support_pkg_os(self):
+        if self.constants.detected_os == os_data.os_data.monterey:
+            return "12-Monterey"
+        elif self.constants.detected_os == os_data.os_data.big_sur:
+            return "11-Big-Sur"
+        elif self.constants.detected_os == os_data.os_data.catalina:
+            return "10.15-Catalina"
+        elif self.constants.detected_os == os_data.os_data.mojave:
+            return "10.14-Mojave"
+        return None
+
+    def support_pkg_store(self):
+        return patcher_support_pkg.SupportPkgStore(self.constants, self.support_pkg_os())
+
     def check_files(self):
-        if Path(self.constants.payload_apple_root_path).exists():
-            print("- Found Apple Binaries")
+        if self.support_pkg_os() is not None and self.support_pkg_store().available():
+            # Stored releases are reused, patching again never downloads the same release twice
+            print(f"- Found Apple Binaries (PatcherSupportPkg {self.constants.patcher_support_pkg_version})")
             if self.constants.gui_mode is False:
                 patch_input = input("Would you like to redownload?(y/n): ")
                 if patch_input in {"y", "Y", "yes", "Yes"}:
-                    shutil.rmtree(Path(self.constants.payload_apple_root_path))
+                    self.support_pkg_store().remove()
                     self.download_files()
-            else:
-                self.download_files()
         else:
             print("- Apple binaries missing")
             self.download_files()
 
     def download_files(self):
-        if self.constants.detected_os == os_data.os_data.monterey:
-            os_ver = "12-Monterey"
-        elif self.constants.detected_os == os_data.os_data.big_sur:
-            os_ver = "11-Big-Sur"
-        elif self.constants.detected_os == os_data.os_data.catalina:
-            os_ver = "10.15-Catalina"
-        elif self.constants.detected_os == os_data.os_data.mojave:
-            os_ver = "10.14-Mojave"
-        else:
+        os_ver = self.support_pkg_os()
+        if os_ver is None:
             raise Exception(f"Unsupported OS: {self.constants.detected_os}")
         link = f"{self.constants.url_patcher_support_pkg}{self.constants.patcher_support_pkg_version}/{os_ver}.zip"
 
-        if Path(self.constants.payload_apple_root_path).exists():
-            print("- Removing old Apple Binaries folder")
-            Path(self.constants.payload_apple_root_path).unlink()
         if Path(self.constants.payload_apple_root_path_zip).exists():
             print("- Removing old Apple Binaries zip")
             Path(self.constants.payload_apple_root_path_zip).unlink()
@@ -675,32 +653,50 @@ set million colour before rebooting"""
         local_zip = Path(self.constants.payload_path) / f"{os_ver}.zip"
         if Path(local_zip).exists():
             print(f"- Found local {os_ver} zip, skipping download")
-            print(f"- Duplicating into Apple.zip")
-            shutil.copy(local_zip, self.constants.payload_apple_root_path_zip)
+            print(f"- Linking into Apple.zip")
+            try:
+                os.link(local_zip, self.constants.payload_apple_root_path_zip)
+            except OSError:
+                shutil.copy(local_zip, self.constants.payload_apple_root_path_zip)
             download_result = True
         else:
             download_result = utilities.download_file(link, self.constants.payload_apple_root_path_zip)
 
         if download_result and self.constants.payload_apple_root_path_zip.exists():
             print("- Download completed")
-            print("- Unzipping download...")
-            try:
-                utilities.process_status(subprocess.run(["unzip", self.constants.payload_apple_root_path_zip], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, cwd=self.constants.payload_path))
-                print("- Renaming folder")
-                os.rename(self.constants.payload_path / Path(os_ver), self.constants.payload_apple_root_path)
-                Path(self.constants.payload_apple_root_path_zip).unlink()
-                print("- Binaries downloaded to:")
-                print(self.constants.payload_path)
-                # if self.constants.gui_mode is False:
-                #     input("Press [ENTER] to continue")
-            except zipfile.BadZipFile:
+            if not zipfile.is_zipfile(self.constants.payload_apple_root_path_zip):
                 print("- Couldn't unzip")
+                Path(self.constants.payload_apple_root_path_zip).unlink()
                 return
+            # Kept zipped in the store, payloads are extracted once the patch set is known
+            self.support_pkg_store().add_archive(self.constants.payload_apple_root_path_zip, None if download_result is True else download_result.hexdigest())
+            print("- Binaries downloaded to:")
+            print(self.constants.support_pkg_store_path)
+            # if self.constants.gui_mode is False:
+            #     input("Press [ENTER] to continue")
         else:
             print("- Download failed, please verify the below link works:")
             print(link)
             input("Press [ENTER] to continue")
 
+    def extract_payloads(self):
+        # Only the payloads used by the queued patch set are placed in payload_apple_root_path, hardlinked from the store
+        if self.support_pkg_os() is None or not self.support_pkg_store().available():
+            # Extracted beforehand, ie. by older patchers
+            return
+        payloads = set()
+        for operation in self.operations.operations:
+            if "Source" not in operation:
+                continue
+            try:
+                payloads.add(Path(operation["Source"]).relative_to(self.constants.payload_apple_root_path).as_posix())
+            except ValueError:
+                # Not part of PatcherSupportPkg
+                continue
+        print(f"- Extracting {len(payloads)} payloads from PatcherSupportPkg {self.constants.patcher_support_pkg_version}")
+        inflated = self.support_pkg_store().materialize(self.constants.payload_apple_root_path, sorted(payloads))
+        print(f"- Inflated {inflated} new files")
+
     def detect_gpus(self):
         gpus = self.constants.computer.gpus
         if self.constants.moj_cat_accel is True:
@@ -791,7 +787,7 @@ set million colour before rebooting"""
             if self.constants.detected_os > os_data.os_data.catalina:
                 self.brightness_legacy = True
 
-        if self.model in ["iMac7,1", "iMac8,1"] or (self.model in model_array.LegacyAudio and utilities.check_kext_loaded("AppleALC", self.constants.detected_os) is False):
+        if self.model in ["iMac7,1", "iMac8,1"] or (self.model in model_array.LegacyAudio and self.kext_loaded("AppleALC") is False):
             # Special hack for systems with botched GOPs
             # TL;DR: No Boot Screen breaks Lilu, therefore breaking audio
             if self.constants.detected_os > os_data.os_data.catalina:
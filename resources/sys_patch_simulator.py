@@ -0,0 +1,194 @@
+# Simulated root patching
+# Runs PatchSysVolume against a scratch root volume seeded from a manifest, macOS tools are recorded instead of run
+# Allows benchmarking and diffing patch sets off a Mac, ie. CI on Linux
+
+import copy
+import json
+import os
+import shutil
+import subprocess
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+from resources import privileged_helper, sys_patch
+
+# Root volume locations touched by root patching, captured by create_manifest()
+SEEDED_LOCATIONS = [
+    "System/Library/CoreServices",
+    "System/Library/Extensions",
+    "System/Library/Frameworks",
+    "System/Library/LaunchDaemons",
+    "System/Library/PrivateFrameworks",
+    "usr/libexec",
+]
+
+# Stand-in output where sys_patch inspects it
+STAND_IN_OUTPUT = {
+    "kextcache": b"KernelCache ID: 00000000000000000000000000000000\n",
+}
+
+# PatchSysVolume flags listed in the report
+PATCH_FLAGS = [
+    "nvidia_legacy",
+    "kepler_gpu",
+    "amd_ts1",
+    "amd_ts2",
+    "iron_gpu",
+    "sandy_gpu",
+    "ivy_gpu",
+    "brightness_legacy",
+    "legacy_audio",
+    "legacy_wifi",
+    "legacy_gmux",
+    "legacy_keyboard_backlight",
+]
+
+
+def capture_tree(root, locations):
+    tree = {"Files": {}, "Symlinks": {}}
+    for location in locations:
+        for directory, directories, files in os.walk(Path(root) / location):
+            for name in directories + files:
+                path = Path(directory) / name
+                relative_path = str(path.relative_to(root))
+                if path.is_symlink():
+                    tree["Symlinks"][relative_path] = os.readlink(path)
+                elif path.is_file():
+                    tree["Files"][relative_path] = path.stat().st_size
+    return tree
+
+
+def create_manifest(volume_path, kernel_release, payload_path=None):
+    # Manifest of an existing root volume, ie. captured on a Mac for simulating elsewhere
+    # Payloads are optional, the simulation otherwise uses the extracted PatcherSupportPkg
+    manifest = {"Kernel Release": kernel_release, "Volume": capture_tree(volume_path, SEEDED_LOCATIONS)}
+    if payload_path is not None:
+        manifest["Payloads"] = capture_tree(payload_path, ["Apple"])
+    return manifest
+
+
+def save_manifest(manifest_path, volume_path, kernel_release, payload_path=None):
+    # Entry point for '--create_patch_manifest', run on a Mac against its booted root volume
+    Path(manifest_path).write_text(json.dumps(create_manifest(volume_path, kernel_release, payload_path), indent=4))
+    print(f"- Root volume manifest saved to {manifest_path}")
+
+
+def seed_tree(root, tree):
+    # Files get unique contents at their recorded size, so hashing and deduplication behave as on a real volume
+    for relative_path, size in tree["Files"].items():
+        path = Path(root) / relative_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("wb") as file:
+            file.write(relative_path.encode()[:size])
+            file.truncate(size)
+    for relative_path, target in tree["Symlinks"].items():
+        path = Path(root) / relative_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if not path.is_symlink():
+            path.symlink_to(target)
+
+
+class SimulatedPatchSysVolume(sys_patch.PatchSysVolume):
+    def __init__(self, model, versions, manifest, scratch_path):
+        # Settings are copied, the simulated OS must not leak into the caller's
+        versions = copy.deepcopy(versions)
+        versions.detected_os = int(manifest["Kernel Release"].partition(".")[0])
+        versions.detected_os_minor = int(manifest["Kernel Release"].partition(".")[2].partition(".")[0])
+        # Stand-ins never wait for input
+        versions.gui_mode = True
+        super().__init__(model, versions)
+        self.manifest = manifest
+        self.scratch_path = Path(scratch_path)
+        self.commands = []
+        self.timings = {}
+
+        self.operations.in_process = True
+        self.set_mount_location(str(self.scratch_path / Path("Volume")), str(self.scratch_path / Path("Data")))
+        # 'bless --create-snapshot' copies the journal here, as if the new snapshot was booted
+        self.booted_journal = str(self.scratch_path / Path("Booted/OCLP-Patch-Journal"))
+        if "Payloads" in manifest:
+            self.constants.payload_path = self.scratch_path / Path("payloads")
+        self.seed()
+
+    def seed(self):
+        if (self.scratch_path / Path("Volume")).exists():
+            # Reused scratch roots keep their patched state, allowing repeat runs to be measured
+            return
+        print(f"- Seeding simulated root volume at {self.scratch_path}")
+        seed_tree(self.mount_location, self.manifest["Volume"])
+        Path(self.mount_application_support).mkdir(parents=True, exist_ok=True)
+        if "Payloads" in self.manifest:
+            seed_tree(self.constants.payload_path, self.manifest["Payloads"])
+
+    def extract_payloads(self):
+        if "Payloads" in self.manifest:
+            # Seeded payloads stand in for PatcherSupportPkg
+            return
+        super().extract_payloads()
+
+    def record_command(self, command, elevated):
+        command = [str(argument) for argument in command]
+        self.commands.append({"command": command, "elevated": elevated})
+        if command[:2] == ["bless", "--folder"] and "--create-snapshot" in command:
+            Path(self.booted_journal).mkdir(parents=True, exist_ok=True)
+            if (Path(self.mount_journal) / Path("Journal.json")).exists():
+                shutil.copy(Path(self.mount_journal) / Path("Journal.json"), self.booted_journal)
+        return subprocess.CompletedProcess(command, 0, stdout=STAND_IN_OUTPUT.get(command[0], b""), stderr=b"")
+
+    def elevated(self, *args, **kwargs):
+        return self.record_command(args[0], True)
+
+    def run_command(self, *args, **kwargs):
+        return self.record_command(args[0], False)
+
+    def kext_loaded(self, kext_name):
+        return kext_name in self.manifest.get("Loaded Kexts", [])
+
+    @contextmanager
+    def timed(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = time.perf_counter() - start
+
+    def simulate(self):
+        # Ownership changes require root, without it only contents and modes are compared
+        apply_ownership = privileged_helper.apply_ownership
+        privileged_helper.apply_ownership = os.getuid() == 0
+        try:
+            with self.timed("detect_patch_set"):
+                self.detect_patch_set()
+            with self.timed("patch_root_vol"):
+                self.patch_root_vol()
+        finally:
+            privileged_helper.apply_ownership = apply_ownership
+        durations = [operation["Duration"] for operation in self.operations.history]
+        # Everything outside of timings is identical between runs with the same result, allowing reports to be diffed
+        operations = [{key: value for key, value in operation.items() if key != "Duration"} for operation in self.operations.history]
+        return {
+            "patcher_version": self.constants.patcher_version,
+            "model": self.model,
+            "kernel_release": self.manifest["Kernel Release"],
+            "patches": {flag: getattr(self, flag) for flag in PATCH_FLAGS},
+            "changed": any(operation["Changed"] for operation in operations),
+            "operations": operations,
+            "commands": self.commands,
+            # Duration of each entry in operations, in the same order
+            "timings": {
+                "date": datetime.now().isoformat(timespec="seconds"),
+                **self.timings,
+                "operations": sum(durations),
+                "operation_durations": durations,
+            },
+        }
+
+
+def simulate_patch(model, versions, manifest_path, scratch_path):
+    manifest = json.loads(Path(manifest_path).read_text())
+    report = SimulatedPatchSysVolume(model, versions, manifest, scratch_path).simulate()
+    Path(versions.patch_simulation_path).write_text(json.dumps(report, indent=4))
+    print(f"- Patch simulation report saved to {versions.patch_simulation_path}")
+    return report
@@ -6,6 +6,7 @@ import math
 import os
 import plistlib
 import subprocess
+import zipfile
 from pathlib import Path
 import os
 import binascii
@@ -13,16 +14,7 @@ import argparse
 from ctypes import CDLL, c_uint, byref
 import sys, time
 
-try:
-    import requests
-except ImportError:
-    subprocess.run(["pip3", "install", "requests"], stdout=subprocess.PIPE)
-    try:
-        import requests
-    except ImportError:
-        raise Exception("Missing requests library!\nPlease run the following before starting OCLP:\npip3 install requests")
-
-from resources import constants, ioreg
+from resources import constants, downloader, ioreg_backend
 from data import sip_data, os_data
 
 
@@ -270,17 +262,11 @@ def get_nvram(variable: str, uuid: str = None, *, decode: bool = False):
     else:
         uuid = ""
 
-    nvram = ioreg.IORegistryEntryFromPath(ioreg.kIOMasterPortDefault, "IODeviceTree:/options".encode())
-
-    value = ioreg.IORegistryEntryCreateCFProperty(nvram, f"{uuid}{variable}", ioreg.kCFAllocatorDefault, ioreg.kNilOptions)
-
-    ioreg.IOObjectRelease(nvram)
+    value = ioreg_backend.get_backend().get_nvram(f"{uuid}{variable}")
 
     if not value:
         return None
 
-    value = ioreg.corefoundation_to_native(value)
-
     if decode and isinstance(value, bytes):
         value = value.strip(b"\0").decode()
     return value
@@ -289,23 +275,31 @@ def get_nvram(variable: str, uuid: str = None, *, decode: bool = False):
 def get_rom(variable: str, *, decode: bool = False):
     # TODO: Properly fix for El Capitan, which does not print the XML representation even though we say to
 
-    rom = ioreg.IORegistryEntryFromPath(ioreg.kIOMasterPortDefault, "IODeviceTree:/rom".encode())
-
-    value = ioreg.IORegistryEntryCreateCFProperty(rom, variable, ioreg.kCFAllocatorDefault, ioreg.kNilOptions)
-
-    ioreg.IOObjectRelease(rom)
+    value = ioreg_backend.get_backend().get_rom(variable)
 
     if not value:
         return None
 
-    value = ioreg.corefoundation_to_native(value)
-
     if decode and isinstance(value, bytes):
         value = value.strip(b"\0").decode()
     return value
 
 
+def import_requests():
+    # requests accounts for most of the patcher's import time, only load it once a download happens
+    try:
+        import requests
+    except ImportError:
+        subprocess.run(["pip3", "install", "requests"], stdout=subprocess.PIPE)
+        try:
+            import requests
+        except ImportError:
+            raise Exception("Missing requests library!\nPlease run the following before starting OCLP:\npip3 install requests")
+    return requests
+
+
 def verify_network_connection(url):
+    requests = import_requests()
     try:
         response = requests.head(url, timeout=5)
         return True
@@ -313,20 +307,17 @@ def verify_network_connection(url):
         return False
 
 def download_file(link, location, is_gui=None):
-    if verify_network_connection(link):
+    requests = import_requests()
+    download = downloader.Download(requests, link, location)
+    if download.probe():
         if Path(location).exists():
             Path(location).unlink()
-        try:
-            # Handle cases where Content-Length has garbage or is missing
-            total_file_size = int(requests.head(link).headers['Content-Length'])
-        except KeyError:
-            total_file_size = 0
+        total_file_size = download.total_size
         if total_file_size != 0:
             file_size_rounded = round(total_file_size / 1024 / 1024, 2)
             file_size_string = f" of {file_size_rounded}MB"
         else:
             file_size_string = ""
-        response = requests.get(link, stream=True)
         short_link = os.path.basename(link)
         # SU Catalog's link is quite long, strip to make it bearable
         if "sucatalog.gz" in short_link:
@@ -334,24 +325,24 @@ def download_file(link, location, is_gui=None):
         header = f"# Downloading: {short_link} #"
         box_length = len(header)
         box_string = "#" * box_length
-        dl = 0
-        total_downloaded_string = ""
-        with location.open("wb") as file:
-            count = 0
-            start = time.perf_counter()
-            for chunk in response.iter_content(1024 * 1024 * 4):
-                dl += len(chunk)
-                file.write(chunk)
-                count += len(chunk)
-                if is_gui is None:
-                    cls()
-                    print(box_string)
-                    print(header)
-                    print(box_string)
-                    print("")
-                if total_file_size != 0:
-                    total_downloaded_string = f" ({round(float(dl / total_file_size * 100), 2)}%)"
-                print(f"{round(count / 1024 / 1024, 2)}MB Downloaded{file_size_string}{total_downloaded_string}\nAverage Download Speed: {round(dl//(time.perf_counter() - start) / 100000 / 8, 2)} MB/s")
+        start = time.perf_counter()
+
+        def print_progress(dl, total_file_size):
+            total_downloaded_string = ""
+            if is_gui is None:
+                cls()
+                print(box_string)
+                print(header)
+                print(box_string)
+                print("")
+            if total_file_size != 0:
+                total_downloaded_string = f" ({round(float(dl / total_file_size * 100), 2)}%)"
+            # Resumed bytes were not downloaded by this session
+            print(f"{round(dl / 1024 / 1024, 2)}MB Downloaded{file_size_string}{total_downloaded_string}\nAverage Download Speed: {round((dl - download.resumed)//max(time.perf_counter() - start, 0.001) / 100000 / 8, 2)} MB/s")
+
+        if download.run(print_progress) is False:
+            return None
+        location = Path(location)
         checksum = hashlib.sha256()
         with location.open("rb") as file:
             chunk = file.read(1024 * 1024 * 16)
@@ -375,6 +366,32 @@ def download_file(link, location, is_gui=None):
             print(link)
         return None
 
+def extract_archive(archive_path, destination, top_level_suffix=None):
+    # Extracts directly from the payload archive, skipping macOS resource forks (__MACOSX)
+    # If top_level_suffix is set, only members within matching top level folders are extracted (ie. ".kext")
+    # Returns the compressed and uncompressed size of the extracted members
+    bytes_read = 0
+    bytes_written = 0
+    with zipfile.ZipFile(archive_path) as archive:
+        for member in archive.infolist():
+            top_level = member.filename.split("/")[0]
+            if top_level == "__MACOSX":
+                continue
+            if top_level_suffix and not top_level.endswith(top_level_suffix):
+                continue
+            archive.extract(member, destination)
+            bytes_read += member.compress_size
+            bytes_written += member.file_size
+    return bytes_read, bytes_written
+
+
+def archive_top_levels(archive_path, top_level_suffix=None):
+    # Top level names extract_archive() creates in its destination
+    with zipfile.ZipFile(archive_path) as archive:
+        top_levels = {member.filename.split("/")[0] for member in archive.infolist()}
+    return {top_level for top_level in top_levels if top_level != "__MACOSX" and (not top_level_suffix or top_level.endswith(top_level_suffix))}
+
+
 def elevated(*args, **kwargs) -> subprocess.CompletedProcess:
     # When runnign through our GUI, we run as root, however we do not get uid 0
     # Best to assume CLI is running as root
@@ -384,9 +401,10 @@ def elevated(*args, **kwargs) -> subprocess.CompletedProcess:
         return subprocess.run(["sudo"] + [args[0][0]] + args[0][1:], **kwargs)
 
 
-def check_cli_args():
+def parse_cli_args():
     parser = argparse.ArgumentParser()
     parser.add_argument("--build", help="Build OpenCore", action="store_true", required=False)
+    parser.add_argument("--plan", help="Save the planned OpenCore build to Build-Plan.plist without building", action="store_true", required=False)
     parser.add_argument("--verbose", help="Enable verbose boot", action="store_true", required=False)
     parser.add_argument("--debug_oc", help="Enable OpenCore DEBUG", action="store_true", required=False)
     parser.add_argument("--debug_kext", help="Enable kext DEBUG", action="store_true", required=False)
@@ -403,6 +421,9 @@ def check_cli_args():
     parser.add_argument("--moj_cat_accel", help="Allow Root Patching on Mojave and Catalina", action="store_true", required=False)
     parser.add_argument("--disable_tb", help="Disable Thunderbolt on 2013-2014 MacBook Pros", action="store_true", required=False)
     parser.add_argument("--force_surplus", help="Force SurPlus in all newer OSes", action="store_true", required=False)
+    parser.add_argument("--build_cache", help="Reuse cached EFI builds with identical settings", action="store_true", required=False)
+    parser.add_argument("--profile_build", "--profile-build", help="Save per-phase build timings to Build-Profile.json", action="store_true", required=False)
+    parser.add_argument("--verify_cache", "--verify-cache", help="Rehash cached OpenCore trees before reusing them", action="store_true", required=False)
 
     # Building args requiring value values (ie. --model iMac12,2)
     parser.add_argument("--model", action="store", help="Set custom model", required=False)
@@ -412,11 +433,23 @@ def check_cli_args():
     # sys_patch args
     parser.add_argument("--patch_sys_vol", help="Patches root volume", action="store_true", required=False)
     parser.add_argument("--unpatch_sys_vol", help="Unpatches root volume, EXPERIMENTAL", action="store_true", required=False)
+    parser.add_argument("--privileged_helper", help=argparse.SUPPRESS, action="store_true", required=False)
+    parser.add_argument("--simulate_patch", action="store", help="Simulate root patching against a root volume manifest, saves Patch-Simulation.json", required=False)
+    parser.add_argument("--create_patch_manifest", action="store", help="Save a manifest of the booted root volume for --simulate_patch", required=False)
 
     # validation args
     parser.add_argument("--validate", help="Runs Validation Tests for CI", action="store_true", required=False)
-    args = parser.parse_args()
-    if not (args.build or args.patch_sys_vol or args.unpatch_sys_vol or args.validate):
+
+    # IORegistry args, applied before hardware probing
+    parser.add_argument("--ioreg_record", action="store", help="Save the probed IORegistry to a plist for replaying", required=False)
+    parser.add_argument("--ioreg_replay", action="store", help="Probe hardware from a recorded IORegistry plist", required=False)
+    parser.add_argument("--reprobe", help="Ignore hardware cached from earlier launches this boot", action="store_true", required=False)
+    return parser.parse_args()
+
+
+def check_cli_args():
+    args = parse_cli_args()
+    if not (args.build or args.plan or args.patch_sys_vol or args.unpatch_sys_vol or args.simulate_patch or args.create_patch_manifest or args.validate):
         return None
     else:
         return args
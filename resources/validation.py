@@ -1,11 +1,73 @@
-import subprocess
-from resources import build
+import contextlib
+import copy
+import io
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from resources import build, config_validator
 from data import example_data, model_array
 
+# Settings shared by every job in a worker, sent once per worker process instead of with each job
+worker_settings = None
+
+# Second validation run, flips all settings
+FLIPPED_SETTINGS = {
+    "verbose_debug": True,
+    "opencore_debug": True,
+    "opencore_build": "DEBUG",
+    "kext_debug": True,
+    "kext_variant": "DEBUG",
+    "showpicker": False,
+    "sip_status": False,
+    "secure_status": True,
+    "firewire_boot": True,
+    "nvme_boot": True,
+    "enable_wake_on_wlan": True,
+    "disable_tb": True,
+    "force_surplus": True,
+    "software_demux": True,
+    "serial_settings": "Minimal",
+}
+
+
+def init_worker(settings):
+    global worker_settings
+    worker_settings = settings
+
+
+def validate_job(label, model, computer, overrides):
+    # Builds and validates a single model inside its own scratch build root
+    # Runs inside a worker process, output is captured and returned for the report
+    # Builds modify their settings, each job starts from its own copy of the worker's
+    settings = copy.deepcopy(worker_settings)
+    if computer is None:
+        settings.custom_model = model
+    else:
+        settings.computer = computer
+        settings.custom_model = ""
+    for name, value in overrides.items():
+        setattr(settings, name, value)
+    output = io.StringIO()
+    scratch_root = Path(tempfile.mkdtemp(prefix="OCLP-Validation-"))
+    settings.current_path = scratch_root
+    try:
+        with contextlib.redirect_stdout(output):
+            build.BuildOpenCore(model, settings).build_opencore()
+        errors = config_validator.validate_file(settings.plist_path, settings.plist_template)
+        if errors:
+            return (label, model, False, output.getvalue() + "\n".join(str(error) for error in errors))
+        return (label, model, True, "")
+    except Exception as error:
+        return (label, model, False, output.getvalue() + f"{type(error).__name__}: {error}")
+    finally:
+        shutil.rmtree(scratch_root, ignore_errors=True)
+
 
 def validate(settings):
     # Runs through ocvalidate to check for errors
-
     valid_dumps = [
         example_data.MacBookPro.MacBookPro92_Stock,
         # example_data.MacBookPro.MacBookPro171_Stock,
@@ -25,52 +87,31 @@ def validate(settings):
 
     settings.validate = True
 
-    def build_prebuilt():
-        for model in model_array.SupportedSMBIOS:
-            print(f"Validating predefined model: {model}")
-            settings.custom_model = model
-            build.BuildOpenCore(settings.custom_model, settings).build_opencore()
-            result = subprocess.run([settings.ocvalidate_path, f"{settings.opencore_release_folder}/EFI/OC/config.plist"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-            if result.returncode != 0:
-                print("Error on build!")
-                print(result.stdout.decode())
-                raise Exception(f"Validation failed for predefined model: {model}")
-            else:
-                print(f"Validation succeeded for predefined model: {model}")
-
-    def build_dumps():
-        for model in valid_dumps:
-            settings.computer = model
-            settings.custom_model = ""
-            print(f"Validating dumped model: {settings.computer.real_model}")
-            build.BuildOpenCore(settings.computer.real_model, settings).build_opencore()
-            result = subprocess.run([settings.ocvalidate_path, f"{settings.opencore_release_folder}/EFI/OC/config.plist"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-            if result.returncode != 0:
-                print("Error on build!")
-                print(result.stdout.decode())
-                raise Exception(f"Validation failed for predefined model: {settings.computer.real_model}")
-            else:
-                print(f"Validation succeeded for predefined model: {settings.computer.real_model}")
+    def build_jobs(label, overrides):
+        # Jobs only carry what differs between builds
+        jobs = [(f"{label} predefined", model, None, overrides) for model in model_array.SupportedSMBIOS]
+        jobs += [(f"{label} dumped", model.real_model, model, overrides) for model in valid_dumps]
+        return jobs
 
     # First run is with default settings
-    build_prebuilt()
-    build_dumps()
-    # Second run, flip all settings
-    settings.verbose_debug = True
-    settings.opencore_debug = True
-    settings.opencore_build = "DEBUG"
-    settings.kext_debug = True
-    settings.kext_variant = "DEBUG"
-    settings.kext_debug = True
-    settings.showpicker = False
-    settings.sip_status = False
-    settings.secure_status = True
-    settings.firewire_boot = True
-    settings.nvme_boot = True
-    settings.enable_wake_on_wlan = True
-    settings.disable_tb = True
-    settings.force_surplus = True
-    settings.software_demux = True
-    settings.serial_settings = "Minimal"
-    build_prebuilt()
-    build_dumps()
+    jobs = build_jobs("Default", {})
+    jobs += build_jobs("Flipped", FLIPPED_SETTINGS)
+
+    # Past a handful of processes, start up and memory cost more than the extra builds save
+    workers = min(8, os.cpu_count() or 1)
+    print(f"- Validating {len(jobs)} builds across {workers} processes")
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(settings,)) as executor:
+        results = list(executor.map(validate_job, *zip(*jobs)))
+
+    failed = []
+    for label, model, success, output in results:
+        if success is True:
+            print(f"Validation succeeded for {label} model: {model}")
+        else:
+            print(f"Validation failed for {label} model: {model}")
+            print(output)
+            failed.append(f"{model} ({label})")
+
+    print(f"- {len(results) - len(failed)}/{len(results)} builds passed validation")
+    if failed:
+        raise Exception(f"Validation failed for models: {', '.join(failed)}")
@@ -0,0 +1,96 @@
+# BuildOpenCore archive staging, run against a scratch build root
+
+import copy
+import os
+import plistlib
+import shutil
+import tempfile
+import unittest
+import zipfile
+from pathlib import Path
+
+from resources import build, config_validator, constants, device_probe
+from data import model_array
+
+
+class StagedArchivesTest(unittest.TestCase):
+    def setUp(self):
+        self.root = Path(tempfile.mkdtemp(prefix="OCLP-Test-"))
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.settings = constants.Constants()
+        self.settings.current_path = self.root
+        self.destination = self.root / Path("Kexts")
+        self.destination.mkdir()
+
+    def archive(self, name, members):
+        archive_path = self.root / Path(name)
+        with zipfile.ZipFile(archive_path, "w") as archive:
+            for member in members:
+                archive.writestr(member, member)
+        return archive_path
+
+    def test_extracts_disjoint_archives(self):
+        builder = build.BuildOpenCore("iMac12,2", self.settings)
+        builder.stage_archive(self.archive("Lilu.zip", ["Lilu.kext/Contents/Info.plist", "__MACOSX/Lilu.kext/._Info.plist"]), self.destination, ".kext")
+        builder.stage_archive(self.archive("AppleALC.zip", ["AppleALC.kext/Contents/Info.plist", "Lilu.kext/Contents/Info.plist"]), self.destination, "ALC.kext")
+        builder.extract_staged_archives()
+        self.assertTrue((self.destination / Path("Lilu.kext/Contents/Info.plist")).exists())
+        self.assertTrue((self.destination / Path("AppleALC.kext/Contents/Info.plist")).exists())
+        self.assertFalse((self.destination / Path("__MACOSX")).exists())
+
+    def test_rejects_overlapping_archives(self):
+        builder = build.BuildOpenCore("iMac12,2", self.settings)
+        builder.stage_archive(self.archive("Lilu.zip", ["Lilu.kext/Contents/Info.plist"]), self.destination, ".kext")
+        builder.stage_archive(self.archive("Lilu-DEBUG.zip", ["Lilu.kext/Contents/MacOS/Lilu"]), self.destination, ".kext")
+        with self.assertRaisesRegex(Exception, "both extract to"):
+            builder.extract_staged_archives()
+        self.assertEqual(list(self.destination.iterdir()), [])
+
+
+class PlanTest(unittest.TestCase):
+    def setUp(self):
+        self.root = Path(tempfile.mkdtemp(prefix="OCLP-Test-"))
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.settings = constants.Constants()
+        self.settings.current_path = self.root
+        self.settings.computer = device_probe.Computer()
+
+    def test_plans_every_model_without_building(self):
+        for model in model_array.SupportedSMBIOS:
+            with self.subTest(model=model):
+                settings = copy.deepcopy(self.settings)
+                settings.custom_model = model
+                plan = build.BuildOpenCore(model, settings).plan_opencore()
+                self.assertEqual(config_validator.validate_config(plan["config"], settings.plist_template), [])
+                for archive_path, _, _ in plan["archives"]:
+                    self.assertTrue(archive_path.exists(), archive_path)
+        self.assertFalse(Path(self.settings.build_path).exists())
+
+    def test_saves_relative_plan(self):
+        self.settings.custom_model = "iMac12,2"
+        build.BuildOpenCore("iMac12,2", self.settings).save_plan(self.settings.build_plan_path)
+        plan = plistlib.loads(Path(self.settings.build_plan_path).read_bytes())
+        self.assertIn({"Archive": "OpenCore/OpenCore-RELEASE.zip", "Destination": ".", "Top Level Suffix": ""}, plan["Archives"])
+        self.assertNotIn(str(self.root), str(plan["Archives"]) + str(plan["Files"]))
+
+
+class CachedPlistTest(unittest.TestCase):
+    def test_reloads_modified_plist(self):
+        plist_path = Path(tempfile.mkdtemp(prefix="OCLP-Test-")) / Path("Info.plist")
+        self.addCleanup(shutil.rmtree, plist_path.parent, ignore_errors=True)
+        plist_path.write_bytes(plistlib.dumps({"Version": 1}))
+        self.assertEqual(build.load_cached_plist(plist_path), {"Version": 1})
+        # Loads return copies, callers may modify them freely
+        build.load_cached_plist(plist_path)["Version"] = 0
+        self.assertEqual(build.load_cached_plist(plist_path), {"Version": 1})
+
+        cached_plists = len(build.parsed_plists)
+        plist_path.write_bytes(plistlib.dumps({"Version": 10}))
+        os.utime(plist_path, ns=(0, 0))
+        self.assertEqual(build.load_cached_plist(plist_path), {"Version": 10})
+        # The stale copy is replaced rather than kept alongside
+        self.assertEqual(len(build.parsed_plists), cached_plists)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,123 @@
+# Build cache hit and miss behaviour, run against a scratch build root
+
+import shutil
+import tempfile
+import os
+import unittest
+import zipfile
+from pathlib import Path
+from unittest import mock
+
+from resources import build_cache, constants
+
+
+class BuildCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.root = Path(tempfile.mkdtemp(prefix="OCLP-Test-"))
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.settings = constants.Constants()
+        self.settings.current_path = self.root
+        self.settings.payload_path = self.root / Path("payloads")
+        self.settings.custom_model = "iMac12,2"
+        (self.settings.payload_path / Path("Kexts")).mkdir(parents=True)
+        (self.settings.payload_path / Path("Kexts/Lilu.kext")).write_bytes(b"Lilu")
+        self.build()
+
+    def build(self):
+        # Stand-in for build_opencore()
+        shutil.rmtree(self.settings.opencore_release_folder, ignore_errors=True)
+        Path(self.settings.oc_folder).mkdir(parents=True)
+        (Path(self.settings.oc_folder) / Path("config.plist")).write_text("config")
+        (Path(self.settings.oc_folder) / Path("OpenCore.efi")).write_bytes(b"OpenCore")
+
+    def test_restores_stored_build(self):
+        self.assertFalse(build_cache.BuildCache("iMac12,2", self.settings).restore())
+        build_cache.BuildCache("iMac12,2", self.settings).store()
+        shutil.rmtree(self.settings.opencore_release_folder)
+
+        self.assertTrue(build_cache.BuildCache("iMac12,2", self.settings).restore())
+        self.assertEqual((Path(self.settings.oc_folder) / Path("OpenCore.efi")).read_bytes(), b"OpenCore")
+        # plists are edited by hand after building, they must never share an inode with the cache
+        self.assertEqual((Path(self.settings.oc_folder) / Path("config.plist")).stat().st_nlink, 1)
+
+    def test_misses_on_changed_inputs(self):
+        build_cache.BuildCache("iMac12,2", self.settings).store()
+        self.assertFalse(build_cache.BuildCache("MacPro3,1", self.settings).restore())
+
+        self.settings.verbose_debug = not self.settings.verbose_debug
+        self.assertFalse(build_cache.BuildCache("iMac12,2", self.settings).restore())
+        self.settings.verbose_debug = not self.settings.verbose_debug
+
+        (self.settings.payload_path / Path("Kexts/Lilu.kext")).write_bytes(b"Lilu 1.6.0")
+        self.assertFalse(build_cache.BuildCache("iMac12,2", self.settings).restore())
+
+    def test_ignores_unique_builds(self):
+        self.settings.serial_settings = "Advanced"
+        build_cache.BuildCache("iMac12,2", self.settings).store()
+        self.assertFalse(Path(self.settings.build_cache_path).exists() and any(Path(self.settings.build_cache_path).glob("*/manifest.json")))
+        self.assertFalse(build_cache.BuildCache("iMac12,2", self.settings).restore())
+
+    def test_rebuilds_incomplete_entry(self):
+        cache = build_cache.BuildCache("iMac12,2", self.settings)
+        cache.store()
+        (cache.entry_path() / Path("OpenCore-Build/EFI/OC/OpenCore.efi")).unlink()
+        self.assertFalse(build_cache.BuildCache("iMac12,2", self.settings).restore())
+
+
+class BaseTreeCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.root = Path(tempfile.mkdtemp(prefix="OCLP-Test-"))
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.settings = constants.Constants()
+        self.settings.current_path = self.root
+        self.settings.payload_path = self.root / Path("payloads")
+        Path(self.settings.opencore_zip_source).parent.mkdir(parents=True)
+        self.write_archive(b"OpenCore")
+
+    def write_archive(self, efi):
+        with zipfile.ZipFile(self.settings.opencore_zip_source, "w") as archive:
+            archive.writestr("OpenCore-Build/EFI/OC/OpenCore.efi", efi)
+            archive.writestr("OpenCore-Build/EFI/OC/Drivers/OpenRuntime.efi", b"OpenRuntime")
+
+    def clone(self):
+        destination = self.root / Path(f"Build-{len(list(self.root.glob('Build-*')))}")
+        with mock.patch.object(build_cache, "hash_file", wraps=build_cache.hash_file) as hash_file:
+            build_cache.BaseTreeCache(self.settings).clone_into(destination)
+        return destination, hash_file.call_count
+
+    def test_reuses_tree_without_hashing(self):
+        destination, hashed = self.clone()
+        self.assertGreater(hashed, 0)
+        destination, hashed = self.clone()
+        self.assertEqual(hashed, 0)
+        self.assertEqual((destination / Path("OpenCore-Build/EFI/OC/OpenCore.efi")).read_bytes(), b"OpenCore")
+        # Signed in place when vaulting, never shared with the cache
+        self.assertEqual((destination / Path("OpenCore-Build/EFI/OC/OpenCore.efi")).stat().st_nlink, 1)
+
+    def test_repopulates_for_changed_archive(self):
+        self.clone()
+        self.write_archive(b"OpenCore 0.7.8")
+        destination, hashed = self.clone()
+        self.assertGreater(hashed, 0)
+        self.assertEqual((destination / Path("OpenCore-Build/EFI/OC/OpenCore.efi")).read_bytes(), b"OpenCore 0.7.8")
+        self.assertEqual(len(list(Path(self.settings.opencore_base_cache_path).iterdir())), 1)
+
+    def test_verify_cache_rehashes_tree(self):
+        self.clone()
+        cache = build_cache.BaseTreeCache(self.settings)
+        cache.find_entry()
+        # Same size, different contents, only caught by rehashing
+        cached_file = cache.entry_path() / Path("tree/OpenCore-Build/EFI/OC/Drivers/OpenRuntime.efi")
+        stat = cached_file.stat()
+        cached_file.write_bytes(b"0penRuntime")
+        os.utime(cached_file, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+        destination, _ = self.clone()
+        self.assertEqual((destination / Path("OpenCore-Build/EFI/OC/Drivers/OpenRuntime.efi")).read_bytes(), b"0penRuntime")
+        self.settings.verify_cache = True
+        destination, _ = self.clone()
+        self.assertEqual((destination / Path("OpenCore-Build/EFI/OC/Drivers/OpenRuntime.efi")).read_bytes(), b"OpenRuntime")
+
+
+if __name__ == "__main__":
+    unittest.main()
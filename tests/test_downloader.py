@@ -0,0 +1,179 @@
+# Ranged downloads against a local stand-in for GitHub's signed release asset redirects
+
+import http.server
+import json
+import shutil
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import requests
+
+from resources import downloader
+
+
+class AssetServer(http.server.ThreadingHTTPServer):
+    # /link redirects to a signed URL valid for a limited number of requests, like a GitHub release asset
+    def __init__(self, data):
+        super().__init__(("127.0.0.1", 0), AssetHandler)
+        self.data = data
+        self.lock = threading.Lock()
+        self.token = 0
+        self.uses = 0
+        self.expire_after = None
+        self.ranges = True
+        self.ignore_range = False
+        self.fail_from = None
+        # ETags by signed URL token, the asset is replaced for tokens listed here
+        self.etags = {}
+        self.log = []
+
+    def link(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/link"
+
+
+class AssetHandler(http.server.BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_HEAD(self):
+        self.respond(head=True)
+
+    def do_GET(self):
+        self.respond(head=False)
+
+    def send_empty(self, status, headers={}):
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def respond(self, head):
+        server = self.server
+        with server.lock:
+            server.log.append((self.command, self.path, self.headers.get("Range")))
+            if self.path == "/link":
+                server.token += 1
+                server.uses = 0
+                return self.send_empty(302, {"Location": f"/signed/{server.token}"})
+            valid = self.path == f"/signed/{server.token}" and (server.expire_after is None or server.uses < server.expire_after)
+            server.uses += 1
+        if not valid:
+            return self.send_empty(403)
+
+        status = 200
+        body = server.data
+        headers = {"ETag": server.etags.get(server.token, '"asset"')}
+        if server.ranges:
+            headers["Accept-Ranges"] = "bytes"
+        if self.headers.get("Range") and server.ranges and not server.ignore_range:
+            start, end = [int(offset) for offset in self.headers["Range"].partition("=")[2].split("-")]
+            if server.fail_from is not None and start >= server.fail_from:
+                return self.send_empty(500)
+            status = 206
+            body = server.data[start : end + 1]
+            headers["Content-Range"] = f"bytes {start}-{end}/{len(server.data)}"
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if not head:
+            self.wfile.write(body)
+
+
+class DownloadTest(unittest.TestCase):
+    def setUp(self):
+        self.root = Path(tempfile.mkdtemp(prefix="OCLP-Test-"))
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.data = bytes(range(256)) * 256
+        self.server = AssetServer(self.data)
+        threading.Thread(target=self.server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        # Small segments keep the stand-in asset small, retries and progress polling barely wait
+        for name, value in [("SEGMENT_SIZE", 4096), ("CHUNK_SIZE", 1024), ("SEGMENT_ATTEMPTS", 3)]:
+            patcher = mock.patch.object(downloader, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        sleep = downloader.time.sleep
+        patcher = mock.patch.object(downloader.time, "sleep", side_effect=lambda seconds: sleep(min(seconds, 0.01)))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.location = self.root / Path("Asset.zip")
+
+    def download(self):
+        download = downloader.Download(requests, self.server.link(), self.location, connections=2)
+        self.assertTrue(download.probe())
+        return download, download.run(lambda downloaded, total: None)
+
+    def ranged_bytes(self):
+        # Bytes requested through ranged GETs
+        total = 0
+        for method, _, byte_range in self.server.log:
+            if method == "GET" and byte_range:
+                start, end = [int(offset) for offset in byte_range.partition("=")[2].split("-")]
+                total += end + 1 - start
+        return total
+
+    def test_resumes_interrupted_download(self):
+        self.server.fail_from = len(self.data) // 2
+        download, downloaded = self.download()
+        self.assertFalse(downloaded)
+        self.assertFalse(self.location.exists())
+        state = json.loads(download.state_path.read_text())
+        self.assertEqual(sum(state["Segments"]), len(self.data) // 2)
+
+        self.server.fail_from = None
+        self.server.log = []
+        download, downloaded = self.download()
+        self.assertTrue(downloaded)
+        self.assertEqual(self.location.read_bytes(), self.data)
+        # Only the missing half is fetched again
+        self.assertEqual(self.ranged_bytes(), len(self.data) // 2)
+        self.assertFalse(download.state_path.exists())
+        self.assertFalse(download.partial_path.exists())
+
+    def test_falls_back_to_stream(self):
+        # Advertises ranges, answers with the whole file
+        self.server.ignore_range = True
+        download, downloaded = self.download()
+        self.assertTrue(downloaded)
+        self.assertEqual(self.location.read_bytes(), self.data)
+        self.assertFalse(download.state_path.exists())
+
+    def test_downloads_without_ranges(self):
+        self.server.ranges = False
+        _, downloaded = self.download()
+        self.assertTrue(downloaded)
+        self.assertEqual(self.location.read_bytes(), self.data)
+        self.assertEqual(self.ranged_bytes(), 0)
+
+    def test_resolves_expired_url(self):
+        # Each signed URL outlives a few segments only
+        self.server.expire_after = 4
+        self.server.fail_from = len(self.data) // 2
+        download, downloaded = self.download()
+        self.assertFalse(downloaded)
+        self.assertNotIn("/signed/", download.state_path.read_text())
+
+        self.server.fail_from = None
+        _, downloaded = self.download()
+        self.assertTrue(downloaded)
+        self.assertEqual(self.location.read_bytes(), self.data)
+        self.assertGreater(len([request for request in self.server.log if request[:2] == ("HEAD", "/link")]), 2)
+
+    def test_restarts_when_file_changed(self):
+        # Resolving the expired URL finds a different file, progress so far is discarded
+        self.server.expire_after = 4
+        self.server.etags[2] = '"replaced"'
+        download, downloaded = self.download()
+        self.assertFalse(downloaded)
+        self.assertFalse(download.state_path.exists())
+        self.assertFalse(download.partial_path.exists())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+# PatcherSupportPkg store, run against a scratch store and a small stand-in release zip
+
+import os
+import shutil
+import stat
+import tempfile
+import unittest
+import zipfile
+from pathlib import Path
+from unittest import mock
+
+from resources import constants, patcher_support_pkg
+
+
+class SupportPkgStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.root = Path(tempfile.mkdtemp(prefix="OCLP-Test-"))
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        patcher = mock.patch.object(constants.Constants, "support_pkg_store_path", new=property(lambda self: self.current_path / Path("Support-Pkg-Store")))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.settings = constants.Constants()
+        self.settings.current_path = self.root
+
+    def archive(self, version, files):
+        # Release zips hold a single folder named after the OS
+        archive_path = self.root / Path(f"{version}.zip")
+        with zipfile.ZipFile(archive_path, "w") as archive:
+            archive.writestr("12-Monterey/", b"")
+            for name, contents in files.items():
+                info = zipfile.ZipInfo(f"12-Monterey/{name}", date_time=(2022, 1, 1, 0, 0, 0))
+                info.external_attr = (stat.S_IFREG | 0o755) << 16
+                archive.writestr(info, contents)
+            link = zipfile.ZipInfo("12-Monterey/Frameworks/OpenGL.framework/OpenGL")
+            link.external_attr = (stat.S_IFLNK | 0o755) << 16
+            archive.writestr(link, "Versions/A/OpenGL")
+            archive.writestr("__MACOSX/12-Monterey/._Frameworks", b"")
+        return archive_path
+
+    def store(self, version, files):
+        self.settings.patcher_support_pkg_version = version
+        store = patcher_support_pkg.SupportPkgStore(self.settings, "12-Monterey")
+        store.add_archive(self.archive(version, files))
+        return store
+
+    def files(self, size=16):
+        return {
+            "Extensions/Legacy-Mux/AppleMuxControl.kext/Contents/Info.plist": b"Mux".ljust(size, b"\0"),
+            "Extensions/Legacy-GFX/AMDRadeonX3000.kext/Contents/Info.plist": b"X3000".ljust(size, b"\0"),
+            "Frameworks/OpenGL.framework/Versions/A/OpenGL": b"OpenGL".ljust(size, b"\0"),
+        }
+
+    def test_materializes_selected_payloads(self):
+        store = self.store("0.2.9", self.files())
+        self.assertTrue(store.available())
+        destination = self.root / Path("Apple")
+        self.assertEqual(store.materialize(destination, ["Extensions/Legacy-Mux", "Frameworks"]), 2)
+        self.assertEqual((destination / Path("Extensions/Legacy-Mux/AppleMuxControl.kext/Contents/Info.plist")).read_bytes(), self.files()["Extensions/Legacy-Mux/AppleMuxControl.kext/Contents/Info.plist"])
+        self.assertEqual(os.readlink(destination / Path("Frameworks/OpenGL.framework/OpenGL")), "Versions/A/OpenGL")
+        self.assertFalse((destination / Path("Extensions/Legacy-GFX")).exists())
+        self.assertEqual(stat.S_IMODE((destination / Path("Frameworks/OpenGL.framework/Versions/A/OpenGL")).stat().st_mode), 0o755)
+
+        # Inflated once, later patch sets only link the stored objects
+        self.assertEqual(store.materialize(destination, ["Extensions/Legacy-Mux"]), 0)
+        self.assertFalse((destination / Path("Frameworks")).exists())
+
+    def test_reuses_objects_across_versions(self):
+        self.store("0.2.9", self.files()).materialize(self.root / Path("Apple"), ["Extensions", "Frameworks"])
+        store = self.store("0.3.0", self.files())
+        self.assertEqual(store.materialize(self.root / Path("Apple"), ["Extensions", "Frameworks"]), 0)
+
+    def test_rejects_modified_archive(self):
+        store = self.store("0.2.9", self.files())
+        with (store.entry_path() / Path("Archive.zip")).open("r+b") as archive:
+            archive.seek(40)
+            archive.write(b"X")
+        with self.assertRaisesRegex(Exception, "does not match its SHA-256"):
+            store.materialize(self.root / Path("Apple"), ["Extensions"])
+
+    def test_evicts_least_recently_used(self):
+        with mock.patch.object(patcher_support_pkg, "STORE_LIMIT", 4096):
+            older = self.store("0.2.8", self.files(1024))
+            older.materialize(self.root / Path("Apple"), ["Extensions", "Frameworks"])
+            self.store("0.2.9", self.files(2048))
+            store = self.store("0.3.0", self.files(1536))
+        self.assertEqual(sorted(entry.name for entry in store.store_path().iterdir() if entry.name != "Objects"), ["0.3.0-12-Monterey"])
+        # Objects of evicted versions go with them
+        self.assertEqual([path for path in (store.store_path() / Path("Objects")).rglob("*") if path.is_file()], [])
+
+    def test_rejects_unsafe_paths(self):
+        with self.assertRaisesRegex(Exception, "Unsafe path"):
+            self.store("0.2.9", {"../../Library/LaunchDaemons/evil.plist": b"evil"})
+
+
+if __name__ == "__main__":
+    unittest.main()
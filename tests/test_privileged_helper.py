@@ -0,0 +1,180 @@
+# Privileged helper file operations, run in-process against a scratch root volume
+
+import os
+import shutil
+import stat
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from resources import constants, privileged_helper
+
+
+def snapshot(root):
+    # Everything rollback restores, keyed by path relative to root
+    tree = {}
+    for path in privileged_helper.walk_tree(str(root)):
+        path_stat = os.lstat(path)
+        if stat.S_ISLNK(path_stat.st_mode):
+            tree[os.path.relpath(path, root)] = ("symlink", os.readlink(path))
+        elif stat.S_ISDIR(path_stat.st_mode):
+            # Parents of journaled paths are not journaled themselves, their times change
+            tree[os.path.relpath(path, root)] = ("directory", stat.S_IMODE(path_stat.st_mode))
+        else:
+            tree[os.path.relpath(path, root)] = ("file", Path(path).read_bytes(), stat.S_IMODE(path_stat.st_mode), path_stat.st_mtime_ns)
+    return tree
+
+
+def operation(kind, path, check=True, **fields):
+    return {"Operation": kind, "Path": str(path), "Check": check, **fields}
+
+
+class HelperTest(unittest.TestCase):
+    def setUp(self):
+        self.root = Path(tempfile.mkdtemp(prefix="OCLP-Test-"))
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        # Ownership can only be changed by root
+        patcher = mock.patch.object(privileged_helper, "apply_ownership", os.getuid() == 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.owner = [os.getuid(), os.getgid()]
+
+    def write(self, path, contents, mode=0o644):
+        path = self.root / Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(contents)
+        os.chmod(path, mode)
+        return path
+
+
+class JournalTest(HelperTest):
+    def setUp(self):
+        super().setUp()
+        self.volume = self.root / Path("Volume")
+        self.journal = self.root / Path("Volume/Library/Application Support/Dortania/OCLP-Patch-Journal")
+        self.write("Volume/System/Library/Extensions/AMDRadeonX4000.kext/Contents/Info.plist", b"Stock AMDRadeonX4000")
+        self.write("Volume/System/Library/Extensions/AMDRadeonX4000.kext/Contents/MacOS/AMDRadeonX4000", b"Stock", 0o755)
+        self.write("Volume/System/Library/Extensions/IOSurface.kext/Contents/Info.plist", b"Stock IOSurface")
+        self.write("Volume/System/Library/Frameworks/OpenGL.framework/Versions/A/OpenGL", b"Stock OpenGL", 0o755)
+        os.symlink("Versions/A/OpenGL", self.volume / Path("System/Library/Frameworks/OpenGL.framework/OpenGL"))
+        self.write("Payloads/IOSurface.kext/Contents/Info.plist", b"Patched IOSurface")
+        self.write("Payloads/Frameworks/OpenGL.framework/Versions/A/OpenGL", b"Patched OpenGL", 0o755)
+        self.write("Payloads/Frameworks/OpenCL.framework/Versions/A/OpenCL", b"Patched OpenCL", 0o755)
+
+    def patch(self):
+        extensions = self.volume / Path("System/Library/Extensions")
+        return privileged_helper.run_operations(
+            [
+                operation("remove", extensions / Path("AMDRadeonX4000.kext"), **{"Missing OK": True}),
+                operation("sync", extensions / Path("IOSurface.kext"), Source=str(self.root / Path("Payloads/IOSurface.kext")), Mode=0o755, Owner=self.owner),
+                operation("sync", extensions / Path("IOSurfaceLegacy.kext"), Source=str(self.root / Path("Payloads/IOSurface.kext")), Mode=0o755, Owner=self.owner),
+                operation("merge", self.volume / Path("System/Library/Frameworks"), Source=str(self.root / Path("Payloads/Frameworks")), Permissions={}),
+            ],
+            str(self.journal),
+        )
+
+    def test_rollback_restores_originals(self):
+        original = snapshot(self.volume / Path("System"))
+        results = self.patch()
+        self.assertTrue(all(result["Success"] for result in results), results)
+        self.assertFalse((self.volume / Path("System/Library/Extensions/AMDRadeonX4000.kext")).exists())
+        self.assertEqual((self.volume / Path("System/Library/Extensions/IOSurface.kext/Contents/Info.plist")).read_bytes(), b"Patched IOSurface")
+
+        # Patching again must keep the true originals, not the patched files
+        self.write("Payloads/IOSurface.kext/Contents/Info.plist", b"Patched IOSurface 2")
+        self.assertTrue(all(result["Success"] for result in self.patch()))
+        results = privileged_helper.run_operations([operation("rollback", self.journal)])
+        self.assertTrue(results[0]["Success"], results)
+        self.assertEqual(snapshot(self.volume / Path("System")), original)
+        self.assertFalse(self.journal.exists())
+
+    def test_journal_stores_contents_once(self):
+        self.write("Volume/System/Library/Extensions/AMDRadeonX4000.kext/Contents/Resources/Copy.plist", b"Stock AMDRadeonX4000")
+        self.patch()
+        objects = [path for path in (self.journal / Path("Objects")).rglob("*") if path.is_file()]
+        # Info.plist and Copy.plist share one object, alongside the binary, IOSurface and OpenGL
+        self.assertEqual(len(objects), 4)
+
+    def test_journal_generation(self):
+        self.assertIsNone(privileged_helper.journal_generation(str(self.journal)))
+        self.patch()
+        generation = privileged_helper.journal_generation(str(self.journal))
+        self.assertGreater(generation, 0)
+        # Nothing left to change, the volume still matches the last patch run
+        results = self.patch()
+        self.assertFalse(any(result["Changed"] for result in results), results)
+        self.assertEqual(privileged_helper.journal_generation(str(self.journal)), generation)
+
+
+class SyncTreeTest(HelperTest):
+    def setUp(self):
+        super().setUp()
+        self.source = self.root / Path("Payloads/IOSurface.kext")
+        self.destination = self.root / Path("Volume/IOSurface.kext")
+        self.write("Payloads/IOSurface.kext/Contents/Info.plist", b"Patched IOSurface")
+        self.write("Payloads/IOSurface.kext/Contents/MacOS/IOSurface", b"Patched", 0o755)
+        os.symlink("Contents/MacOS/IOSurface", self.source / Path("IOSurface"))
+        self.destination.parent.mkdir()
+
+    def sync(self, **arguments):
+        return privileged_helper.sync_tree(str(self.source), str(self.destination), 0o755, self.owner if os.getuid() == 0 else None, delete=True, **arguments)
+
+    def test_skips_unchanged_files(self):
+        self.assertTrue(self.sync())
+        binary = self.destination / Path("Contents/MacOS/IOSurface")
+        inode = binary.stat().st_ino
+        self.assertFalse(self.sync())
+        self.assertEqual(binary.stat().st_ino, inode)
+
+        # Same contents installed with a different time (ie. by 'cp -R') are compared by hash instead
+        os.utime(binary, ns=(0, 0))
+        self.assertFalse(self.sync())
+        self.assertEqual(binary.stat().st_ino, inode)
+
+    def test_writes_changed_entries(self):
+        self.sync()
+        self.write("Payloads/IOSurface.kext/Contents/Info.plist", b"Patched IOSurface 2")
+        self.assertTrue(self.sync())
+        self.assertEqual((self.destination / Path("Contents/Info.plist")).read_bytes(), b"Patched IOSurface 2")
+
+        os.chmod(self.destination / Path("Contents/Info.plist"), 0o600)
+        self.assertTrue(self.sync())
+        self.assertEqual(stat.S_IMODE((self.destination / Path("Contents/Info.plist")).stat().st_mode), 0o755)
+
+        # Entries missing from the payload are removed, the destination becomes an exact copy
+        self.write("Volume/IOSurface.kext/Contents/_CodeSignature/CodeResources", b"Stock")
+        self.assertTrue(self.sync())
+        self.assertFalse((self.destination / Path("Contents/_CodeSignature")).exists())
+        self.assertFalse(self.sync())
+
+    def test_skips_shadowed_files(self):
+        # Overlapping merges, the later one owns OpenGL and the earlier one never writes it
+        self.write("Payloads/Accel/OpenGL.framework/Versions/A/OpenGL", b"Accel OpenGL")
+        self.write("Payloads/Accel/OpenGL.framework/Versions/A/Resources/Info.plist", b"Accel")
+        self.write("Payloads/Ivy/OpenGL.framework/Versions/A/OpenGL", b"Ivy OpenGL")
+        frameworks = self.root / Path("Volume/Frameworks")
+        frameworks.mkdir()
+        operations = [
+            operation("merge", frameworks, Source=str(self.root / Path("Payloads/Accel")), Permissions={}),
+            operation("merge", frameworks, Source=str(self.root / Path("Payloads/Ivy")), Permissions={}),
+        ]
+        self.assertEqual(privileged_helper.shadowed_files(operations), {0: {str(frameworks / Path("OpenGL.framework/Versions/A/OpenGL"))}})
+        results = privileged_helper.run_operations(operations)
+        self.assertEqual((frameworks / Path("OpenGL.framework/Versions/A/OpenGL")).read_bytes(), b"Ivy OpenGL")
+        self.assertTrue(all(result["Changed"] for result in results))
+        results = privileged_helper.run_operations(operations)
+        self.assertFalse(any(result["Changed"] for result in results), results)
+
+    def test_queue_keeps_last_sync(self):
+        # TeraScale 2 kexts are synced over the General ones on dual GPU models
+        operations = privileged_helper.PrivilegedOperations(constants.Constants())
+        operations.remove(self.destination, missing_ok=True)
+        operations.sync(self.source, self.destination)
+        operations.copy(self.source, self.root)
+        operations.sync(self.root / Path("Payloads/TS2/IOSurface.kext"), self.destination)
+        self.assertEqual([(queued["Operation"], queued.get("Source")) for queued in operations.operations], [("copy", str(self.source)), ("sync", str(self.root / Path("Payloads/TS2/IOSurface.kext")))])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,44 @@
+# Hardware probe cache round trips, using the example dumps
+
+import copy
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from resources import constants, device_probe, probe_cache
+from data import example_data
+
+
+class ProbeCacheTest(unittest.TestCase):
+    def setUp(self):
+        root = Path(tempfile.mkdtemp(prefix="OCLP-Test-"))
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        patcher = mock.patch.object(constants.Constants, "probe_cache_path", new=property(lambda self: root / Path("Probe-Cache.json")))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cache = probe_cache.ProbeCache(constants.Constants())
+        self.key = {"Version": probe_cache.PROBE_CACHE_VERSION, "Boot Session": "0"}
+
+    def test_round_trips_example_dumps(self):
+        for computer in [example_data.MacBookPro.MacBookPro92_Stock, example_data.iMac.iMac81_Stock, example_data.MacPro.MacPro31_Modern_AMD]:
+            with self.subTest(model=computer.real_model):
+                self.cache.store(self.key, computer)
+                # Example dumps leave country_code unset, which dataclass equality cannot compare
+                self.assertEqual(probe_cache.encode(self.cache.load(self.key)), probe_cache.encode(computer))
+
+    def test_round_trips_bytes(self):
+        # pci-aspm-default is stored as raw data on some controllers
+        computer = copy.deepcopy(example_data.MacBookPro.MacBookPro92_Stock)
+        computer.storage.append(device_probe.NVMeController(0x144D, 0xA804, 0x010802, aspm=b"\x02\x00\x00\x00"))
+        self.cache.store(self.key, computer)
+        self.assertEqual(self.cache.load(self.key).storage[-1].aspm, b"\x02\x00\x00\x00")
+
+    def test_rejects_other_keys(self):
+        self.cache.store(self.key, example_data.iMac.iMac81_Stock)
+        self.assertIsNone(self.cache.load({**self.key, "Boot Session": "1"}))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+# Import time budget of the headless build path (--build --model X)
+# Measured in a fresh interpreter against the source tree, already loaded modules would hide regressions
+
+import subprocess
+import sys
+import unittest
+from pathlib import Path
+
+# Modules that must stay out of the headless build path
+EXCLUDED_MODULES = [
+    "requests",
+    "objc",
+    "wx",
+    "resources.ioreg",
+    "resources.cli_menu",
+    "resources.sys_patch",
+    "resources.validation",
+]
+
+# Generous to absorb slow CI machines, currently takes ~0.08s
+BUDGET_SECONDS = 0.5
+
+# Best of several cold starts, a single run slowed down by a loaded machine is not a regression
+RUNS = 3
+
+
+def import_main():
+    # Returns the time spent importing our modules and every module imported along the way
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "from resources import main"], stderr=subprocess.PIPE, cwd=Path(__file__).parent.parent.resolve(), check=True
+    ).stderr.decode()
+    import_time = 0
+    modules = []
+    for line in output.splitlines()[1:]:
+        _, cumulative, module = line.split("|")
+        modules.append(module.strip())
+        # Top level imports have a single space before the name, nested ones are already counted in their parent
+        if not module[1:].startswith(" ") and module.strip().split(".")[0] in ["resources", "data"]:
+            import_time += int(cumulative) / 1000000
+    return import_time, modules
+
+
+class StartupTest(unittest.TestCase):
+    def test_excluded_modules(self):
+        _, modules = import_main()
+        self.assertEqual([module for module in EXCLUDED_MODULES if module in modules], [])
+
+    def test_import_budget(self):
+        import_time = min(import_main()[0] for _ in range(RUNS))
+        self.assertLess(import_time, BUDGET_SECONDS, f"Headless startup imports took {import_time:.3f}s")
+
+
+if __name__ == "__main__":
+    unittest.main()